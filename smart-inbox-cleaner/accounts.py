@@ -0,0 +1,175 @@
+"""
+Multiple Gmail accounts, each with its own credentials, connection pool and caches
+"""
+import asyncio
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple, AsyncIterator
+
+from imapclient import IMAPClient
+
+from auth import TOKEN_PATH, stop_token_refresher
+from email_client import connect_oauth, connect_oauth_account
+from connection_pool import IMAPConnectionPool, DEFAULT_POOL_SIZE
+from parallel_fetcher import fetch_envelope_ranges, parallel_fetch_enabled_by_env, get_max_connections
+from folder_registry import FolderRegistry
+from async_imap import AsyncIMAPClient, iterate_blocking
+from email_fetcher import SEARCH_MODE_ALL, FETCH_PROFILE_ENVELOPE
+from mail_cache import EnvelopeCache, envelope_cache_path, SnippetCache, snippet_cache_path, move_journal_path
+from move_journal import MoveJournal
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ProgressFunc = Callable[[int, int], None]
+CategorizeFunc = Callable[[List[Dict[str, Any]], Optional[ProgressFunc]], Optional[List[Dict[str, Any]]]]
+
+class MailAccount:
+    """One signed-in mailbox: its token, connection pool (and AsyncIMAPClient over it), folder list, move journal and sync caches."""
+
+    def __init__(self, email: str, token_path: str, pool: IMAPConnectionPool):
+        self.email = email
+        self.token_path = token_path
+        self.pool = pool
+        self.envelope_cache = EnvelopeCache(envelope_cache_path(email))
+        self.snippet_cache = SnippetCache(snippet_cache_path(email))
+        self.folders = FolderRegistry()
+        self.imap = AsyncIMAPClient(pool, folders=self.folders)
+        self.move_journal = MoveJournal(move_journal_path(email))
+
+    @classmethod
+    def connect(cls, token_path: str = TOKEN_PATH) -> Tuple[Optional["MailAccount"], str]:
+        """Logs in with the token at `token_path` and seeds a pool with that connection.
+
+        Returns:
+            (account, status message), or (None, error message) if the login failed.
+        """
+        client, email, status = connect_oauth_account(token_path)
+        if not client:
+            return None, status
+        # With parallel fetch on, the fetch's extra range connections come on top of the usual
+        # fetch, move and IDLE ones
+        max_size = DEFAULT_POOL_SIZE
+        if parallel_fetch_enabled_by_env():
+            max_size += get_max_connections() - 1
+        # Pool reconnects run on background threads, so they never open the browser sign-in
+        pool = IMAPConnectionPool(partial(connect_oauth, token_path, interactive=False),
+                                  max_size=max_size, initial=client)
+        return cls(email, token_path, pool), status
+
+    def close(self) -> None:
+        """Logs out every pooled connection and stops the account's token refresher."""
+        self.imap.close()
+        self.pool.close()
+        stop_token_refresher(self.token_path)
+
+def tag_account(emails: List[Dict[str, Any]], account: str) -> List[Dict[str, Any]]:
+    """Adds an 'account' key to each email; UIDs are only unique within one account's folder."""
+    for email_data in emails:
+        email_data['account'] = account
+    return emails
+
+async def _stream_account(account: MailAccount, folders: List[str], batch_size: int, search_mode: str,
+                          profile: str, parallel: bool) -> AsyncIterator[List[Dict[str, Any]]]:
+    def fetch_ranges(server: IMAPClient, folder: str, uids: List[int], profile: str) -> List[Dict[str, Any]]:
+        # The borrowed connection fetches the first UID range, other pooled ones the rest
+        return fetch_envelope_ranges(account.pool, uids, folder, profile=profile, server=server)
+
+    fetcher = fetch_ranges if parallel else None
+    async for batch in account.imap.stream_folders(account.envelope_cache, folders, batch_size,
+                                                   search_mode=search_mode, profile=profile, fetcher=fetcher):
+        yield tag_account(batch, account.email)
+
+async def stream_accounts(accounts: List[MailAccount], folders: List[str], batch_size: int = 250,
+                          search_mode: str = SEARCH_MODE_ALL,
+                          profile: str = FETCH_PROFILE_ENVELOPE,
+                          parallel: Optional[bool] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Scans `folders` in every account concurrently, yielding batches of emails as they arrive.
+
+    Each account streams through its own AsyncIMAPClient, pool and envelope cache, and its
+    emails are tagged with 'account'. Batches of different accounts interleave in arrival
+    order. An account that fails is logged and contributes no further batches rather than
+    ending the stream. `parallel` splits large fetches into UID ranges over several pooled
+    connections (parallel_fetcher); None defers to the IMAP_PARALLEL_FETCH environment variable.
+    """
+    if not accounts:
+        return
+    if parallel is None:
+        parallel = parallel_fetch_enabled_by_env()
+    arrived: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue()
+
+    async def scan(account: MailAccount) -> None:
+        try:
+            async for batch in _stream_account(account, folders, batch_size, search_mode, profile, parallel):
+                await arrived.put(batch)
+        except Exception as e:
+            logging.error(f"Error fetching emails for {account.email}: {e}", exc_info=True)
+        finally:
+            arrived.put_nowait(None) # This account is done
+
+    tasks = [asyncio.create_task(scan(account)) for account in accounts]
+    try:
+        scanning = len(tasks)
+        while scanning:
+            batch = await arrived.get()
+            if batch is None:
+                scanning -= 1
+            elif batch:
+                yield batch
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def fetch_accounts(accounts: List[MailAccount], folders: List[str], batch_size: int = 250,
+                   search_mode: str = SEARCH_MODE_ALL,
+                   profile: str = FETCH_PROFILE_ENVELOPE,
+                   parallel: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """Blocking counterpart of stream_accounts, returning every batch in one list."""
+    emails = [email_data for batch in iterate_blocking(stream_accounts(accounts, folders, batch_size, search_mode,
+                                                                       profile, parallel))
+              for email_data in batch]
+    logging.info(f"Fetched {len(emails)} emails across {len(accounts)} account(s).")
+    return emails
+
+def categorize_accounts(emails: List[Dict[str, Any]], categorize: CategorizeFunc,
+                        progress_callback: Optional[ProgressFunc] = None,
+                        initializer: Optional[Callable[[], None]] = None) -> Optional[List[Dict[str, Any]]]:
+    """Runs `categorize` concurrently on each account's share of `emails`.
+
+    Args:
+        emails: Emails tagged with 'account' (untagged ones form one group).
+        categorize: Called as categorize(group, progress_callback), e.g. wrapping
+            llm_categorizer.categorize_emails_llm.
+        progress_callback: Receives (done, total) summed over all accounts.
+        initializer: Optional per-worker-thread setup (e.g. attaching a UI context).
+
+    Returns:
+        The categorized emails of all groups, or None if any group returned None (stopped or failed).
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for email_data in emails:
+        groups.setdefault(email_data.get('account', ''), []).append(email_data)
+    if len(groups) <= 1:
+        return categorize(emails, progress_callback)
+
+    progress: Dict[str, Tuple[int, int]] = {account: (0, len(group)) for account, group in groups.items()}
+    progress_lock = threading.Lock()
+
+    def run_group(account: str) -> Optional[List[Dict[str, Any]]]:
+        def report(current: int, total: int) -> None:
+            with progress_lock:
+                progress[account] = (current, total)
+                done = sum(p[0] for p in progress.values())
+                overall = sum(p[1] for p in progress.values())
+                if progress_callback:
+                    progress_callback(done, overall)
+        return categorize(groups[account], report)
+
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="account-categorize",
+                            initializer=initializer) as executor:
+        results = list(executor.map(run_group, groups))
+    if any(result is None for result in results):
+        return None
+    return [email_data for result in results for email_data in result]
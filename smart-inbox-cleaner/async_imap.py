@@ -0,0 +1,159 @@
+"""
+Asyncio interface to the fetch/move pipeline, running imapclient calls on pooled connections
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional, Callable, TypeVar, Iterator, AsyncIterator
+
+from imapclient import IMAPClient
+
+from connection_pool import IMAPConnectionPool
+from mail_cache import EnvelopeCache
+from email_fetcher import (
+    fetch_envelopes, search_latest_uids, scan_folders, EnvelopeFetcher, DEFAULT_CHUNK_SIZE,
+    SEARCH_MODE_ALL, FETCH_PROFILE_ENVELOPE
+)
+from email_mover import move_emails
+from folder_registry import FolderRegistry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+T = TypeVar('T')
+_EXHAUSTED = object()
+
+class AsyncIMAPClient:
+    """Awaitable fetch, search, move and create-folder operations over an IMAPConnectionPool.
+
+    Each operation borrows a pooled connection on a worker thread, so the event loop never
+    blocks on the network and up to `pool.max_size` commands are in flight at once. Large
+    fetches are split into chunks that run on separate connections concurrently. Pass the
+    account's FolderRegistry as `folders` to share its cached folder list.
+    """
+
+    def __init__(self, pool: IMAPConnectionPool, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 folders: Optional[FolderRegistry] = None):
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.folders = folders or FolderRegistry()
+        self._executor = ThreadPoolExecutor(max_workers=pool.max_size, thread_name_prefix="imap-async")
+
+    async def __aenter__(self) -> "AsyncIMAPClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the worker threads; the pool itself stays open."""
+        self._executor.shutdown(wait=False)
+
+    async def run(self, func: Callable[[IMAPClient], T]) -> T:
+        """Runs func(server) on a borrowed connection without blocking the event loop."""
+        def borrow_and_call() -> T:
+            with self.pool.connection() as server:
+                return func(server)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, borrow_and_call)
+
+    async def stream(self, items: Iterator[T]) -> AsyncIterator[T]:
+        """Yields the items of a blocking iterator, each one produced on a worker thread.
+
+        Meant for the sync pipeline's generators (e.g. scan_folders over a borrowed
+        connection). If iteration stops early (or the task is cancelled), the item in flight
+        is awaited and the iterator closed, which returns its connection to the pool.
+        """
+        pending: Optional[Future] = None
+        try:
+            while True:
+                pending = self._executor.submit(next, items, _EXHAUSTED)
+                item = await asyncio.wrap_future(pending)
+                if item is _EXHAUSTED:
+                    return
+                yield item
+        finally:
+            if pending is not None and not pending.done():
+                # A generator cannot be closed while it is running on the worker thread
+                await asyncio.gather(asyncio.wrap_future(pending), return_exceptions=True)
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+
+    async def search(self, criteria: List[Any], folder: str = 'INBOX') -> List[int]:
+        """UID SEARCH in `folder` (selected read-only)."""
+        def search_folder(server: IMAPClient) -> List[int]:
+            server.select_folder(folder, readonly=True)
+            return server.search(criteria)
+        return await self.run(search_folder)
+
+    async def search_latest(self, batch_size: int, folder: str = 'INBOX',
+                            search_mode: str = SEARCH_MODE_ALL) -> List[int]:
+        """Latest `batch_size` UIDs of `folder`, as email_fetcher.search_latest_uids."""
+        def search_folder(server: IMAPClient) -> List[int]:
+            status = server.select_folder(folder, readonly=True)
+            return search_latest_uids(server, batch_size, search_mode, status.get(b'EXISTS'))
+        return await self.run(search_folder)
+
+    async def fetch_envelopes(self, uids: List[int], folder: str = 'INBOX',
+                              profile: str = FETCH_PROFILE_ENVELOPE) -> List[Dict[str, Any]]:
+        """Fetches envelopes in chunks concurrently across pooled connections.
+
+        Returns:
+            Parsed email dicts in ascending UID order.
+        """
+        uids = sorted(uids)
+        chunks = [uids[i:i + self.chunk_size] for i in range(0, len(uids), self.chunk_size)]
+
+        def fetch_chunk(chunk: List[int]) -> Callable[[IMAPClient], List[Dict[str, Any]]]:
+            def fetch(server: IMAPClient) -> List[Dict[str, Any]]:
+                server.select_folder(folder, readonly=True)
+                return fetch_envelopes(server, chunk, profile)
+            return fetch
+
+        results = await asyncio.gather(*(self.run(fetch_chunk(chunk)) for chunk in chunks))
+        return [email_data for batch in results for email_data in batch]
+
+    async def fetch_latest(self, batch_size: int = 250, folder: str = 'INBOX',
+                           search_mode: str = SEARCH_MODE_ALL,
+                           profile: str = FETCH_PROFILE_ENVELOPE) -> List[Dict[str, Any]]:
+        """Async counterpart of email_fetcher.fetch_inbox_emails."""
+        uids = await self.search_latest(batch_size, folder, search_mode)
+        return await self.fetch_envelopes(uids, folder, profile)
+
+    def stream_folders(self, cache: EnvelopeCache, folders: List[str], batch_size: int = 250,
+                       search_mode: str = SEARCH_MODE_ALL,
+                       profile: str = FETCH_PROFILE_ENVELOPE,
+                       fetcher: Optional[EnvelopeFetcher] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Async counterpart of email_fetcher.scan_folders, on one borrowed connection."""
+        def scan() -> Iterator[List[Dict[str, Any]]]:
+            with self.pool.connection() as server:
+                yield from scan_folders(server, cache, folders, batch_size, search_mode=search_mode,
+                                        profile=profile, fetcher=fetcher)
+        return self.stream(scan())
+
+    async def move(self, uids: List[int], category_map: Dict[int, str],
+                   source_folder: str = 'INBOX') -> Optional[List[int]]:
+        """Async counterpart of email_mover.move_emails (same return contract)."""
+        return await self.run(lambda server: move_emails(server, uids, category_map, source_folder, self.folders))
+
+    async def create_folder(self, folder: str) -> bool:
+        """Creates `folder` unless it exists. Returns True if it was created."""
+        def create(server: IMAPClient) -> bool:
+            if self.folders.exists(server, folder):
+                return False
+            if folder not in self.folders.ensure(server, [folder]):
+                raise RuntimeError(f"Could not create folder {folder}")
+            return True
+        return await self.run(create)
+
+def iterate_blocking(stream: AsyncIterator[T]) -> Iterator[T]:
+    """Iterates an async generator from synchronous code, on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(stream.aclose())
+        loop.close()
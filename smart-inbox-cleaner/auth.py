@@ -1,13 +1,18 @@
 import os
 import json
+import hashlib
 import logging
-from typing import Tuple, Optional, List
+import threading
+from datetime import datetime, timedelta
+import shutil
+from typing import Tuple, Optional, List, Dict
 import platform
 from pathlib import Path
 
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google.auth import jwt
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
@@ -36,26 +41,232 @@ SCOPES = [
 
 GMAIL_OAUTH_DIR = os.path.join(os.path.dirname(__file__), '.tokens')
 TOKEN_PATH = os.path.join(GMAIL_OAUTH_DIR, 'token.json')
+# Resolved account address, cached next to each token.json so reconnects skip the People API
+IDENTITY_FILE = 'identity.json'
+# Additional accounts, one <address>/token.json directory each
+ACCOUNTS_DIR = os.path.join(GMAIL_OAUTH_DIR, 'accounts')
+_PENDING_ACCOUNT_DIR = os.path.join(ACCOUNTS_DIR, '_pending')
 
-def get_credentials() -> Tuple[Optional[Credentials], Optional[str]]:
-    """Gets user credentials and email for Google API access."""
+# Refresh access tokens this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+# Retry delay after a failed background refresh
+TOKEN_REFRESH_RETRY_SECONDS = 60
+
+_refresher_lock = threading.Lock()
+_refreshers: Dict[str, "TokenRefresher"] = {} # Keyed by token path
+
+def _identity_path(token_path: str) -> str:
+    return os.path.join(os.path.dirname(token_path), IDENTITY_FILE)
+
+def account_token_path(user_email: str) -> str:
+    """Returns the token.json path for an additional account."""
+    safe_name = "".join(c if c.isalnum() or c in '.@_-' else '_' for c in user_email.lower())
+    return os.path.join(ACCOUNTS_DIR, safe_name, 'token.json')
+
+def _save_token(creds: Credentials, token_path: str = TOKEN_PATH) -> None:
+    """Writes token.json atomically, since the refresher thread may rewrite it while it is read."""
+    tmp_path = f"{token_path}.tmp"
+    with open(tmp_path, 'w') as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, token_path)
+
+def _token_fingerprint(creds: Credentials) -> Optional[str]:
+    """Identifies the grant behind the credentials without storing the refresh token itself."""
+    if not creds.refresh_token:
+        return None
+    return hashlib.sha256(creds.refresh_token.encode('utf-8')).hexdigest()[:16]
+
+def _read_identity(token_path: str) -> Dict[str, str]:
+    identity_path = _identity_path(token_path)
+    if not os.path.exists(identity_path):
+        return {}
+    with open(identity_path, 'r') as f:
+        return json.load(f)
+
+def _load_cached_email(creds: Credentials, token_path: str = TOKEN_PATH) -> Optional[str]:
+    """Returns the cached account address if it belongs to the current refresh token."""
+    try:
+        identity = _read_identity(token_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable identity cache: {e}")
+        return None
+    if identity.get('token_fingerprint') != _token_fingerprint(creds):
+        return None
+    return identity.get('email')
+
+def _save_cached_email(creds: Credentials, user_email: str, token_path: str = TOKEN_PATH) -> None:
+    try:
+        with open(_identity_path(token_path), 'w') as f:
+            json.dump({'email': user_email, 'token_fingerprint': _token_fingerprint(creds)}, f)
+    except OSError as e:
+        logging.warning(f"Could not write identity cache: {e}")
+
+def _email_from_id_token(creds: Credentials) -> Optional[str]:
+    """Reads the email claim from the id_token returned alongside a fresh access token.
+
+    The token comes straight from Google's token endpoint over TLS, so its signature is not
+    re-verified here. Credentials loaded from token.json carry no id_token.
+    """
+    id_token = getattr(creds, 'id_token', None)
+    if not id_token:
+        return None
+    try:
+        claims = jwt.decode(id_token, verify=False)
+    except Exception as e:
+        logging.warning(f"Could not decode id_token: {e}")
+        return None
+    if claims.get('email') and claims.get('email_verified', True):
+        return claims['email']
+    return None
+
+def _email_from_people_api(creds: Credentials) -> Optional[str]:
+    """Looks up the primary address via the People API (slow: discovery plus one request)."""
+    user_email = None
+    try:
+        service = build('people', 'v1', credentials=creds)
+        profile = service.people().get(
+            resourceName='people/me',
+            personFields='emailAddresses'
+        ).execute()
+        
+        emails = profile.get('emailAddresses', [])
+        for email in emails:
+            if email.get('metadata', {}).get('primary'):
+                user_email = email.get('value')
+                break
+        if not user_email and emails:
+            user_email = emails[0].get('value')
+    except Exception as e:
+        logging.error(f"Error fetching user email: {e}")
+    return user_email
+
+class TokenRefresher(threading.Thread):
+    """Refreshes the access token shortly before it expires and rewrites token.json.
+
+    Keeps the stored token valid so get_credentials (and every IMAP reconnect) can use it
+    without a refresh round trip.
+    """
+
+    def __init__(self, creds: Credentials, token_path: str = TOKEN_PATH):
+        super().__init__(name="oauth-token-refresher", daemon=True)
+        self.creds = creds
+        self.token_path = token_path
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _seconds_until_refresh(self) -> float:
+        if not self.creds.expiry:
+            return TOKEN_REFRESH_RETRY_SECONDS
+        # google-auth stores expiry as a naive UTC datetime
+        refresh_at = self.creds.expiry - TOKEN_REFRESH_MARGIN
+        return max(0.0, (refresh_at - datetime.utcnow()).total_seconds())
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self._seconds_until_refresh()):
+            try:
+                self.creds.refresh(Request())
+                _save_token(self.creds, self.token_path)
+                logging.info(f"Refreshed OAuth access token (expires {self.creds.expiry}).")
+            except Exception as e:
+                logging.warning(f"Background token refresh failed: {e}")
+                if self._stop_event.wait(TOKEN_REFRESH_RETRY_SECONDS):
+                    break
+
+def start_token_refresher(creds: Credentials, token_path: str = TOKEN_PATH) -> None:
+    """Starts the background refresher for `creds`, replacing one for an older grant."""
+    if not creds.refresh_token:
+        return
+    with _refresher_lock:
+        refresher = _refreshers.get(token_path)
+        if refresher is not None and refresher.is_alive():
+            if refresher.creds.refresh_token == creds.refresh_token:
+                return
+            refresher.stop()
+        refresher = TokenRefresher(creds, token_path)
+        refresher.start()
+        _refreshers[token_path] = refresher
+
+def stop_token_refresher(token_path: Optional[str] = None) -> None:
+    """Stops the background refresher for one token path (all of them if None), e.g. on logout."""
+    with _refresher_lock:
+        paths = [token_path] if token_path else list(_refreshers)
+        for path in paths:
+            refresher = _refreshers.pop(path, None)
+            if refresher is not None:
+                refresher.stop()
+
+def list_saved_accounts() -> Dict[str, str]:
+    """Returns {address: token path} for the additional accounts saved under ACCOUNTS_DIR."""
+    accounts: Dict[str, str] = {}
+    if not os.path.isdir(ACCOUNTS_DIR):
+        return accounts
+    for entry in sorted(os.listdir(ACCOUNTS_DIR)):
+        token_path = os.path.join(ACCOUNTS_DIR, entry, 'token.json')
+        if entry.startswith('_') or not os.path.exists(token_path):
+            continue
+        try:
+            user_email = _read_identity(token_path).get('email')
+        except (OSError, ValueError):
+            user_email = None
+        accounts[user_email or entry] = token_path
+    return accounts
+
+def add_account() -> Tuple[Optional[str], Optional[str]]:
+    """Runs the OAuth flow for another account and stores its token under ACCOUNTS_DIR.
+
+    Returns:
+        (address, token path), or (None, None) if the flow failed.
+    """
+    pending_path = os.path.join(_PENDING_ACCOUNT_DIR, 'token.json')
+    shutil.rmtree(_PENDING_ACCOUNT_DIR, ignore_errors=True)
+    creds, user_email = get_credentials(pending_path)
+    stop_token_refresher(pending_path)
+    if not creds or not user_email:
+        shutil.rmtree(_PENDING_ACCOUNT_DIR, ignore_errors=True)
+        return None, None
+
+    token_path = account_token_path(user_email)
+    account_dir = os.path.dirname(token_path)
+    stop_token_refresher(token_path)
+    shutil.rmtree(account_dir, ignore_errors=True) # Re-adding an account replaces its old token
+    os.replace(_PENDING_ACCOUNT_DIR, account_dir)
+    logging.info(f"Added account {user_email}.")
+    return user_email, token_path
+
+def get_credentials(token_path: str = TOKEN_PATH,
+                    interactive: bool = True) -> Tuple[Optional[Credentials], Optional[str]]:
+    """Gets user credentials and email for Google API access.
+
+    The email is taken from the identity cache, then the id_token claims, and only then
+    from the People API; whatever resolves it is written back to the cache. Valid
+    credentials also start the background TokenRefresher.
+
+    Args:
+        token_path: token.json of the account; TOKEN_PATH for the primary account,
+            account_token_path() for additional ones.
+        interactive: Whether to open the browser sign-in when the stored token is missing
+            or cannot be refreshed. Background reconnects pass False and fail instead.
+    """
     creds = None
+    token_dir = os.path.dirname(token_path)
 
     # Ensure token directory exists
     try:
-        os.makedirs(GMAIL_OAUTH_DIR, exist_ok=True)
+        os.makedirs(token_dir, exist_ok=True)
     except OSError as e:
-        logging.error(f"Error creating directory {GMAIL_OAUTH_DIR}: {e}")
+        logging.error(f"Error creating directory {token_dir}: {e}")
         return None, None
 
     # Load token if it exists
-    if os.path.exists(TOKEN_PATH):
+    if os.path.exists(token_path):
         try:
-            creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
         except Exception as e:
             logging.error(f"Error loading token: {e}")
-            if os.path.exists(TOKEN_PATH):
-                os.remove(TOKEN_PATH)
+            if os.path.exists(token_path):
+                os.remove(token_path)
             creds = None
 
     # If no valid credentials, attempt refresh or run full flow
@@ -63,21 +274,22 @@ def get_credentials() -> Tuple[Optional[Credentials], Optional[str]]:
         if creds and creds.expired and creds.refresh_token:
             try:
                 creds.refresh(Request())
-                with open(TOKEN_PATH, 'w') as token:
-                    token.write(creds.to_json())
+                _save_token(creds, token_path)
             except Exception as e:
                 logging.error(f"Error refreshing token: {e}")
                 creds = None
 
         # Run full auth flow if still no valid creds
+        if (not creds or not creds.valid) and not interactive:
+            logging.error(f"No valid stored credentials in {token_path}; sign-in required.")
+            return None, None
         if not creds or not creds.valid:
             try:
                 flow = InstalledAppFlow.from_client_config(CLIENT_CONFIG, SCOPES)
                 creds = flow.run_local_server(port=0)
                 
                 # Save the credentials
-                with open(TOKEN_PATH, 'w') as token:
-                    token.write(creds.to_json())
+                _save_token(creds, token_path)
             except Exception as e:
                 logging.error(f"Error during OAuth flow: {e}")
                 return None, None
@@ -85,21 +297,11 @@ def get_credentials() -> Tuple[Optional[Credentials], Optional[str]]:
     # Get user email
     user_email = None
     if creds and creds.valid:
-        try:
-            service = build('people', 'v1', credentials=creds)
-            profile = service.people().get(
-                resourceName='people/me',
-                personFields='emailAddresses'
-            ).execute()
-            
-            emails = profile.get('emailAddresses', [])
-            for email in emails:
-                if email.get('metadata', {}).get('primary'):
-                    user_email = email.get('value')
-                    break
-            if not user_email and emails:
-                user_email = emails[0].get('value')
-        except Exception as e:
-            logging.error(f"Error fetching user email: {e}")
+        user_email = _load_cached_email(creds, token_path)
+        if not user_email:
+            user_email = _email_from_id_token(creds) or _email_from_people_api(creds)
+            if user_email:
+                _save_cached_email(creds, user_email, token_path)
+        start_token_refresher(creds, token_path)
     
     return creds, user_email
\ No newline at end of file
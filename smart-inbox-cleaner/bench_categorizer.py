@@ -0,0 +1,211 @@
+"""
+Benchmark of the rule-based categorizer against the original keyword-list implementation
+
+Usage: python bench_categorizer.py [--messages 100000] [--seed 0] [--fuzz 20000] [--frame-rows 1000000]
+
+Categorizes a synthetic mailbox (plus fuzzed subjects mixing rule keywords) with the
+baseline categorize_email logic, the shipped rules and the vectorized
+categorize_dataframe, checks that every label is identical, and prints the timings. The
+baseline only saw 'from', so that comparison runs on envelopes without 'address'. With
+'address', categorize_email and categorize_dataframe are checked against each other, and
+INTENDED_CHANGES lists the labels the sender address rules deliberately changed, with the
+baseline and new label each must give. --frame-rows also times categorize_dataframe on
+the same emails repeated up to that many rows.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from categorizer import (
+    categorize_email, categorize_dataframe, CAT_ACTION, CAT_READ, CAT_EVENTS, CAT_INFO, CAT_UNCATEGORISED,
+    NON_INVITE_KEYWORDS, INVITE_KEYWORDS, INVITE_SENDERS, INVITE_DOMAINS, BULK_PRECEDENCE_VALUES,
+    ACTION_KEYWORDS, READ_KEYWORDS, READ_SENDERS, READ_DOMAINS,
+)
+from header_decoder import decode_header_value
+from synthetic_mailbox import SyntheticMailbox
+
+# --- Original implementation (reference for identical output) ---
+
+# Sender substrings of the baseline, matched against 'from' only
+LEGACY_INVITE_SENDERS = ['calendar-notification@google.com', '@calendly.com', '@savvycal.com']
+LEGACY_READ_SENDERS = ['@substack.com', 'updates@', '@medium.com', 'digest@']
+
+def _legacy_is_new_invite(subject: str, sender: str) -> bool:
+    if any(keyword in subject for keyword in NON_INVITE_KEYWORDS):
+        return False
+    return any(keyword in subject for keyword in INVITE_KEYWORDS) or \
+           any(sender_part in sender for sender_part in LEGACY_INVITE_SENDERS)
+
+def _legacy_categorize_by_headers(email_data: Dict[str, Any]) -> Optional[str]:
+    headers = email_data.get('headers') or {}
+    if not headers:
+        return None
+    if _legacy_is_new_invite(email_data.get('subject', '').lower(), email_data.get('from', '').lower()):
+        return None
+    auto_submitted = headers.get('auto-submitted', '').lower()
+    if auto_submitted and not auto_submitted.startswith('no'):
+        return CAT_INFO
+    precedence = headers.get('precedence', '').lower()
+    if headers.get('list-id') or headers.get('list-unsubscribe') or precedence in BULK_PRECEDENCE_VALUES:
+        return CAT_READ
+    return None
+
+def legacy_categorize_email(email_data: Dict[str, Any]) -> str:
+    """categorizer.categorize_email as it was before the compiled keyword matcher."""
+    subject = email_data.get('subject', '').lower()
+    sender = email_data.get('from', '').lower()
+    if _legacy_is_new_invite(subject, sender):
+        return CAT_EVENTS
+    header_category = _legacy_categorize_by_headers(email_data)
+    if header_category:
+        return header_category
+    if any(keyword in subject for keyword in ACTION_KEYWORDS):
+        if not any(keyword in subject for keyword in NON_INVITE_KEYWORDS):
+            return CAT_ACTION
+    if any(keyword in subject for keyword in READ_KEYWORDS) or \
+       any(sender_part in sender for sender_part in LEGACY_READ_SENDERS):
+        return CAT_READ
+    return CAT_UNCATEGORISED
+
+# --- Intended label changes ---
+
+# (email, baseline label, label with the sender address rules, why it changed)
+INTENDED_CHANGES: List[tuple] = [
+    ({'subject': 'Hello', 'from': 'Weekly Reads', 'address': 'team@substack.com'},
+     CAT_UNCATEGORISED, CAT_READ, "sender_domain matches the address behind a display name"),
+    ({'subject': 'Hello', 'from': 'Acme Scheduling', 'address': 'bot@calendly.com'},
+     CAT_UNCATEGORISED, CAT_EVENTS, "invite domain matches the address behind a display name"),
+    ({'subject': 'Hello', 'from': 'Product News', 'address': 'updates@acme.example'},
+     CAT_UNCATEGORISED, CAT_READ, "sender_contains also sees the address"),
+    ({'subject': 'Hello', 'from': 'writer@mail.substack.com'},
+     CAT_UNCATEGORISED, CAT_READ, "sender_domain matches subdomains"),
+    ({'subject': 'Hello', 'from': 'writer@substack.com.example'},
+     CAT_READ, CAT_UNCATEGORISED, "sender_domain is a domain match, not a substring"),
+    ({'subject': 'Hello', 'from': 'Acme Scheduling', 'address': 'bot@calendly.com',
+      'headers': {'list-id': '<bookings.calendly.com>'}},
+     CAT_READ, CAT_EVENTS, "invite rule outranks header rules once the domain matches"),
+]
+
+# --- Inputs ---
+
+def synthetic_emails(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Email dicts shaped like email_fetcher.parse_envelope output (with headers half the time)."""
+    mailbox = SyntheticMailbox(count, seed=seed)
+    emails = []
+    for msg_id in range(1, count + 1):
+        message = mailbox.message(msg_id)
+        email_data = {
+            'uid': msg_id,
+            'subject': decode_header_value(message.subject),
+            # parse_envelope uses the display name when there is one
+            'from': message.from_name if msg_id % 2 else message.from_addr,
+            'address': message.from_addr,
+        }
+        if msg_id % 4 == 0:
+            email_data['headers'] = {name.lower(): value for name, value in message.headers.items()}
+        emails.append(email_data)
+    return emails
+
+def fuzzed_emails(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Subjects and senders built from overlapping rule keywords, to exercise rule precedence."""
+    rng = random.Random(seed)
+    subject_words = NON_INVITE_KEYWORDS + INVITE_KEYWORDS + ACTION_KEYWORDS + READ_KEYWORDS + ['Re:', 'hello', 'Q3']
+    senders = LEGACY_INVITE_SENDERS + LEGACY_READ_SENDERS + ['alice@example.com', 'Bob', 'news@updates.example']
+    addresses = INVITE_SENDERS + READ_SENDERS + [f"{user}@{domain}" for user in ('team', 'noreply')
+                           for domain in INVITE_DOMAINS + READ_DOMAINS + ['mail.' + READ_DOMAINS[0], 'example.com']]
+    headers = [None, {'list-id': '<x.list>'}, {'auto-submitted': 'auto-replied'}, {'auto-submitted': 'no'},
+               {'precedence': 'Bulk'}]
+    emails = []
+    for uid in range(count):
+        words = rng.sample(subject_words, k=rng.randint(0, 4))
+        subject = (''.join if rng.random() < 0.2 else ' '.join)(words)
+        email_data = {'uid': uid, 'subject': subject.upper() if rng.random() < 0.1 else subject,
+                      'from': rng.choice(senders)}
+        if rng.random() < 0.8:
+            email_data['address'] = rng.choice(addresses)
+        header = rng.choice(headers)
+        if header:
+            email_data['headers'] = header
+        emails.append(email_data)
+    return emails
+
+def time_categorizer(categorize, emails: List[Dict[str, Any]]) -> tuple:
+    start = time.perf_counter()
+    labels = [categorize(email_data) for email_data in emails]
+    return labels, time.perf_counter() - start
+
+def without_address(email_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The email as the baseline fetched it (parse_envelope had no 'address')."""
+    return {key: value for key, value in email_data.items() if key != 'address'}
+
+def check_intended_changes() -> int:
+    """Prints and counts INTENDED_CHANGES entries whose labels differ from the expected ones."""
+    frame_labels = categorize_dataframe(pd.DataFrame([email for email, *_ in INTENDED_CHANGES]))['category']
+    failures = 0
+    for (email_data, old, new, reason), vectorized in zip(INTENDED_CHANGES, frame_labels):
+        got = (legacy_categorize_email(email_data), categorize_email(email_data), vectorized)
+        if got != (old, new, new):
+            failures += 1
+            print(f"UNEXPECTED {email_data!r} ({reason}): expected legacy {old}, new {new}; "
+                  f"got legacy {got[0]}, compiled {got[1]}, dataframe {got[2]}")
+    print(f"{len(INTENDED_CHANGES)} intended label changes, {failures} unexpected")
+    return failures
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100_000, help="Synthetic emails to categorize")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fuzz', type=int, default=20_000, help="Extra emails with fuzzed keyword subjects")
+    parser.add_argument('--frame-rows', type=int, default=0, help="Also time categorize_dataframe on this many rows")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    emails = synthetic_emails(args.messages, args.seed) + fuzzed_emails(args.fuzz, args.seed)
+
+    # Baseline logic vs the shipped rules, on envelopes as the baseline fetched them
+    baseline_emails = [without_address(email_data) for email_data in emails]
+    legacy_labels, legacy_seconds = time_categorizer(legacy_categorize_email, baseline_emails)
+    labels, seconds = time_categorizer(categorize_email, baseline_emails)
+    start = time.perf_counter()
+    frame_labels = categorize_dataframe(pd.DataFrame(baseline_emails))['category'].tolist()
+    frame_seconds = time.perf_counter() - start
+
+    mismatches = [(email_data, old, new, vectorized)
+                  for email_data, old, new, vectorized in zip(baseline_emails, legacy_labels, labels, frame_labels)
+                  if not old == new == vectorized]
+    for email_data, old, new, vectorized in mismatches[:10]:
+        print(f"MISMATCH {email_data!r}: legacy {old}, compiled {new}, dataframe {vectorized}")
+    print(f"{len(emails)} emails without address, {len(mismatches)} mismatches")
+    print(f"legacy keyword lists: {legacy_seconds:.3f}s ({len(emails) / legacy_seconds:,.0f} emails/s)")
+    print(f"compiled rules:       {seconds:.3f}s ({len(emails) / seconds:,.0f} emails/s), "
+          f"{legacy_seconds / seconds:.2f}x")
+    print(f"categorize_dataframe: {frame_seconds:.3f}s ({len(emails) / frame_seconds:,.0f} emails/s), "
+          f"{legacy_seconds / frame_seconds:.2f}x")
+
+    # With 'address' there is no baseline; the scalar and vectorized paths must agree
+    frame = pd.DataFrame(emails)
+    labels = [categorize_email(email_data) for email_data in emails]
+    frame_labels = categorize_dataframe(frame)['category'].tolist()
+    address_mismatches = [(email_data, new, vectorized)
+                          for email_data, new, vectorized in zip(emails, labels, frame_labels) if new != vectorized]
+    for email_data, new, vectorized in address_mismatches[:10]:
+        print(f"MISMATCH {email_data!r}: compiled {new}, dataframe {vectorized}")
+    print(f"{len(emails)} emails with address, {len(address_mismatches)} compiled/dataframe mismatches")
+
+    unexpected = check_intended_changes()
+
+    if args.frame_rows:
+        repeats = -(-args.frame_rows // len(emails))
+        big_frame = pd.concat([frame] * repeats, ignore_index=True).iloc[:args.frame_rows]
+        start = time.perf_counter()
+        categorize_dataframe(big_frame)
+        print(f"categorize_dataframe on {len(big_frame):,} rows: {time.perf_counter() - start:.3f}s")
+    return 1 if mismatches or address_mismatches or unexpected else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
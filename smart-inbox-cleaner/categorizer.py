@@ -1,5 +1,11 @@
+import os
 import logging # Add logging
-from typing import Dict, Any, List # Add typing
+import threading
+from typing import Dict, Any, List, Optional # Add typing
+
+import pandas as pd
+
+from rules_engine import RuleSet, RulesWatcher
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -15,52 +21,98 @@ RULE_CATEGORIES = [CAT_ACTION, CAT_READ, CAT_EVENTS, CAT_INFO]
 # Categories that are moved by default
 MOVE_CATEGORIES = [CAT_ACTION, CAT_READ, CAT_EVENTS]
 
+# Keywords indicating it's likely NOT a new invite to ignore
+NON_INVITE_KEYWORDS = ['accepted:', 'tentative:', 'declined:', 'canceled:', 'updated invitation', 'reminder:']
+# Keywords strongly suggesting a new invite
+INVITE_KEYWORDS = ['invitation', 'invite', 'calendar invite', 'please respond', 'rsvp', 'appointment request']
+# Senders often sending invites (substrings of the name or address) and their domains
+INVITE_SENDERS = ['calendar-notification@google.com']
+INVITE_DOMAINS = ['calendly.com', 'savvycal.com']
+
+# Keywords suggesting direct tasks (excluding event invites)
+ACTION_KEYWORDS = ['meeting', 'schedule', 'urgent', 'request', 'action required', 'task', 'confirm', 'follow up', 'respond', 'please']
+# Information: notifications, alerts, receipts (often no-reply) - DISABLED
+# INFO_KEYWORDS = ['notification', 'alert', 'confirmation', 'receipt', 'statement', 'security alert', 'delivery status', 'invoice']
+# INFO_SENDERS = ['no-reply', 'noreply', 'support@', 'billing@', 'notifications@', 'accounts@', '@service.', '@alert.', '@github.com', '@aws.']
+# Newsletters, updates, blogs, digests (often from specific platforms)
+READ_KEYWORDS = ['newsletter', 'update', 'digest', 'blog', 'weekly', 'daily', 'report', 'summary', 'announcement', 'issue #']
+READ_SENDERS = ['updates@', 'digest@']
+READ_DOMAINS = ['substack.com', 'medium.com']
+
+# Header values marking machine-generated or mailing-list mail (see email_fetcher.BULK_HEADER_FIELDS)
+BULK_PRECEDENCE_VALUES = ['bulk', 'list', 'junk']
+
+# --- Rule Definitions (priority order matters) ---
+# Edit rules.json to change them; it is recompiled while the app runs. These built-in
+# rules are used when the file is missing or invalid at startup.
+RULES_PATH = os.environ.get('RULES_PATH', os.path.join(os.path.dirname(__file__), 'rules.json'))
+DEFAULT_RULES: Dict[str, Any] = {
+    'default_category': CAT_UNCATEGORISED,
+    'rules': [
+        # 1. Events: new calendar invitations, not updates/responses to one
+        {'name': 'new-invite', 'category': CAT_EVENTS, 'priority': 10,
+         'when': {'subject_contains': INVITE_KEYWORDS, 'sender_contains': INVITE_SENDERS,
+                  'sender_domain': INVITE_DOMAINS},
+         'unless': {'subject_contains': NON_INVITE_KEYWORDS}},
+        # 1b. Bulk mail identified by headers (only when headers were fetched)
+        {'name': 'auto-submitted', 'category': CAT_INFO, 'priority': 20,
+         'when': {'header_present': ['auto-submitted']},
+         'unless': {'header_prefix': {'auto-submitted': ['no']}}},
+        {'name': 'mailing-list', 'category': CAT_READ, 'priority': 30,
+         'when': {'header_present': ['list-id', 'list-unsubscribe'],
+                  'header_in': {'precedence': BULK_PRECEDENCE_VALUES}}},
+        # 2. Action: direct tasks; simple event confirmations are not actions
+        {'name': 'action', 'category': CAT_ACTION, 'priority': 40,
+         'when': {'subject_contains': ACTION_KEYWORDS},
+         'unless': {'subject_contains': NON_INVITE_KEYWORDS}},
+        # 3. Information: notifications, alerts, receipts - DISABLED (see INFO_KEYWORDS)
+        # 4. Read: newsletters, updates, blogs, digests
+        {'name': 'newsletter', 'category': CAT_READ, 'priority': 50,
+         'when': {'subject_contains': READ_KEYWORDS, 'sender_contains': READ_SENDERS,
+                  'sender_domain': READ_DOMAINS}},
+    ],
+}
+
+_rules_watcher: Optional[RulesWatcher] = None
+_rules_watcher_lock = threading.Lock()
+
+def active_rules() -> RuleSet:
+    """The compiled rules currently in effect, starting the rules.json watcher on first use."""
+    global _rules_watcher
+    if _rules_watcher is None:
+        with _rules_watcher_lock:
+            if _rules_watcher is None:
+                watcher = RulesWatcher(RULES_PATH, DEFAULT_RULES, categories=RULE_CATEGORIES + [CAT_UNCATEGORISED])
+                watcher.start()
+                _rules_watcher = watcher
+    return _rules_watcher.rules
+
+def categorize_by_headers(email_data: Dict[str, Any]) -> Optional[str]:
+    """Categorizes bulk mail with the header rules (List-Id/List-Unsubscribe/Precedence/Auto-Submitted).
+
+    Only emails fetched with email_fetcher.FETCH_PROFILE_HEADERS carry a 'headers' dict.
+    Returns None when the headers are missing or inconclusive, and for emails an earlier
+    rule claims first, such as calendar invitations.
+    """
+    return active_rules().header_category(email_data)
+
 def categorize_email(email_data: Dict[str, Any]) -> str:
-    """Categorizes a single email based on simple rules, returning a category string."""
-    subject = email_data.get('subject', '').lower()
-    sender = email_data.get('from', '').lower()
-
-    # --- Rule Definitions (Order matters) ---
-
-    # 1. Events: Focus on new calendar invitations.
-    # Keywords indicating it's likely NOT a new invite to ignore
-    non_invite_keywords = ['accepted:', 'tentative:', 'declined:', 'canceled:', 'updated invitation', 'reminder:']
-    if any(keyword in subject for keyword in non_invite_keywords):
-        pass # Skip to the next rule if it's likely an update/response
-    else:
-        # Keywords strongly suggesting a new invite
-        invite_keywords = ['invitation', 'invite', 'calendar invite', 'please respond', 'rsvp', 'appointment request']
-        # Senders often sending invites
-        invite_senders = ['calendar-notification@google.com', '@calendly.com', '@savvycal.com']
-        # Check subject for invite keywords OR sender is a known invite source
-        if any(keyword in subject for keyword in invite_keywords) or \
-           any(sender_part in sender for sender_part in invite_senders):
-            return CAT_EVENTS
-
-    # 2. Action: Keywords suggesting direct tasks (excluding event invites handled above)
-    action_keywords = ['meeting', 'schedule', 'urgent', 'request', 'action required', 'task', 'confirm', 'follow up', 'respond', 'please']
-    # Avoid classifying simple event confirmations as actions if already caught
-    if any(keyword in subject for keyword in action_keywords):
-        # Check again to ensure it wasn't explicitly skipped by the non_invite_keywords
-        if not any(keyword in subject for keyword in non_invite_keywords):
-             return CAT_ACTION
-
-    # 3. Information: Notifications, alerts, receipts (often no-reply) - DISABLED
-    # info_keywords = ['notification', 'alert', 'confirmation', 'receipt', 'statement', 'security alert', 'delivery status', 'invoice']
-    # info_senders = ['no-reply', 'noreply', 'support@', 'billing@', 'notifications@', 'accounts@', '@service.', '@alert.', '@github.com', '@aws.']
-    # if any(keyword in subject for keyword in info_keywords) or \
-    #    any(sender_part in sender for sender_part in info_senders):
-    #     return "Information"
-
-    # 4. Read: Newsletters, updates, blogs, digests (often from specific platforms)
-    read_keywords = ['newsletter', 'update', 'digest', 'blog', 'weekly', 'daily', 'report', 'summary', 'announcement', 'issue #']
-    read_senders = ['@substack.com', 'updates@', '@medium.com', 'digest@']
-    if any(keyword in subject for keyword in read_keywords) or \
-       any(sender_part in sender for sender_part in read_senders):
-        return CAT_READ
-
-    # Default category
-    return CAT_UNCATEGORISED
+    """Categorizes a single email with the active rules (rules.json), returning a category string."""
+    return active_rules().categorize(email_data)
+
+def categorize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns a copy of `df` with its 'category' column set by the active rules.
+
+    Vectorized over the 'subject', 'from' and 'address' columns (see
+    RuleSet.categorize_frame), with the same labels categorize_email would give each row.
+    Header rules apply to rows with a 'headers' dict column.
+    """
+    logging.info(f"Starting vectorized categorization for {len(df)} emails.")
+    df = df.copy()
+    df['category'] = active_rules().categorize_frame(df)
+    categorized_count = int((df['category'] != CAT_UNCATEGORISED).sum())
+    logging.info(f"Finished categorization. {categorized_count} emails assigned a category other than '{CAT_UNCATEGORISED}'.")
+    return df
 
 def categorize_emails(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Adds a 'category' key to each email dictionary in a list."""
@@ -72,4 +124,4 @@ def categorize_emails(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         if category != CAT_UNCATEGORISED:
              categorized_count += 1
     logging.info(f"Finished categorization. {categorized_count} emails assigned a category other than '{CAT_UNCATEGORISED}'.")
-    return emails 
\ No newline at end of file
+    return emails
@@ -0,0 +1,192 @@
+"""
+Learned sender/thread -> category memory, built from manual overrides and accepted LLM results
+"""
+import re
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+
+import pandas as pd
+
+from mail_cache import load_json, save_json_atomic
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SOURCE_OVERRIDE = "override" # Category picked by hand in the table
+SOURCE_ACCEPTED = "accepted" # LLM category the user moved the email with, unchanged
+
+# Thread entries kept; the least recently updated are dropped beyond this
+MAX_THREAD_ENTRIES = 50_000
+
+_REPLY_PREFIX = re.compile(r'^\s*(?:(?:re|fw|fwd|aw|wg|sv|vs|antw)\s*(?:\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+_DIGITS = re.compile(r'\d+')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_subject(subject: Optional[str]) -> str:
+    """Subject reduced to what stays the same across a thread or a recurring mail.
+
+    Drops reply/forward prefixes, replaces numbers (dates, order and issue numbers) with
+    '#', collapses whitespace and lower-cases, so "Re: Invoice 1043" and "invoice 1077"
+    share a key.
+    """
+    subject = _REPLY_PREFIX.sub('', subject or '')
+    subject = _DIGITS.sub('#', subject)
+    return _WHITESPACE.sub(' ', subject).strip().lower()
+
+def normalize_sender(sender: Optional[str]) -> str:
+    return (sender or '').strip().lower()
+
+def sender_key(address: Optional[str], from_text: Optional[str] = None) -> str:
+    """The sender an email is remembered under: its bare address, normalized.
+
+    Display names are shared by unrelated senders ("Support", "Team"), so they are never
+    used. Emails cached before 'address' was fetched fall back to 'from' when that is the
+    bare address (parse_envelope uses it when there is no display name).
+    """
+    if not isinstance(address, str) or not address:
+        address = from_text if isinstance(from_text, str) and '@' in from_text else None
+    return normalize_sender(address)
+
+def _email_sender(email_data: Dict[str, Any]) -> str:
+    return sender_key(email_data.get('address'), email_data.get('from'))
+
+class CategoryMemory:
+    """Persistent (sender address, normalized subject) -> category index, checked before rules and the LLM.
+
+    Manual overrides always win and are never replaced by accepted LLM results. A sender
+    whose recorded categories all agree is also remembered as a whole, so new threads
+    from a repeat sender are classified without an LLM call; a sender with conflicting
+    categories is only matched thread by thread. Safe to share between threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = load_json(path)
+        self._data.setdefault('threads', {})
+        self._data.setdefault('senders', {})
+        self._dirty = False
+        self._drop_display_name_entries()
+
+    def _drop_display_name_entries(self) -> None:
+        """Forgets entries learned when senders were keyed by display name (no '@' in the key)."""
+        threads = {key: entry for key, entry in self._data['threads'].items() if '@' in key.split('\t', 1)[0]}
+        senders = {sender: entry for sender, entry in self._data['senders'].items() if '@' in sender}
+        if len(threads) < len(self._data['threads']) or len(senders) < len(self._data['senders']):
+            logging.info("Dropping category memory entries keyed by sender display name.")
+            self._data['threads'], self._data['senders'] = threads, senders
+            self._dirty = True
+
+    @staticmethod
+    def _thread_key(sender: str, subject: str) -> str:
+        return f"{sender}\t{subject}"
+
+    def lookup(self, email_data: Dict[str, Any]) -> Optional[str]:
+        """Remembered category for an email, or None if neither its thread nor its sender is known."""
+        with self._lock:
+            return self._lookup(_email_sender(email_data), normalize_subject(email_data.get('subject')))
+
+    def _lookup(self, sender: str, subject: str) -> Optional[str]:
+        # Caller holds the lock
+        if not sender:
+            return None
+        thread = self._data['threads'].get(self._thread_key(sender, subject))
+        if thread:
+            return thread['category']
+        sender_entry = self._data['senders'].get(sender)
+        if sender_entry and not sender_entry.get('mixed'):
+            return sender_entry['category']
+        return None
+
+    def apply(self, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Sets 'category' on every email the memory knows.
+
+        Returns:
+            The emails it did not know, still to be categorized by rules or the LLM.
+        """
+        unknown = []
+        with self._lock:
+            for email_data in emails:
+                category = self._lookup(_email_sender(email_data), normalize_subject(email_data.get('subject')))
+                if category:
+                    email_data['category'] = category
+                else:
+                    unknown.append(email_data)
+        if len(unknown) < len(emails):
+            logging.info(f"Category memory classified {len(emails) - len(unknown)} of {len(emails)} emails.")
+        return unknown
+
+    def lookup_frame(self, df: pd.DataFrame) -> pd.Series:
+        """Remembered categories for the 'address'/'from'/'subject' columns of a DataFrame (None where unknown)."""
+        if df.empty:
+            return pd.Series(None, index=df.index, dtype=object)
+        addresses = df['address'] if 'address' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        triples = pd.Series(list(zip(addresses, df['from'], df['subject'])), index=df.index)
+        codes, distinct = pd.factorize(triples)
+        with self._lock:
+            known = [self._lookup(sender_key(address, sender), normalize_subject(subject))
+                     for address, sender, subject in distinct]
+        return pd.Series(pd.Series(known, dtype=object).to_numpy()[codes], index=df.index, dtype=object)
+
+    def record(self, emails: Iterable[Dict[str, Any]], source: str) -> int:
+        """Learns the 'category' of each email. Returns how many entries changed."""
+        changed = 0
+        now = time.time()
+        with self._lock:
+            for email_data in emails:
+                category = email_data.get('category')
+                sender = _email_sender(email_data)
+                if not category or not sender:
+                    continue
+                key = self._thread_key(sender, normalize_subject(email_data.get('subject')))
+                thread = self._data['threads'].get(key)
+                if source == SOURCE_ACCEPTED and thread and thread['source'] == SOURCE_OVERRIDE:
+                    continue # A hand-picked category is never replaced by the LLM's
+                if not thread or thread['category'] != category or thread['source'] != source:
+                    changed += 1
+                self._data['threads'][key] = {'category': category, 'source': source, 'updated': now}
+                self._record_sender(sender, category, source)
+            if changed:
+                self._dirty = True
+                self._trim()
+        return changed
+
+    def _record_sender(self, sender: str, category: str, source: str) -> None:
+        # Caller holds the lock
+        entry = self._data['senders'].get(sender)
+        if entry is None or (source == SOURCE_OVERRIDE and entry['source'] != SOURCE_OVERRIDE):
+            self._data['senders'][sender] = {'category': category, 'source': source, 'mixed': False}
+        elif entry['category'] != category and (source == entry['source'] or source == SOURCE_OVERRIDE):
+            # The sender sends more than one kind of mail; only its threads are remembered
+            entry['mixed'] = True
+
+    def _trim(self) -> None:
+        # Caller holds the lock
+        threads = self._data['threads']
+        if len(threads) > MAX_THREAD_ENTRIES:
+            oldest = sorted(threads, key=lambda key: threads[key].get('updated', 0))
+            for key in oldest[:len(threads) - MAX_THREAD_ENTRIES]:
+                del threads[key]
+
+    def record_override(self, email_data: Dict[str, Any], category: str) -> None:
+        """Learns a category the user picked by hand for an email (needs its 'address' and 'subject')."""
+        self.record([{**email_data, 'category': category}], SOURCE_OVERRIDE)
+
+    def record_accepted(self, emails: Iterable[Dict[str, Any]]) -> int:
+        """Learns LLM categories the user accepted (e.g. by moving the emails with them)."""
+        return self.record(emails, SOURCE_ACCEPTED)
+
+    def __len__(self) -> int:
+        return len(self._data['threads'])
+
+    def save(self) -> None:
+        """Flushes the memory to disk if anything was learned since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                save_json_atomic(self.path, self._data)
+                self._dirty = False
+            except Exception as e:
+                logging.error(f"Error saving category memory to {self.path}: {e}")
@@ -0,0 +1,169 @@
+"""
+Pooled IMAP connections with NOOP keepalives, health checks and transparent reconnect
+"""
+import time
+import select
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterator, List, Optional, Tuple
+
+from imapclient import IMAPClient
+from imapclient.exceptions import IMAPClientAbortError
+
+from email_client import connect_oauth, ConnectFunc
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_POOL_SIZE = 3 # Fetch, move and IDLE can each hold one at the same time
+# Gmail drops connections idle for roughly 30 minutes; NOOP well before that
+KEEPALIVE_SECONDS = 4 * 60
+# Connections idle for longer than this are NOOP-checked before being handed out
+HEALTH_CHECK_AFTER_SECONDS = 30
+# Last-known-good time of a connection that must be NOOP-checked before its next use
+NEEDS_CHECK = float('-inf')
+# Errors that mean the connection itself is gone (as opposed to a failed command)
+CONNECTION_ERRORS = (IMAPClientAbortError, socket.error, EOFError)
+
+class IMAPConnectionPool:
+    """Hands out healthy IMAPClient connections, reconnecting with fresh credentials as needed.
+
+    Borrow with `with pool.connection() as server:`. At most `max_size` connections exist at
+    once; borrowers block until one is free. A connection that raises one of
+    CONNECTION_ERRORS is discarded rather than returned. One returned after any other
+    error, or whose socket shows the server hung up, is NOOP-checked before its next use,
+    since most callers log and swallow IMAP errors. Reconnects go through `connect`, which
+    refreshes an expired OAuth token but never starts an interactive sign-in (see
+    email_client.connect_oauth's `interactive`).
+    """
+
+    def __init__(self, connect: ConnectFunc = partial(connect_oauth, interactive=False),
+                 max_size: int = DEFAULT_POOL_SIZE,
+                 initial: Optional[IMAPClient] = None, keepalive_seconds: float = KEEPALIVE_SECONDS):
+        self.connect = connect
+        self.max_size = max_size
+        self.keepalive_seconds = keepalive_seconds
+        self._idle: List[Tuple[IMAPClient, float]] = [] # (connection, last known good)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        if initial is not None:
+            self._idle.append((initial, time.monotonic()))
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="imap-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[IMAPClient]:
+        """Borrows a healthy connection for the duration of the `with` block.
+
+        Raises:
+            TimeoutError: If no connection slot frees up within `timeout` seconds.
+            ConnectionError: If a new connection could not be established.
+        """
+        if self._closed.is_set():
+            raise ConnectionError("IMAP connection pool is closed.")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a free IMAP connection.")
+        server = None
+        failed = False
+        try:
+            server = self._checkout()
+            yield server
+        except CONNECTION_ERRORS:
+            logging.warning("IMAP connection failed while borrowed. Discarding it.")
+            self._discard(server)
+            server = None
+            raise
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if server is not None:
+                self._checkin(server, failed)
+            self._slots.release()
+
+    def close(self) -> None:
+        """Stops the keepalive thread and logs out every idle connection."""
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+    def _checkout(self) -> IMAPClient:
+        """Returns an idle connection that passes a health check, or a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            if time.monotonic() - last_used < HEALTH_CHECK_AFTER_SECONDS or self._is_healthy(server):
+                return server
+            logging.info("Pooled IMAP connection failed its health check. Reconnecting.")
+            self._discard(server)
+
+        server, status = self.connect()
+        if not server:
+            raise ConnectionError(f"Could not open IMAP connection: {status}")
+        logging.info(f"Opened pooled IMAP connection: {status}")
+        return server
+
+    def _checkin(self, server: IMAPClient, failed: bool = False) -> None:
+        if self._closed.is_set():
+            self._discard(server)
+            return
+        last_good = NEEDS_CHECK if failed or self._looks_dropped(server) else time.monotonic()
+        with self._lock:
+            self._idle.append((server, last_good))
+
+    @staticmethod
+    def _looks_dropped(server: IMAPClient) -> bool:
+        """True if the connection may have died during the borrow, judged without a round trip.
+
+        No command is in flight at check-in, so the server has nothing to send: a readable
+        socket means it closed the connection or sent an unsolicited BYE (or some other
+        untagged response the NOOP check will read).
+        """
+        try:
+            sock = server.socket()
+            if sock is None or sock.fileno() < 0:
+                return True
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable)
+        except Exception:
+            return True
+
+    @staticmethod
+    def _is_healthy(server: IMAPClient) -> bool:
+        try:
+            server.noop()
+            return True
+        except Exception as e:
+            logging.debug(f"IMAP NOOP failed: {e}")
+            return False
+
+    @staticmethod
+    def _discard(server: Optional[IMAPClient]) -> None:
+        if server is None:
+            return
+        try:
+            server.logout()
+        except Exception as e:
+            logging.debug(f"Error logging out discarded IMAP connection: {e}")
+
+    def _keepalive_loop(self) -> None:
+        """Periodically NOOPs idle connections so the server does not drop them."""
+        while not self._closed.wait(self.keepalive_seconds):
+            now = time.monotonic()
+            with self._lock:
+                stale = [entry for entry in self._idle if now - entry[1] >= self.keepalive_seconds]
+                self._idle = [entry for entry in self._idle if now - entry[1] < self.keepalive_seconds]
+            for server, _ in stale:
+                if self._is_healthy(server):
+                    with self._lock:
+                        self._idle.append((server, time.monotonic()))
+                else:
+                    logging.info("Dropping pooled IMAP connection that failed keepalive.")
+                    self._discard(server)
@@ -6,6 +6,9 @@ Constants used throughout the Smart Inbox Cleaner application
 CAT_METHOD_LLM = "LLM Categorization"
 CAT_METHOD_RULES = "Rule-Based Categorization"
 
+# Columns of the email table DataFrame; (account, folder, uid) identifies a message
+EMAIL_TABLE_COLUMNS = ['Select', 'date', 'from', 'subject', 'category', 'uid', 'folder', 'account']
+
 # Category constants (imported from categorizer.py)
 from categorizer import (
     CAT_ACTION,
@@ -15,4 +18,4 @@ from categorizer import (
     CAT_UNCATEGORISED,
     MOVE_CATEGORIES,
     RULE_CATEGORIES
-) 
\ No newline at end of file
+)
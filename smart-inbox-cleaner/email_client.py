@@ -1,35 +1,71 @@
+import os
 import logging
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, Callable
 from imapclient import IMAPClient
 from imapclient.exceptions import LoginError # More specific error
-from auth import get_credentials
+from auth import get_credentials, TOKEN_PATH
+from imap_compress import enable_compression, compression_enabled_by_env
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Google's IMAP host
-IMAP_HOST = 'imap.gmail.com'
+# Google's IMAP host by default; IMAP_HOST/IMAP_PORT/IMAP_SSL point the app at another
+# server such as the local stand-in (imap_standin.py)
+IMAP_HOST = os.environ.get('IMAP_HOST', 'imap.gmail.com')
+IMAP_PORT = int(os.environ.get('IMAP_PORT', '993'))
+IMAP_SSL = os.environ.get('IMAP_SSL', '1').strip().lower() not in ('0', 'false', 'no', 'off')
 
-def connect_oauth() -> Tuple[Optional[IMAPClient], str]:
-    """Connects to Gmail IMAP using OAuth 2.0 credentials.
+# Opens a logged-in connection: (IMAPClient, status) or (None, error message), like connect_oauth
+ConnectFunc = Callable[[], Tuple[Optional[IMAPClient], str]]
+
+def enable_change_tracking(server: IMAPClient) -> List[str]:
+    """Enables CONDSTORE so folders report HIGHESTMODSEQ for delta syncs.
+
+    QRESYNC is not enabled: IMAPClient has no public way to read the VANISHED responses
+    it adds, so email_fetcher.delta_sync_emails finds expunges itself. Failures are
+    logged and ignored, since change tracking is only an optimisation for delta syncs.
+
+    Returns:
+        The list of extensions the server confirmed as enabled.
+    """
+    if not server.has_capability('CONDSTORE') or not server.has_capability('ENABLE'):
+        logging.info("Server does not offer CONDSTORE via ENABLE. Delta sync disabled.")
+        return []
+    try:
+        enabled = [e.decode('ascii') if isinstance(e, bytes) else e for e in server.enable('CONDSTORE')]
+        logging.info(f"Enabled IMAP extensions: {enabled}")
+        return enabled
+    except Exception as e:
+        logging.warning(f"Could not enable CONDSTORE: {e}")
+        return []
+
+def connect_oauth_account(token_path: str = TOKEN_PATH, compress: Optional[bool] = None,
+                          interactive: bool = True) -> Tuple[Optional[IMAPClient], Optional[str], str]:
+    """Connects to Gmail IMAP using OAuth 2.0 credentials, also returning the account address.
 
     Fetches credentials using auth.get_credentials() and attempts login.
+    `token_path` selects the account (see auth.account_token_path). `compress` negotiates
+    COMPRESS=DEFLATE after login; None defers to the IMAP_COMPRESS environment variable.
+    With `interactive` False a missing or unrefreshable token fails the connect instead of
+    opening the browser sign-in (for pool reconnects and other background threads).
 
     Returns:
-        A tuple containing the connected IMAPClient instance and a status message,
-        or (None, error_message) if connection fails.
+        A tuple of the connected IMAPClient, the address it logged in as and a status
+        message, or (None, None, error_message) if the connection fails.
     """
+    if compress is None:
+        compress = compression_enabled_by_env()
     logging.info("Attempting to get Google credentials and user email...")
-    creds, user_email = get_credentials()
+    creds, user_email = get_credentials(token_path, interactive=interactive)
 
     if not creds or not creds.valid:
         error_msg = "Failed to obtain valid Google credentials. Please check logs or run authentication."
         logging.error(error_msg)
-        return None, error_msg
+        return None, None, error_msg
 
     if not user_email:
         error_msg = "Failed to obtain user email address via People API. Cannot proceed with IMAP login."
         logging.error(error_msg)
-        return None, error_msg
+        return None, None, error_msg
 
     access_token = creds.token
     server: Optional[IMAPClient] = None # Initialize server to None
@@ -37,12 +73,15 @@ def connect_oauth() -> Tuple[Optional[IMAPClient], str]:
     logging.info(f"Attempting IMAP connection to {IMAP_HOST} for user {user_email} using OAuth2...")
 
     try:
-        server = IMAPClient(IMAP_HOST, ssl=True)
+        server = IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=IMAP_SSL)
         logging.info(f"IMAPClient created for {IMAP_HOST}")
         server.oauth2_login(user_email, access_token)
+        enable_change_tracking(server)
+        if compress:
+            enable_compression(server)
         status_message = f'Connected to {IMAP_HOST} as {user_email}'
         logging.info(f'IMAP OAuth2 login successful to {IMAP_HOST} as {user_email}')
-        return server, status_message
+        return server, user_email, status_message
 
     except LoginError as login_err:
         error_msg = f"IMAP Login Error: {login_err}"
@@ -53,11 +92,11 @@ def connect_oauth() -> Tuple[Optional[IMAPClient], str]:
                 server.logout()
             except Exception as logout_e:
                 logging.error(f"Error during logout after login failure: {logout_e}")
-        return None, error_msg
+        return None, None, error_msg
     except ConnectionRefusedError as conn_err: # Specific network error
          error_msg = f"IMAP Connection Refused for {IMAP_HOST}: {conn_err}"
          logging.error(error_msg)
-         return None, error_msg
+         return None, None, error_msg
     except Exception as e: # Catch other potential errors (socket errors, etc.)
         error_msg = f"General IMAP connection/login failed: {e}"
         logging.error(error_msg, exc_info=True)
@@ -67,4 +106,13 @@ def connect_oauth() -> Tuple[Optional[IMAPClient], str]:
                     server.logout()
             except Exception as logout_e:
                 logging.error(f"Error during logout after general failure: {logout_e}")
-        return None, error_msg
+        return None, None, error_msg
+
+def connect_oauth(token_path: str = TOKEN_PATH, compress: Optional[bool] = None,
+                  interactive: bool = True) -> Tuple[Optional[IMAPClient], str]:
+    """connect_oauth_account without the address: (IMAPClient, status) or (None, error_message).
+
+    The shape every ConnectFunc (connection pool, IDLE listener) expects.
+    """
+    server, _user_email, status = connect_oauth_account(token_path, compress, interactive)
+    return server, status
@@ -1,92 +1,463 @@
 from imapclient import IMAPClient
 import logging
-from typing import List, Dict, Any
-import email.header
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, NamedTuple, Iterator, Callable
+import email.parser
+
+from mail_cache import EnvelopeCache
+from header_decoder import decode_header_value
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def decode_header_text(text):
-    """Properly decode email header texts that might be encoded."""
-    if not text:
-        return ""
-    
-    try:
-        # Convert bytes to string if needed before checking patterns
-        if isinstance(text, bytes):
-            try:
-                # Try UTF-8 first as it's most common
-                text = text.decode('utf-8', errors='replace')
-            except:
-                # Fallback to general decoding
-                text = str(text)
-                
-        decoded_parts = email.header.decode_header(text)
-        result = ""
-        for part, encoding in decoded_parts:
-            if isinstance(part, bytes):
-                result += part.decode(encoding or 'utf-8', errors='replace')
+# Number of UIDs requested per FETCH command when streaming envelopes
+DEFAULT_CHUNK_SIZE = 500
+
+# How the "latest N" UIDs are located
+SEARCH_MODE_ALL = "all"                 # SEARCH ALL, then keep the last N UIDs
+SEARCH_MODE_DATE_WINDOW = "date_window" # Walk backwards through SINCE/BEFORE windows until N are found
+DATE_WINDOW_INITIAL_DAYS = 7
+DATE_WINDOW_MAX_LOOKBACK_DAYS = 3650
+
+# Gmail's All Mail folder (the name is localized on some accounts, see resolve_scan_folders)
+ALL_MAIL_FOLDER = '[Gmail]/All Mail'
+
+# Fetch profiles: what is requested alongside ENVELOPE in the same round trip
+FETCH_PROFILE_ENVELOPE = "envelope" # ENVELOPE and FLAGS only
+FETCH_PROFILE_HEADERS = "headers"   # Also the bulk-mail headers below, for header-based rules
+BULK_HEADER_FIELDS = ['List-Id', 'List-Unsubscribe', 'Precedence', 'Auto-Submitted']
+_HEADER_FIELDS_ITEM = f"BODY.PEEK[HEADER.FIELDS ({' '.join(f.upper() for f in BULK_HEADER_FIELDS)})]"
+FETCH_PROFILE_ITEMS: Dict[str, List[str]] = {
+    FETCH_PROFILE_ENVELOPE: ['ENVELOPE', 'FLAGS'],
+    FETCH_PROFILE_HEADERS: ['ENVELOPE', 'FLAGS', _HEADER_FIELDS_ITEM],
+}
+
+# Kept under its original name for existing callers; decoding is shared with the UI helpers
+decode_header_text = decode_header_value
+
+# Fetches envelopes for UIDs of the folder selected on the server: (server, folder, uids, profile).
+# The sync paths take one to swap in parallel_fetcher's ranged fetch.
+EnvelopeFetcher = Callable[[IMAPClient, str, List[int], str], List[Dict[str, Any]]]
+
+class SyncDelta(NamedTuple):
+    """Changes in a folder since the last sync, used to patch session data in place."""
+    added: List[Dict[str, Any]]      # Newly arrived emails, parsed like fetch_inbox_emails results
+    changed: Dict[int, List[str]]    # UID -> current flags for cached emails whose flags changed
+    vanished: List[int]              # UIDs that were expunged or moved away
+
+def _decode_flags(flags) -> List[str]:
+    """Converts IMAP flags (bytes) into plain strings that can be cached as JSON."""
+    return [f.decode('utf-8', errors='replace') if isinstance(f, bytes) else str(f) for f in flags or ()]
+
+def parse_envelope(uid: int, envelope, flags=None) -> Dict[str, Any]:
+    """Turns an IMAP ENVELOPE into the email dict used throughout the app."""
+    # Properly decode subject using our helper function
+    raw_subject = envelope.subject
+    subject = decode_header_text(raw_subject) if raw_subject else ''
+
+    # Properly decode from address; 'from' is the display name when there is one,
+    # 'address' always the bare mailbox@host (for domain rules)
+    from_addr = ""
+    address = ""
+    if envelope.from_ and len(envelope.from_) > 0:
+        sender = envelope.from_[0]
+        if getattr(sender, 'mailbox', None) and getattr(sender, 'host', None):
+            mailbox = sender.mailbox.decode('utf-8', errors='replace') if isinstance(sender.mailbox, bytes) else sender.mailbox
+            host = sender.host.decode('utf-8', errors='replace') if isinstance(sender.host, bytes) else sender.host
+            address = f"{mailbox}@{host}"
+        if hasattr(sender, 'name') and sender.name:
+            from_name = decode_header_text(sender.name)
+            from_addr = from_name
+        elif address:
+            from_addr = address
+        else:
+            from_addr = str(sender)
+
+    return {
+        'uid': uid,
+        'subject': subject,
+        'from': from_addr,
+        'address': address,
+        'date': envelope.date,
+        'flags': _decode_flags(flags)
+    }
+
+def parse_header_fields(raw_headers: Optional[bytes]) -> Dict[str, str]:
+    """Parses a HEADER.FIELDS response into a dict keyed by lower-case header name."""
+    if not raw_headers:
+        return {}
+    parsed = email.parser.BytesHeaderParser().parsebytes(raw_headers)
+    return {name.lower(): decode_header_text(str(value)).strip() for name, value in parsed.items()}
+
+def _find_header_fields(data: Dict[bytes, Any]) -> Optional[bytes]:
+    """Returns the HEADER.FIELDS section from a FETCH response, whatever case the server echoed."""
+    for key, value in data.items():
+        if isinstance(key, bytes) and key.upper().startswith(b'BODY[HEADER.FIELDS'):
+            return value
+    return None
+
+def iter_envelope_batches(server: IMAPClient, uids: List[int],
+                          chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          profile: str = FETCH_PROFILE_ENVELOPE) -> Iterator[List[Dict[str, Any]]]:
+    """Fetch ENVELOPE data in UID chunks, yielding each parsed batch as soon as it arrives.
+
+    Only one chunk's server response is held in memory at a time, so memory stays flat
+    regardless of how many UIDs are requested. Chunks are fetched in the order given.
+    With FETCH_PROFILE_HEADERS each email also gets a 'headers' dict of the bulk-mail
+    headers that were present.
+    """
+    items = FETCH_PROFILE_ITEMS[profile]
+    for start in range(0, len(uids), chunk_size):
+        chunk = uids[start:start + chunk_size]
+        response = server.fetch(chunk, items)
+        batch = []
+        for uid, data in response.items():
+            if b'ENVELOPE' in data:
+                email_data = parse_envelope(uid, data[b'ENVELOPE'], data.get(b'FLAGS'))
+                if profile == FETCH_PROFILE_HEADERS:
+                    email_data['headers'] = parse_header_fields(_find_header_fields(data))
+                batch.append(email_data)
             else:
-                result += str(part)
-        return result
-    except Exception as e:
-        logging.warning(f"Error decoding header text: {e}")
-        if isinstance(text, bytes):
-            return text.decode('utf-8', errors='replace')
-        return text
+                logging.warning(f"No ENVELOPE data found for UID {uid}")
+        # Release the raw response before the next round trip
+        del response
+        yield batch
+
+def fetch_envelopes(server: IMAPClient, uids: List[int],
+                    profile: str = FETCH_PROFILE_ENVELOPE) -> List[Dict[str, Any]]:
+    """Fetch and parse ENVELOPE data for the given UIDs in the currently selected folder."""
+    emails = []
+    for batch in iter_envelope_batches(server, uids, profile=profile):
+        emails.extend(batch)
+    return emails
+
+def _gmail_epoch(day: date) -> int:
+    """Unix timestamp for local midnight of the given day, as accepted by Gmail's after:/before:."""
+    return int(time.mktime(datetime.combine(day, datetime.min.time()).timetuple()))
+
+def search_date_window_uids(server: IMAPClient, batch_size: int, exists: Optional[int] = None,
+                            initial_days: int = DATE_WINDOW_INITIAL_DAYS,
+                            max_lookback_days: int = DATE_WINDOW_MAX_LOOKBACK_DAYS) -> List[int]:
+    """Find the latest batch_size UIDs in the selected folder by searching backwards in date windows.
+
+    Starts with a window of initial_days ending today and doubles it each step while fewer than
+    batch_size UIDs have been found, so the work done is proportional to the number of messages
+    wanted rather than the size of the folder. On Gmail (X-GM-EXT-1) the windows are expressed as
+    an X-GM-RAW query with exact timestamps; elsewhere standard SINCE/BEFORE criteria are used.
+
+    Args:
+        server: Connected client with the folder already selected.
+        batch_size: Number of UIDs wanted.
+        exists: Message count from SELECT, used to stop once every message has been seen.
+        initial_days: Size of the first window in days.
+        max_lookback_days: Give up looking further back than this.
+
+    Returns:
+        Up to batch_size UIDs in ascending order.
+    """
+    use_gmail = server.has_capability('X-GM-EXT-1')
+    today = date.today()
+    before = today + timedelta(days=1) # BEFORE is exclusive, so start from tomorrow
+    window_days = initial_days
+    found: set = set()
+
+    while len(found) < batch_size and (today - before).days < max_lookback_days:
+        if exists is not None and len(found) >= exists:
+            break
+        since = before - timedelta(days=window_days)
+        if use_gmail:
+            uids = server.gmail_search(f"after:{_gmail_epoch(since)} before:{_gmail_epoch(before)}")
+        else:
+            uids = server.search(['SINCE', since, 'BEFORE', before])
+        found.update(uids)
+        logging.debug(f"Date window {since} to {before}: {len(uids)} messages ({len(found)} total).")
+        before = since
+        window_days *= 2 # Sparse windows widen quickly so old mailboxes need few searches
 
-def fetch_inbox_emails(server: IMAPClient, batch_size: int = 250) -> List[Dict[str, Any]]:
+    logging.info(f"Date-window search found {len(found)} messages (wanted {batch_size}).")
+    return sorted(found)[-batch_size:]
+
+def search_latest_uids(server: IMAPClient, batch_size: int, search_mode: str = SEARCH_MODE_ALL,
+                       exists: Optional[int] = None) -> List[int]:
+    """Returns the latest batch_size UIDs in the selected folder using the given search mode."""
+    if search_mode == SEARCH_MODE_DATE_WINDOW:
+        return search_date_window_uids(server, batch_size, exists=exists)
+    messages = server.search(['ALL'])
+    logging.info(f"Found {len(messages)} total messages in the folder.")
+    return messages[-batch_size:]
+
+def fetch_inbox_emails(server: IMAPClient, batch_size: int = 250,
+                       search_mode: str = SEARCH_MODE_ALL,
+                       profile: str = FETCH_PROFILE_ENVELOPE) -> List[Dict[str, Any]]:
     """Fetch metadata for the latest batch_size emails from the INBOX using the provided client."""
     # Removed internal connection logic
 
     emails = []
     try:
         # Assume server is already connected and logged in
-        server.select_folder('INBOX', readonly=True)
-        messages = server.search(['ALL'])
-        logging.info(f"Found {len(messages)} total messages in INBOX.")
+        status = server.select_folder('INBOX', readonly=True)
+        latest_uids = search_latest_uids(server, batch_size, search_mode, status.get(b'EXISTS'))
 
-        if not messages:
+        if not latest_uids:
             logging.info("No messages found in INBOX.")
             return []
 
-        latest_uids = messages[-batch_size:]
         logging.info(f"Fetching details for {len(latest_uids)} messages (UIDs: {latest_uids[:5]}...).")
         # Fetch ENVELOPE data
-        response = server.fetch(latest_uids, ['ENVELOPE'])
-
-        for uid, data in response.items():
-            if b'ENVELOPE' in data:
-                envelope = data[b'ENVELOPE']
-                # Properly decode subject using our helper function
-                raw_subject = envelope.subject
-                subject = decode_header_text(raw_subject) if raw_subject else ''
-                
-                # Properly decode from address
-                from_addr = ""
-                if envelope.from_ and len(envelope.from_) > 0:
-                    sender = envelope.from_[0]
-                    if hasattr(sender, 'name') and sender.name:
-                        from_name = decode_header_text(sender.name)
-                        from_addr = from_name
-                    elif hasattr(sender, 'mailbox') and hasattr(sender, 'host'):
-                        mailbox = sender.mailbox.decode('utf-8', errors='replace') if isinstance(sender.mailbox, bytes) else sender.mailbox
-                        host = sender.host.decode('utf-8', errors='replace') if isinstance(sender.host, bytes) else sender.host
-                        from_addr = f"{mailbox}@{host}"
-                    else:
-                        from_addr = str(sender)
-
-                emails.append({
-                    'uid': uid,
-                    'subject': subject,
-                    'from': from_addr, 
-                    'date': envelope.date
-                })
-            else:
-                logging.warning(f"No ENVELOPE data found for UID {uid}")
+        emails = fetch_envelopes(server, latest_uids, profile)
         logging.info(f"Successfully fetched details for {len(emails)} emails.")
     except Exception as e:
         logging.error(f"Error fetching emails: {e}", exc_info=True)
         # Do not return partial list on error, return empty
         return []
 
-    return emails 
\ No newline at end of file
+    return emails
+
+def _search_uid_range(server: IMAPClient, start: int, end: Optional[int] = None) -> List[int]:
+    """Returns the UIDs in [start, end] (or [start, *] when end is None) that exist in the selected folder.
+
+    A UID range ending in '*' always matches the highest UID in the folder, even when it is
+    below start, so results are filtered against the requested bounds.
+    """
+    upper = '*' if end is None else str(end)
+    uids = server.search(['UID', f"{start}:{upper}"])
+    return sorted(uid for uid in uids if uid >= start and (end is None or uid <= end))
+
+def _search_older_uids(server: IMAPClient, below: int, count: int) -> List[int]:
+    """Returns up to `count` of the highest UIDs below `below` in the selected folder.
+
+    Searches UID windows ending just below `below`, the first sized to `count` and each
+    further one doubled, so the search covers about as many UIDs as are wanted rather
+    than every older message, and gaps left by expunges only cost a few more searches.
+    """
+    found: List[int] = []
+    high, window = below - 1, count
+    while high >= 1 and len(found) < count:
+        low = max(1, high - window + 1)
+        found = _search_uid_range(server, low, high) + found
+        high, window = low - 1, window * 2
+    return found[-count:]
+
+def _newest_first(uids: List[int], chunk_size: int) -> List[List[int]]:
+    """Splits ascending UIDs into chunks of chunk_size, ordered from the newest chunk to the oldest."""
+    return [uids[max(0, end - chunk_size):end] for end in range(len(uids), 0, -chunk_size)]
+
+def _stream_fetch(server: IMAPClient, folder: str, uids: List[int], profile: str,
+                  fetcher: Optional[EnvelopeFetcher], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Fetches `uids` newest chunk first, yielding each parsed batch; a custom fetcher yields one batch."""
+    if fetcher is not None:
+        if uids:
+            yield fetcher(server, folder, uids, profile)
+        return
+    for chunk in _newest_first(uids, chunk_size):
+        yield from iter_envelope_batches(server, chunk, chunk_size, profile)
+
+def _tag_folder(emails: List[Dict[str, Any]], folder: str) -> List[Dict[str, Any]]:
+    """Copies of `emails` with a 'folder' key; the dicts themselves may still go into the cache."""
+    return [{**email_data, 'folder': folder} for email_data in emails]
+
+def stream_folder_emails(server: IMAPClient, cache: EnvelopeCache, batch_size: int = 250,
+                         folder: str = 'INBOX', search_mode: str = SEARCH_MODE_ALL,
+                         profile: str = FETCH_PROFILE_ENVELOPE,
+                         fetcher: Optional[EnvelopeFetcher] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Incrementally sync the latest batch_size envelopes of a folder, yielding them in batches.
+
+    The first run (or a run after the server reports a new UIDVALIDITY) falls back to a full
+    fetch. Later runs only fetch UIDs at or above the stored UIDNEXT and drop cached UIDs that
+    were expunged, so startup cost is proportional to the delta rather than the mailbox.
+
+    Cached emails that are still current come first, as one batch, then the fetched ones
+    chunk by chunk, newest first, so consumers can categorize and show the first batch while
+    later chunks are on the wire. Every email carries a 'folder' key. The cache is updated
+    once the folder has been fetched completely; a stream that is abandoned or fails midway
+    leaves the cursor where it was. Errors are logged and end the stream. `fetcher` replaces
+    the chunked fetch (e.g. with parallel_fetcher's ranged fetch over the account pool) and
+    its result is yielded as one batch.
+    """
+    try:
+        status = server.select_folder(folder, readonly=True)
+        uidvalidity = status.get(b'UIDVALIDITY')
+        uidnext = status.get(b'UIDNEXT')
+        exists = status.get(b'EXISTS', 0)
+        highestmodseq = status.get(b'HIGHESTMODSEQ') # Only present once CONDSTORE is enabled
+        state = cache.get_folder_state(folder)
+
+        if not state or not uidvalidity or not uidnext or state['uidvalidity'] != uidvalidity \
+                or state['profile'] != profile:
+            logging.info(f"No usable cache for {folder} (UIDVALIDITY {uidvalidity}, profile {profile}). Running full fetch.")
+            latest_uids = search_latest_uids(server, batch_size, search_mode, exists)
+            emails: List[Dict[str, Any]] = []
+            for batch in _stream_fetch(server, folder, latest_uids, profile, fetcher, chunk_size):
+                emails.extend(batch)
+                yield _tag_folder(batch, folder)
+            cache.replace_folder(folder, uidvalidity, uidnext, exists, emails, highestmodseq, profile)
+            cache.save()
+            return
+
+        cached_uids = cache.get_uids(folder)
+        if uidnext == state['uidnext'] and exists == state['exists']:
+            # Nothing was added and the message count is unchanged, so nothing was expunged either
+            logging.info(f"{folder} unchanged since last sync ({len(cached_uids)} cached envelopes).")
+            yield _tag_folder(cache.get_emails(folder)[-batch_size:], folder)
+            return
+
+        new_uids: List[int] = []
+        if uidnext > state['uidnext']:
+            new_uids = _search_uid_range(server, state['uidnext'])[-batch_size:]
+
+        removed_uids: List[int] = []
+        if cached_uids:
+            surviving = set(_search_uid_range(server, cached_uids[0], cached_uids[-1]))
+            removed_uids = [uid for uid in cached_uids if uid not in surviving]
+
+        # Backfill older messages if expunges shrank the window below batch_size; every
+        # message not in the window is older than it, so EXISTS bounds how many there are
+        remaining = len(cached_uids) - len(removed_uids) + len(new_uids)
+        missing = min(batch_size, exists) - remaining
+        backfill_uids: List[int] = []
+        if missing > 0 and cached_uids and cached_uids[0] > 1:
+            backfill_uids = _search_older_uids(server, cached_uids[0], missing)
+
+        logging.info(f"Syncing {folder}: {len(new_uids)} new, {len(removed_uids)} expunged, "
+                     f"{len(backfill_uids)} backfilled.")
+        # Cached emails that stay in the window once the new ones are in
+        removed = set(removed_uids)
+        keep = max(0, batch_size - len(new_uids))
+        kept = [email_data for email_data in cache.get_emails(folder) if email_data['uid'] not in removed]
+        kept = kept[-keep:] if keep else []
+        if kept:
+            yield _tag_folder(kept, folder)
+        added: List[Dict[str, Any]] = []
+        for batch in _stream_fetch(server, folder, backfill_uids + new_uids, profile, fetcher, chunk_size):
+            added.extend(batch)
+            yield _tag_folder(batch, folder)
+        cache.update_folder(folder, uidnext, exists, added, removed_uids, keep_latest=batch_size,
+                            highestmodseq=highestmodseq)
+        cache.save()
+    except Exception as e:
+        logging.error(f"Error syncing emails for {folder}: {e}", exc_info=True)
+
+def sync_inbox_emails(server: IMAPClient, cache: EnvelopeCache, batch_size: int = 250,
+                      folder: str = 'INBOX', search_mode: str = SEARCH_MODE_ALL,
+                      profile: str = FETCH_PROFILE_ENVELOPE,
+                      fetcher: Optional[EnvelopeFetcher] = None) -> List[Dict[str, Any]]:
+    """stream_folder_emails collected into one list, in ascending UID order."""
+    emails = [email_data for batch in stream_folder_emails(server, cache, batch_size, folder, search_mode,
+                                                           profile, fetcher)
+              for email_data in batch]
+    return sorted(emails, key=lambda e: e['uid'])
+
+def delta_sync_emails(server: IMAPClient, cache: EnvelopeCache, folder: str = 'INBOX',
+                      batch_size: int = 250) -> Optional[SyncDelta]:
+    """Ask the server for everything that changed in a folder since the cached MODSEQ.
+
+    Requires CONDSTORE to be enabled on the connection (see email_client.enable_change_tracking).
+    Flag changes and arrivals come from one UID FETCH CHANGEDSINCE. Expunged UIDs are
+    detected from the EXISTS count, plus a UID search over the cached range when the count
+    shows something left. Like stream_folder_emails, at most the latest `batch_size` new
+    emails are fetched and the cache is trimmed to that many.
+
+    Returns:
+        A SyncDelta with added, changed and vanished UIDs, or None if the cache cannot be used
+        for a delta (no previous sync, no MODSEQ, UIDVALIDITY changed or an error occurred), in
+        which case the caller should fall back to a full sync.
+    """
+    try:
+        state = cache.get_folder_state(folder)
+        if not state or not state.get('highestmodseq'):
+            logging.info(f"No MODSEQ cursor cached for {folder}. A full sync is required.")
+            return None
+
+        status = server.select_folder(folder, readonly=True)
+        uidvalidity = status.get(b'UIDVALIDITY')
+        uidnext = status.get(b'UIDNEXT')
+        exists = status.get(b'EXISTS', 0)
+        highestmodseq = status.get(b'HIGHESTMODSEQ')
+
+        if not highestmodseq or uidvalidity != state['uidvalidity']:
+            logging.info(f"MODSEQ unavailable or UIDVALIDITY changed for {folder}. A full sync is required.")
+            return None
+
+        if highestmodseq == state['highestmodseq']:
+            logging.info(f"{folder} unchanged since MODSEQ {highestmodseq}.")
+            return SyncDelta(added=[], changed={}, vanished=[])
+
+        cached_uids = cache.get_uids(folder)
+        start_uid = cached_uids[0] if cached_uids else state['uidnext']
+        response = server.fetch(f"{start_uid}:*", ['FLAGS'], modifiers=[f"CHANGEDSINCE {state['highestmodseq']}"])
+        cached_set = set(cached_uids)
+        new_uids: List[int] = []
+        changed: Dict[int, List[str]] = {}
+        for uid, data in response.items():
+            if uid < start_uid:
+                continue # '*' matched the highest UID below our range
+            if uid in cached_set:
+                changed[uid] = _decode_flags(data.get(b'FLAGS'))
+            elif uid >= state['uidnext']:
+                new_uids.append(uid)
+
+        if exists == state['exists'] + len(new_uids):
+            vanished = [] # Message count accounts for every arrival, so nothing was expunged
+        elif cached_uids:
+            surviving = set(_search_uid_range(server, cached_uids[0], cached_uids[-1]))
+            vanished = [uid for uid in cached_uids if uid not in surviving]
+        else:
+            vanished = []
+
+        added = fetch_envelopes(server, sorted(new_uids)[-batch_size:], state['profile'])
+        cache.update_folder(folder, uidnext, exists, added, vanished, keep_latest=batch_size,
+                            changed_flags=changed, highestmodseq=highestmodseq)
+        cache.save()
+        added = _tag_folder(added, folder)
+        logging.info(f"Delta sync for {folder}: {len(added)} added, {len(changed)} changed, {len(vanished)} vanished.")
+        return SyncDelta(added=added, changed=changed, vanished=vanished)
+    except Exception as e:
+        logging.error(f"Error during delta sync for {folder}: {e}", exc_info=True)
+        return None
+
+def resolve_scan_folders(server: IMAPClient, folders: List[str]) -> List[str]:
+    """Returns the requested folders that exist on the server, in the order given.
+
+    Uses a single LIST round trip (skipped when only INBOX is requested). ALL_MAIL_FOLDER is
+    mapped to the server's \\All special-use folder when the account uses a localized name.
+    """
+    if all(folder == 'INBOX' for folder in folders):
+        return list(folders)
+    listing = server.list_folders()
+    existing = {name for _flags, _delimiter, name in listing}
+    all_mail = next((name for flags, _delimiter, name in listing if b'\\All' in flags), None)
+
+    resolved: List[str] = []
+    for folder in folders:
+        if folder == ALL_MAIL_FOLDER and folder not in existing and all_mail:
+            folder = all_mail
+        if folder == 'INBOX' or folder in existing:
+            if folder not in resolved:
+                resolved.append(folder)
+        else:
+            logging.info(f"Folder '{folder}' does not exist on the server. Skipping scan.")
+    return resolved
+
+def scan_folders(server: IMAPClient, cache: EnvelopeCache, folders: List[str], batch_size: int = 250,
+                 search_mode: str = SEARCH_MODE_ALL,
+                 profile: str = FETCH_PROFILE_ENVELOPE,
+                 fetcher: Optional[EnvelopeFetcher] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Scans several folders, yielding batches of each folder's latest emails as they arrive.
+
+    Each folder is streamed through stream_folder_emails, so it keeps its own incremental
+    cursor (UIDVALIDITY/UIDNEXT/MODSEQ) in the cache and every email carries a 'folder'
+    key. UIDs are only unique within a folder, so consumers should key emails by (folder, uid).
+    """
+    try:
+        folders = resolve_scan_folders(server, folders)
+    except Exception as e:
+        logging.error(f"Error listing folders for scan: {e}", exc_info=True)
+        return
+    for folder in folders:
+        scanned = 0
+        for batch in stream_folder_emails(server, cache, batch_size, folder=folder,
+                                          search_mode=search_mode, profile=profile, fetcher=fetcher):
+            scanned += len(batch)
+            yield batch
+        logging.info(f"Scanned {scanned} emails from {folder}.")
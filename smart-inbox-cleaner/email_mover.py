@@ -1,10 +1,14 @@
 import os
+import re
 import logging
-from typing import List, Dict, Optional, Any # Add typing
-from imapclient import IMAPClient
+from email.parser import HeaderParser
+from typing import List, Dict, Optional, Any, Tuple, Callable # Add typing
+from imapclient import IMAPClient, DELETED
 from imapclient.exceptions import IMAPClientError # Base IMAP exception
 # Import category constants
 from categorizer import CAT_ACTION, CAT_READ, CAT_EVENTS, CAT_INFO
+from folder_registry import FolderRegistry, is_trycreate
+from move_journal import MoveJournal, MoveBatch
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -17,13 +21,224 @@ TARGET_FOLDER_MAP: Dict[str, str] = {
     CAT_INFO: "SmartInbox/Information"
 }
 
-def move_emails(server: IMAPClient, uids_to_move: List[int], category_map: Dict[int, str]) -> Optional[List[int]]:
+# Longest UID set sent in one MOVE; servers commonly cap command lines at ~8 KB
+MAX_UID_SET_LENGTH = 4000
+GMAIL_INBOX_LABEL = '\\Inbox'
+_COPYUID_PATTERN = re.compile(r"(?:^|COPYUID\s+)\d+\s+([\d:,]+)\s+([\d:,]+)")
+MESSAGE_ID_ITEM = 'BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)]'
+
+def compress_uid_set(uids: List[int]) -> str:
+    """Formats UIDs as an IMAP sequence set with ranges, e.g. [1, 2, 3, 7] -> '1:3,7'."""
+    return ",".join(_uid_ranges(sorted(set(uids))))
+
+def _uid_ranges(sorted_uids: List[int]) -> List[str]:
+    ranges: List[str] = []
+    start = previous = None
+    for uid in sorted_uids:
+        if previous is not None and uid == previous + 1:
+            previous = uid
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == previous else f"{start}:{previous}")
+        start = previous = uid
+    if start is not None:
+        ranges.append(str(start) if start == previous else f"{start}:{previous}")
+    return ranges
+
+def parse_uid_set(uid_set: str) -> List[int]:
+    """Expands an IMAP UID set without '*' (e.g. from COPYUID) into a list of UIDs."""
+    uids: List[int] = []
+    for part in uid_set.split(','):
+        low, _, high = part.partition(':')
+        low_value, high_value = int(low), int(high or low)
+        uids.extend(range(min(low_value, high_value), max(low_value, high_value) + 1))
+    return uids
+
+def chunk_uid_set(uids: List[int], max_length: int = MAX_UID_SET_LENGTH) -> List[Tuple[str, List[int]]]:
+    """Splits UIDs into compressed UID sets of at most max_length characters.
+
+    Returns:
+        (uid set string, UIDs it covers) pairs in ascending UID order.
+    """
+    chunks: List[Tuple[str, List[int]]] = []
+    parts: List[str] = []
+    covered: List[int] = []
+    length = 0
+    for part in _uid_ranges(sorted(set(uids))):
+        if parts and length + 1 + len(part) > max_length:
+            chunks.append((",".join(parts), covered))
+            parts, covered, length = [], [], 0
+        parts.append(part)
+        covered.extend(parse_uid_set(part))
+        length += len(part) + (1 if length else 0)
+    if parts:
+        chunks.append((",".join(parts), covered))
+    return chunks
+
+def _copyuid_map(responses) -> Optional[Dict[int, int]]:
+    """Source UID -> target UID from COPYUID response codes (UIDPLUS), or None if there are none."""
+    mapping: Optional[Dict[int, int]] = None
+    for response in responses or []:
+        text = response.decode('ascii', errors='replace') if isinstance(response, bytes) else str(response)
+        match = _COPYUID_PATTERN.search(text)
+        if match:
+            mapping = mapping or {}
+            mapping.update(zip(parse_uid_set(match.group(1)), parse_uid_set(match.group(2))))
+    return mapping
+
+def _copied_uids(server: IMAPClient, command: Callable[[], Any], uids: List[int]) -> Dict[int, Optional[int]]:
+    """Runs a UID MOVE/COPY and returns source UID -> target UID for what the server copied.
+
+    With UIDPLUS the COPYUID response code lists exactly which source UIDs were copied and
+    where (UIDs that no longer exist are silently skipped by the server), and no COPYUID
+    means nothing was copied; without UIDPLUS every UID in the set is assumed copied, to an
+    unknown target UID. imaplib files response codes from both untagged and tagged
+    responses under their name.
+    """
+    untagged = server._imap.untagged_responses
+    untagged.pop('COPYUID', None)
+    command()
+    mapping = _copyuid_map(untagged.pop('COPYUID', None))
+    if mapping is None:
+        return {} if server.has_capability('UIDPLUS') else {uid: None for uid in uids}
+    return {uid: mapping[uid] for uid in uids if uid in mapping}
+
+def _move_uid_set(server: IMAPClient, uid_set: str, uids: List[int], target_folder: str) -> Dict[int, Optional[int]]:
+    """One UID MOVE for a whole UID set."""
+    return _copied_uids(server, lambda: server.move(uid_set, target_folder), uids)
+
+def _label_uid_set(server: IMAPClient, uid_set: str, uids: List[int], target_folder: str) -> Dict[int, Optional[int]]:
+    """Gmail: adds the target label, then removes \\Inbox, each as one bulk UID STORE.
+
+    The label is added first, so an interruption leaves messages labelled but still in the
+    INBOX rather than archived without a label. Gmail reports labels but not the UIDs the
+    messages get in the label's folder.
+    """
+    labelled = server.add_gmail_labels(uid_set, [target_folder])
+    if labelled:
+        reported = set(labelled)
+    else:
+        # No FETCH echo: the UIDs may all be gone already (e.g. a resumed batch the server
+        # had applied) or the server stayed silent. Only UIDs still in the folder moved.
+        reported = set(server.search(['UID', uid_set]))
+    server.remove_gmail_labels(uid_set, [GMAIL_INBOX_LABEL], silent=True)
+    return {uid: None for uid in uids if uid in reported}
+
+def _copy_delete_uid_set(server: IMAPClient, uid_set: str, uids: List[int], target_folder: str) -> Dict[int, Optional[int]]:
+    """Servers without MOVE: UID COPY, then STORE \\Deleted and UID EXPUNGE on what was copied."""
+    copied = _copied_uids(server, lambda: server.copy(uid_set, target_folder), uids)
+    if not copied:
+        return {}
+    copied_set = compress_uid_set(list(copied))
+    server.add_flags(copied_set, [DELETED], silent=True)
+    if server.has_capability('UIDPLUS'):
+        server.uid_expunge(copied_set)
+    else:
+        # Plain EXPUNGE also removes any other message already flagged \Deleted in the folder
+        logging.warning("Server lacks UIDPLUS; using EXPUNGE for the whole folder.")
+        server.expunge()
+    return copied
+
+MOVE_STRATEGY_GMAIL_LABELS = "gmail-labels" # +X-GM-LABELS target, -X-GM-LABELS \Inbox
+MOVE_STRATEGY_MOVE = "move"                 # UID MOVE (RFC 6851)
+MOVE_STRATEGY_COPY_DELETE = "copy-delete"   # UID COPY + STORE \Deleted + UID EXPUNGE
+
+MoveFunc = Callable[[IMAPClient, str, List[int], str], Dict[int, Optional[int]]]
+_MOVE_STRATEGIES: Dict[str, MoveFunc] = {
+    MOVE_STRATEGY_GMAIL_LABELS: _label_uid_set,
+    MOVE_STRATEGY_MOVE: _move_uid_set,
+    MOVE_STRATEGY_COPY_DELETE: _copy_delete_uid_set,
+}
+
+def select_move_strategy(server: IMAPClient, source_folder: str = 'INBOX') -> str:
+    """Picks how UIDs leave `source_folder` on this server.
+
+    On Gmail (X-GM-EXT-1) moving out of the INBOX is a label change, done with X-GM-LABELS
+    STOREs. Elsewhere UID MOVE is used where offered, otherwise COPY + \\Deleted + EXPUNGE.
+    """
+    if source_folder == 'INBOX' and server.has_capability('X-GM-EXT-1'):
+        return MOVE_STRATEGY_GMAIL_LABELS
+    if server.has_capability('MOVE'):
+        return MOVE_STRATEGY_MOVE
+    return MOVE_STRATEGY_COPY_DELETE
+
+def move_uid_batch(server: IMAPClient, strategy: str, uid_set: str, uids: List[int], target_folder: str,
+                   folders: FolderRegistry) -> Dict[int, Optional[int]]:
+    """Moves one UID set from the selected folder with the given strategy.
+
+    If the server answers [TRYCREATE] (the folder vanished since the registry listed it),
+    the folder list is reloaded, the folder recreated and the batch retried once.
+
+    Returns:
+        Source UID -> target UID (None where the server did not report it) for the moved UIDs.
+    """
+    move_uid_set = _MOVE_STRATEGIES[strategy]
+    try:
+        return move_uid_set(server, uid_set, uids, target_folder)
+    except IMAPClientError as move_e:
+        if not is_trycreate(move_e):
+            raise
+        logging.warning(f"Server reported TRYCREATE for {target_folder}. Refreshing folder list.")
+        folders.invalidate()
+        if target_folder not in folders.ensure(server, [target_folder]):
+            raise
+        return move_uid_set(server, uid_set, uids, target_folder)
+
+def fetch_message_ids(server: IMAPClient, uid_set: str) -> Dict[int, str]:
+    """UID -> Message-ID header for a UID set of the selected folder (one FETCH)."""
+    message_ids: Dict[int, str] = {}
+    for uid, data in server.fetch(uid_set, [MESSAGE_ID_ITEM]).items():
+        raw = next((value for key, value in data.items()
+                    if isinstance(key, bytes) and key.upper().startswith(b'BODY[HEADER.FIELDS')), b'')
+        message_id = HeaderParser().parsestr(raw.decode('utf-8', errors='replace')).get('Message-ID')
+        if message_id:
+            message_ids[uid] = message_id.strip()
+    return message_ids
+
+def _journal_run(server: IMAPClient, journal: MoveJournal, source_folder: str, uidvalidity: Optional[int],
+                 strategy: str, batches: List[Tuple[str, str, List[int]]]) -> str:
+    """Writes the plan of a move to the journal, with what an undo will need to find the messages."""
+    message_ids: Dict[int, str] = {}
+    if strategy == MOVE_STRATEGY_GMAIL_LABELS or not server.has_capability('UIDPLUS'):
+        # No COPYUID to record target UIDs, so undo will look messages up by Message-ID
+        for _target, uid_set, _uids in batches:
+            message_ids.update(fetch_message_ids(server, uid_set))
+    target_status: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+    for target_folder in dict.fromkeys(target for target, _uid_set, _uids in batches):
+        status = server.folder_status(target_folder, [b'UIDVALIDITY', b'UIDNEXT'])
+        target_status[target_folder] = (status.get(b'UIDVALIDITY'), status.get(b'UIDNEXT'))
+    return journal.begin_run(source_folder, uidvalidity, strategy,
+                             [(target, uids) for target, _uid_set, uids in batches],
+                             message_ids=message_ids, target_status=target_status)
+
+def move_emails(server: IMAPClient, uids_to_move: List[int], category_map: Dict[int, str],
+                source_folder: str = 'INBOX', folders: Optional[FolderRegistry] = None,
+                journal: Optional[MoveJournal] = None,
+                progress_callback: Optional[Callable[[List[int], int, int], None]] = None,
+                stop_checker: Optional[Callable[[], bool]] = None) -> Optional[List[int]]:
     """Moves emails specified by UIDs to folders based on their category using the provided client.
 
+    UIDs are grouped by target folder and each group is sent as compressed UID sets
+    (chunked to MAX_UID_SET_LENGTH), so a bulk move costs a few commands per folder
+    instead of one per email. How each set is moved depends on the server, see
+    select_move_strategy (Gmail label changes, UID MOVE, or COPY + EXPUNGE).
+
     Args:
         server: The connected and authenticated IMAPClient instance.
         uids_to_move: A list of email UIDs to attempt moving.
         category_map: A dictionary mapping UID to its category string.
+        source_folder: The folder the UIDs belong to (INBOX unless re-triaging scanned folders).
+        folders: The account's FolderRegistry, so the folder list is fetched once per session
+            rather than once per call. A fresh registry is used if omitted.
+        journal: Optional MoveJournal. The batches are recorded before they are sent and
+            committed one by one as the server confirms them, so an interrupted move can be
+            resumed (resume_moves) and a finished one undone (undo_moves). After a None
+            return, journal.moved_uids(journal.last_run) tells what was moved anyway.
+        progress_callback: Optional function called after each batch with the UIDs the server
+            moved in it, the number of UIDs processed so far and the total to process.
+        stop_checker: Optional function checked before each batch; when it returns True the
+            move stops there (a cancel) and the UIDs moved so far are returned. The journal
+            run is finished, so the rest is not offered for resuming.
 
     Returns:
         A list of UIDs that were successfully moved, or None if a critical error occurred 
@@ -43,54 +258,77 @@ def move_emails(server: IMAPClient, uids_to_move: List[int], category_map: Dict[
         logging.info("Move requested, but no UIDs provided.")
         return [] # Not an error, just nothing to do
 
+    # Group UIDs by target folder, keeping the first occurrence of each UID
+    uids_by_folder: Dict[str, List[int]] = {}
+    seen: set = set()
+    for uid in uids_to_move:
+        if uid in seen:
+            continue
+        seen.add(uid)
+        category = category_map.get(uid)
+        if not category or category not in TARGET_FOLDER_MAP:
+            logging.warning(f"UID {uid} has invalid or missing category '{category}'. Skipping.")
+            continue
+        target_folder = TARGET_FOLDER_MAP[category]
+        if target_folder == source_folder:
+            logging.info(f"UID {uid} is already in '{target_folder}'. Skipping.")
+            continue
+        uids_by_folder.setdefault(target_folder, []).append(uid)
+
+    folders = folders or FolderRegistry()
+    processed_uids = sum(len(uids) for uids in uids_by_folder.values())
+    run: Optional[str] = None
     try:
-        # Ensure we are in INBOX and have write access before looping
-        server.select_folder('INBOX', readonly=False)
-        logging.info(f"Attempting to move UIDs: {uids_to_move}")
-
-        processed_uids = 0
-        for uid in uids_to_move:
-            category = category_map.get(uid)
-            if not category or category not in TARGET_FOLDER_MAP:
-                logging.warning(f"UID {uid} has invalid or missing category '{category}'. Skipping.")
-                continue
+        # Ensure we are in the source folder and have write access before moving
+        status = server.select_folder(source_folder, readonly=False)
+        strategy = select_move_strategy(server, source_folder)
+        logging.info(f"Attempting to move {processed_uids} UIDs into {len(uids_by_folder)} folder(s) using {strategy}.")
 
-            target_folder = TARGET_FOLDER_MAP[category]
+        # One LIST per session (cached in the registry); missing target folders are created up front
+        available = folders.ensure(server, TARGET_FOLDER_MAP.values())
 
-            # Ensure target folder exists
-            try:
-                if not server.folder_exists(target_folder):
-                    logging.info(f"Target folder '{target_folder}' does not exist. Creating...")
-                    server.create_folder(target_folder)
-                    logging.info(f"Successfully created folder: {target_folder}")
-            except IMAPClientError as folder_e: # Catch specific IMAP errors
-                logging.error(f"IMAP Error checking/creating folder {target_folder} for UID {uid}: {folder_e}")
-                operation_failed = True
-                # Treat folder error as critical? Maybe stop the whole process?
-                # For now, just mark as failed and skip this UID.
-                continue 
-            except Exception as folder_e: # Catch other potential errors
-                logging.error(f"Unexpected error checking/creating folder {target_folder} for UID {uid}: {folder_e}", exc_info=True)
+        # Move the emails, one command per chunk of each folder's UID set
+        batches: List[Tuple[str, str, List[int]]] = []
+        for target_folder, folder_uids in uids_by_folder.items():
+            if target_folder not in available:
+                logging.error(f"Target folder {target_folder} is unavailable. Skipping {len(folder_uids)} UIDs.")
                 operation_failed = True
                 continue
+            batches.extend((target_folder, uid_set, chunk_uids) for uid_set, chunk_uids in chunk_uid_set(folder_uids))
+        if journal and batches:
+            run = _journal_run(server, journal, source_folder, status.get(b'UIDVALIDITY'), strategy, batches)
 
-            # Move the email
+        done_uids = 0
+        for number, (target_folder, uid_set, chunk_uids) in enumerate(batches):
+            if stop_checker and stop_checker():
+                logging.info(f"Move cancelled after {done_uids} of {processed_uids} UIDs.")
+                break
+            moved: Dict[int, Optional[int]] = {}
             try:
-                logging.info(f"Moving UID {uid} (Category: {category}) to folder '{target_folder}'...")
-                server.move([uid], target_folder)
-                logging.info(f"Successfully moved UID {uid}.")
-                moved_uids.append(uid)
-                processed_uids += 1
-
-            except IMAPClientError as move_e:
-                 logging.error(f"IMAP Error moving UID {uid} to {target_folder}: {move_e}")
-                 # Don't mark operation_failed=True here? Allows other emails to be tried.
-                 # Logged as error, but not critical failure for the whole batch.
+                logging.info(f"Moving {len(chunk_uids)} UIDs to folder '{target_folder}'...")
+                moved = move_uid_batch(server, strategy, uid_set, chunk_uids, target_folder, folders)
+                if run:
+                    journal.commit(run, number, moved)
+                moved_uids.extend(moved)
+                missing = set(chunk_uids) - set(moved)
+                if missing:
+                    logging.warning(f"Server did not move UIDs {sorted(missing)} to {target_folder} (no longer in {source_folder}?).")
+                logging.info(f"Successfully moved {len(moved)} UIDs to '{target_folder}'.")
             except Exception as move_e:
-                logging.error(f"Unexpected error moving UID {uid} to {target_folder}: {move_e}", exc_info=True)
+                logging.error(f"Error moving UIDs {uid_set} to {target_folder}: {move_e}",
+                              exc_info=not isinstance(move_e, IMAPClientError))
+                if not server_is_alive(server):
+                    raise # Connection lost: the remaining batches stay planned in the journal
+                # Otherwise not a critical failure for the whole batch; the other chunks are still tried
+            done_uids += len(chunk_uids)
+            if progress_callback:
+                progress_callback(list(moved), done_uids, processed_uids)
+
+        if run:
+            journal.finish(run)
 
-    except IMAPClientError as select_e: # Error selecting INBOX
-         logging.error(f"IMAP Error selecting INBOX for moving: {select_e}")
+    except IMAPClientError as select_e: # Error selecting the source folder
+         logging.error(f"IMAP Error selecting {source_folder} for moving: {select_e}")
          operation_failed = True # Mark as failed on general error
     except Exception as e: # Other general errors (e.g., connection drop)
         logging.error(f"General error during email moving process: {e}", exc_info=True)
@@ -102,4 +340,103 @@ def move_emails(server: IMAPClient, uids_to_move: List[int], category_map: Dict[
         return None # Indicate critical failure to main UI
     else:
         logging.info(f"Move operation complete. Successfully moved {len(moved_uids)} out of {processed_uids} processed emails. Moved UIDs: {moved_uids}")
-        return moved_uids # Return list of UIDs successfully moved 
\ No newline at end of file
+        return moved_uids # Return list of UIDs successfully moved
+
+def server_is_alive(server: IMAPClient) -> bool:
+    """Cheap check used to tell a failed command from a dropped connection."""
+    try:
+        server.noop()
+        return True
+    except Exception:
+        return False
+
+def resume_moves(server: IMAPClient, journal: MoveJournal,
+                 folders: Optional[FolderRegistry] = None) -> Optional[List[int]]:
+    """Finishes the runs in `journal` that were interrupted, from their first uncommitted batch.
+
+    Each pending batch is first narrowed with a UID SEARCH to the UIDs still in the source
+    folder, so messages the server had in fact moved before the interruption are neither
+    moved again nor reported again. A run whose source folder changed UIDVALIDITY is
+    abandoned, since its UIDs no longer identify the same messages.
+
+    Returns:
+        The source UIDs moved now, or None if the resume failed (the journal keeps its place).
+    """
+    folders = folders or FolderRegistry()
+    moved_uids: List[int] = []
+    try:
+        for run in journal.unfinished_runs():
+            pending = [batch for batch in journal.batches(run) if not batch.committed]
+            if pending:
+                source = pending[0].source
+                status = server.select_folder(source, readonly=False)
+                if pending[0].uidvalidity is not None and status.get(b'UIDVALIDITY') != pending[0].uidvalidity:
+                    logging.warning(f"UIDVALIDITY of {source} changed since move run {run}. Abandoning it.")
+                    journal.finish(run)
+                    continue
+                strategy = select_move_strategy(server, source)
+                available = folders.ensure(server, [batch.target for batch in pending])
+                for batch in pending:
+                    if batch.target not in available:
+                        raise RuntimeError(f"Target folder {batch.target} is unavailable")
+                    remaining = sorted(set(server.search(['UID', compress_uid_set(batch.uids)])))
+                    moved: Dict[int, Optional[int]] = {}
+                    if remaining:
+                        moved = move_uid_batch(server, strategy, compress_uid_set(remaining), remaining,
+                                               batch.target, folders)
+                    journal.commit(run, batch.batch, moved)
+                    moved_uids.extend(moved)
+            journal.finish(run)
+            logging.info(f"Resumed move run {run}.")
+    except Exception as e:
+        logging.error(f"Error resuming interrupted moves: {e}", exc_info=True)
+        return None
+    return moved_uids
+
+def _undo_targets(server: IMAPClient, batch: MoveBatch, uidvalidity: Optional[int]) -> List[int]:
+    """UIDs in the (selected) target folder of the messages a committed batch moved there."""
+    known = [target_uid for target_uid in batch.moved.values() if target_uid is not None]
+    if known and batch.target_uidvalidity is not None and uidvalidity == batch.target_uidvalidity:
+        return known
+    # No usable COPYUID mapping: find the messages by Message-ID among those added since the move
+    wanted = {batch.message_ids[uid] for uid in batch.moved if uid in batch.message_ids}
+    if not wanted:
+        return []
+    start = batch.target_uidnext if uidvalidity == batch.target_uidvalidity and batch.target_uidnext else 1
+    found = fetch_message_ids(server, f"{start}:*")
+    return sorted(uid for uid, message_id in found.items() if message_id in wanted)
+
+def undo_moves(server: IMAPClient, journal: MoveJournal, run: Optional[str] = None,
+               folders: Optional[FolderRegistry] = None) -> Optional[int]:
+    """Moves the messages of a journaled run back to where they came from, in batches.
+
+    Args:
+        run: The run to undo; defaults to journal.last_undoable_run().
+
+    Returns:
+        The number of messages moved back, or None if the undo failed. Batches undone before
+        a failure are marked in the journal and not undone twice.
+    """
+    folders = folders or FolderRegistry()
+    run = run or journal.last_undoable_run()
+    if run is None:
+        logging.info("Nothing to undo.")
+        return 0
+    restored = 0
+    try:
+        batches = [batch for batch in journal.batches(run) if batch.committed and batch.moved and not batch.undone]
+        available = folders.ensure(server, {batch.source for batch in batches})
+        for batch in reversed(batches):
+            if batch.source not in available:
+                raise RuntimeError(f"Source folder {batch.source} is unavailable")
+            status = server.select_folder(batch.target, readonly=False)
+            target_uids = _undo_targets(server, batch, status.get(b'UIDVALIDITY'))
+            strategy = select_move_strategy(server, batch.target)
+            for uid_set, chunk_uids in chunk_uid_set(target_uids):
+                restored += len(move_uid_batch(server, strategy, uid_set, chunk_uids, batch.source, folders))
+            journal.mark_undone(run, batch.batch)
+        logging.info(f"Undid move run {run}: {restored} message(s) moved back.")
+    except Exception as e:
+        logging.error(f"Error undoing move run {run}: {e}", exc_info=True)
+        return None
+    return restored
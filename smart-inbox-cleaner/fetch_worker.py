@@ -0,0 +1,64 @@
+"""
+Background thread that streams the fetch of every account on its own event loop
+"""
+import queue
+import asyncio
+import logging
+import threading
+from typing import List, Dict, Any
+
+from accounts import MailAccount, stream_accounts
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class FetchWorker(threading.Thread):
+    """Runs accounts.stream_accounts on an asyncio event loop and queues each batch.
+
+    The Streamlit script thread only drains `results`, so the UI stays responsive while
+    envelopes are on the wire and can show each batch as it arrives. stop() ends the
+    stream after the batch in flight. Like MoveWorker, the worker never touches
+    Streamlit session state.
+    """
+
+    def __init__(self, accounts: List[MailAccount], folders: List[str], **fetch_options: Any):
+        super().__init__(name="fetch-worker", daemon=True)
+        self.accounts = accounts
+        self.folders = folders
+        self.fetch_options = fetch_options # batch_size, search_mode, profile, parallel
+        self.fetched = 0 # Emails delivered so far
+        self.failed = False
+        self.results: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """Ends the fetch after the batch in flight; returns without waiting."""
+        self._stop_event.set()
+
+    def drain(self) -> List[List[Dict[str, Any]]]:
+        """Returns every batch since the last call, without blocking."""
+        batches: List[List[Dict[str, Any]]] = []
+        while True:
+            try:
+                batches.append(self.results.get_nowait())
+            except queue.Empty:
+                return batches
+
+    def run(self) -> None:
+        try:
+            asyncio.run(self._fetch())
+        except Exception as e:
+            logging.error(f"Error fetching emails: {e}", exc_info=True)
+            self.failed = True
+        logging.info(f"Fetch worker finished: {self.fetched} emails"
+                     f"{' (stopped)' if self._stop_event.is_set() else ''}.")
+
+    async def _fetch(self) -> None:
+        stream = stream_accounts(self.accounts, self.folders, **self.fetch_options)
+        try:
+            async for batch in stream:
+                if self._stop_event.is_set():
+                    break
+                self.fetched += len(batch)
+                self.results.put(batch)
+        finally:
+            await stream.aclose()
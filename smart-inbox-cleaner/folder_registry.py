@@ -0,0 +1,75 @@
+"""
+Per-account cache of the server's folder list, so moves do not LIST once per email
+"""
+import logging
+import threading
+from typing import Iterable, Optional, Set
+
+from imapclient import IMAPClient
+from imapclient.exceptions import IMAPClientError
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def is_trycreate(error: Exception) -> bool:
+    """True if the server rejected a command because the target folder does not exist."""
+    return 'TRYCREATE' in str(error).upper()
+
+class FolderRegistry:
+    """Folder names of one account, loaded with a single LIST and kept for the session.
+
+    The list is only reloaded after invalidate(), which callers do when a CREATE fails or a
+    MOVE/COPY comes back with [TRYCREATE] (the folder was deleted behind our back). Safe to
+    share between the pooled connections of an account.
+    """
+
+    def __init__(self):
+        self._folders: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+        self.list_count = 0 # LIST round trips issued, for diagnostics
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._folders = None
+
+    def _load(self, server: IMAPClient) -> Set[str]:
+        # Caller holds the lock
+        if self._folders is None:
+            self._folders = {name for _flags, _delimiter, name in server.list_folders()}
+            self.list_count += 1
+            logging.info(f"Loaded {len(self._folders)} folder names.")
+        return self._folders
+
+    def exists(self, server: IMAPClient, folder: str) -> bool:
+        with self._lock:
+            return folder == 'INBOX' or folder in self._load(server)
+
+    def ensure(self, server: IMAPClient, folders: Iterable[str]) -> Set[str]:
+        """Creates whichever of `folders` are missing.
+
+        Returns:
+            The subset of `folders` that exists afterwards; failures are logged.
+        """
+        available: Set[str] = set()
+        create_failed = False
+        with self._lock:
+            known = self._load(server)
+            for folder in dict.fromkeys(folders):
+                if folder == 'INBOX' or folder in known:
+                    available.add(folder)
+                    continue
+                try:
+                    logging.info(f"Target folder '{folder}' does not exist. Creating...")
+                    server.create_folder(folder)
+                    logging.info(f"Successfully created folder: {folder}")
+                except IMAPClientError as e:
+                    if 'ALREADYEXISTS' not in str(e).upper():
+                        logging.error(f"IMAP Error creating folder {folder}: {e}")
+                        create_failed = True
+                        continue
+                    logging.info(f"Folder '{folder}' already exists.")
+                known.add(folder)
+                available.add(folder)
+            if create_failed:
+                # The cached list is evidently out of date; reload it next time
+                self._folders = None
+        return available
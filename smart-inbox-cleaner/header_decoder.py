@@ -0,0 +1,50 @@
+"""
+Shared decoding of RFC 2047 encoded email header values (subjects, display names, etc.)
+"""
+import logging
+import email.header
+from functools import lru_cache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Distinct encoded values remembered by the decoder. Newsletters and notifications
+# repeat the same encoded subjects and sender names, so hit rates are high.
+HEADER_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _decode_encoded_words(text: str) -> str:
+    """Decodes a header value containing encoded words (slow path, memoized)."""
+    try:
+        decoded_parts = email.header.decode_header(text)
+        result = ""
+        for part, encoding in decoded_parts:
+            if isinstance(part, bytes):
+                try:
+                    result += part.decode(encoding or 'utf-8', errors='replace')
+                except LookupError:
+                    # Unknown charset name in the header
+                    result += part.decode('utf-8', errors='replace')
+            else:
+                result += str(part)
+        return result
+    except Exception as e:
+        logging.warning(f"Error decoding header text '{text}': {e}")
+        return text
+
+def decode_header_value(value) -> str:
+    """Decodes an email header value that might be RFC 2047 encoded.
+
+    Accepts str, bytes or None. Values without an encoded-word marker ('=?') are returned
+    as-is without touching the email.header machinery; encoded values go through a
+    bounded LRU cache.
+    """
+    if not value:
+        return ""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    elif not isinstance(value, str):
+        value = str(value)
+    # Fast path: plain ASCII and already-decoded text need no work
+    if '=?' not in value:
+        return value
+    return _decode_encoded_words(value)
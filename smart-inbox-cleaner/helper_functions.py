@@ -3,37 +3,18 @@ Helper functions for Smart Inbox Cleaner
 """
 
 import logging
-import email.header
 import ollama
+from urllib.parse import quote, unquote
+import pandas as pd
 from llm_categorizer import DEFAULT_MODEL
+from categorizer import CAT_UNCATEGORISED
+from constants import EMAIL_TABLE_COLUMNS
+from header_decoder import decode_header_value
 
 def decode_subject(subject):
     """Decode email subjects encoded with =?UTF-8?Q?...?= format."""
-    if not subject:
-        return ""
-        
-    try:
-        # Check if it's an encoded string that needs decoding
-        if isinstance(subject, str) and "=?UTF-8?" in subject:
-            # Use proper email.header module to decode
-            decoded_parts = email.header.decode_header(subject)
-            result = ""
-            for part, encoding in decoded_parts:
-                if isinstance(part, bytes):
-                    result += part.decode(encoding or 'utf-8', errors='replace')
-                else:
-                    result += str(part)
-            return result
-        return subject  # Return as-is if not encoded or not a string
-    except Exception as e:
-        logging.warning(f"Error decoding subject '{subject}': {str(e)}")
-        # Return the original if decoding fails
-        if isinstance(subject, str):
-            return subject
-        elif isinstance(subject, bytes):
-            return subject.decode('utf-8', errors='replace')
-        else:
-            return str(subject)
+    # Shared, memoized decoder; subjects are normally already decoded at fetch time
+    return decode_header_value(subject)
 
 def get_ollama_models():
     """Fetches the list of available Ollama models."""
@@ -44,4 +25,77 @@ def get_ollama_models():
     except Exception as e:
         # Use logging instead of st.warning here as it might be called before UI is fully ready
         logging.warning(f"Could not fetch Ollama models. Is Ollama running? Error: {e}")
-        return [DEFAULT_MODEL] # Fallback to default 
\ No newline at end of file
+        return [DEFAULT_MODEL] # Fallback to default 
+def email_key(email):
+    """Identifies an email across accounts and folders; UIDs are only unique within a folder."""
+    return (email.get('account', ''), email.get('folder', 'INBOX'), email['uid'])
+
+def email_row_id(email):
+    """Table row id carrying the email_key, e.g. for the category dropdown's query parameter."""
+    account, folder, uid = email_key(email)
+    return f"email_{quote(account, safe='')}:{quote(folder, safe='')}:{uid}"
+
+def parse_email_row_id(row_id):
+    """The (account, folder, uid) key of an email_row_id; raises ValueError if it is malformed."""
+    if not row_id.startswith('email_'):
+        raise ValueError(f"Not an email row id: {row_id!r}")
+    account, folder, uid = row_id[len('email_'):].split(':')
+    return (unquote(account), unquote(folder), int(uid))
+
+def remove_emails(emails, df, keys):
+    """Drops the emails identified by (account, folder, uid) keys from the session list and DataFrame.
+
+    Returns:
+        A tuple of (emails, df) without the removed emails.
+    """
+    keys = set(keys)
+    if not keys:
+        return emails, df
+    emails = [email for email in emails if email_key(email) not in keys]
+    if not df.empty:
+        keep = [key not in keys for key in zip(df['account'], df['folder'], df['uid'])]
+        df = df[keep]
+    return emails, df
+
+def apply_sync_delta(emails, df, delta, folder='INBOX', account=''):
+    """Patches the session email list and DataFrame with a SyncDelta instead of rebuilding them.
+
+    Returns:
+        A tuple of (emails, df) with vanished rows dropped, flags refreshed and new
+        emails appended as Uncategorised.
+    """
+    emails, df = remove_emails(emails, df, [(account, folder, uid) for uid in delta.vanished])
+
+    if delta.changed:
+        for email in emails:
+            if email_key(email)[:2] == (account, folder) and email['uid'] in delta.changed:
+                email['flags'] = delta.changed[email['uid']]
+
+    for email in delta.added:
+        email['account'] = account
+    return append_emails(emails, df, delta.added)
+
+def append_emails(emails, df, new_emails):
+    """Adds newly arrived emails to the session list and DataFrame.
+
+    Emails already present (by account, folder and uid) are skipped; emails without a category
+    are added as Uncategorised.
+
+    Returns:
+        A tuple of (emails, df) including the new emails.
+    """
+    known = {email_key(email) for email in emails}
+    new_emails = [email for email in new_emails if email_key(email) not in known]
+    if not new_emails:
+        return emails, df
+    emails = emails + new_emails
+    new_rows = pd.DataFrame(new_emails)
+    if 'category' not in new_rows.columns:
+        new_rows['category'] = CAT_UNCATEGORISED
+    new_rows['category'] = new_rows['category'].fillna(CAT_UNCATEGORISED)
+    new_rows['Select'] = False
+    new_rows['date'] = pd.to_datetime(new_rows['date'])
+    new_rows = new_rows.reindex(columns=EMAIL_TABLE_COLUMNS)
+    df = pd.concat([new_rows, df], ignore_index=True) if not df.empty else new_rows
+    df = df.sort_values(by='date', ascending=False)
+    return emails, df
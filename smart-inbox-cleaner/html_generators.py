@@ -3,6 +3,7 @@ HTML generation functions for Smart Inbox Cleaner UI components
 """
 import pandas as pd
 import html
+from helper_functions import email_row_id
 
 def generate_status_html(category_counts, current_batch_size, total_emails):
     """Generate HTML for the inbox status display"""
@@ -54,11 +55,13 @@ def generate_complete_html(progress_text):
     </div>
     """
 
-def generate_email_table_html(df):
+def generate_email_table_html(df, show_account=False):
     """Generate a custom HTML table to display emails with category pills
     
     Args:
         df: DataFrame containing email data with columns 'date', 'from', 'subject', 'category'
+            and the 'account', 'folder', 'uid' key columns
+        show_account: Whether to show the account as an extra column
         
     Returns:
         HTML string with a custom styled table
@@ -139,6 +142,14 @@ def generate_email_table_html(df):
         text-align: center;
     }
 
+    .account-col {
+        width: 180px;
+        white-space: nowrap;
+        overflow: hidden;
+        text-overflow: ellipsis;
+        color: #666;
+    }
+
     /* Category select styling */
     .category-select {
         border-radius: 12px;
@@ -350,6 +361,8 @@ def generate_email_table_html(df):
     html_parts.append('<th class="from-col">From</th>')
     html_parts.append('<th class="subject-col">Subject</th>')
     html_parts.append('<th class="category-col">Category</th>')
+    if show_account:
+        html_parts.append('<th class="account-col">Account</th>')
     html_parts.append('</tr></thead>')
     html_parts.append('<tbody>')
     
@@ -372,8 +385,8 @@ def generate_email_table_html(df):
         subject = escape_html(row.get('subject', ''))
         category = escape_html(row.get('category', 'Uncategorised'))
         
-        # Create a unique ID for this email row
-        email_id = f"email_{idx}"
+        # Identify the row by its email key; the DataFrame index changes as rows are removed
+        email_id = escape_html(email_row_id(row))
         
         # Add the row
         html_parts.append('<tr>')
@@ -392,6 +405,9 @@ def generate_email_table_html(df):
         
         html_parts.append('</select>')
         html_parts.append('</td>')
+        if show_account:
+            account = escape_html(row.get('account', ''))
+            html_parts.append(f'<td class="account-col" title="{account}">{account}</td>')
         html_parts.append('</tr>')
     
     # Close the table
@@ -0,0 +1,154 @@
+"""
+Background IMAP IDLE listener that fetches and categorizes new mail as it arrives
+"""
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import List, Dict, Any, Optional, Callable, Iterator
+
+from imapclient import IMAPClient
+
+from email_client import connect_oauth, ConnectFunc
+from email_fetcher import fetch_envelopes, FETCH_PROFILE_HEADERS
+from connection_pool import IMAPConnectionPool
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Servers may drop an IDLE after 30 minutes (RFC 2177), so re-issue it before that
+IDLE_RESTART_SECONDS = 25 * 60
+# How long each idle_check blocks; bounds how quickly stop() takes effect
+IDLE_CHECK_SECONDS = 1
+# Delay before reconnecting after the dedicated connection fails
+RECONNECT_BACKOFF_SECONDS = (1, 2, 5, 15, 30)
+
+CategorizeFunc = Callable[[List[Dict[str, Any]]], Optional[List[Dict[str, Any]]]]
+
+class IdleListener(threading.Thread):
+    """Watches one folder over a dedicated IDLE connection.
+
+    New UIDs are fetched with fetch_envelopes, passed through `categorize` and put on
+    `results` as a list of email dicts (tagged with 'folder' and 'account'). The listener never touches
+    Streamlit session state; the UI drains the queue on its own thread.
+
+    With a `pool`, the IDLE connection is borrowed from it (and holds one of its slots
+    while listening); otherwise a dedicated connection is opened with `connect`.
+    """
+
+    def __init__(self, categorize: Optional[CategorizeFunc] = None, folder: str = 'INBOX',
+                 connect: ConnectFunc = partial(connect_oauth, interactive=False),
+                 profile: str = FETCH_PROFILE_HEADERS,
+                 pool: Optional[IMAPConnectionPool] = None, account: str = ''):
+        super().__init__(name=f"imap-idle-{folder}", daemon=True)
+        self.categorize = categorize
+        self.folder = folder
+        self.connect = connect
+        self.profile = profile
+        self.pool = pool
+        self.account = account
+        self.results: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._next_uid: Optional[int] = None
+
+    def stop(self) -> None:
+        """Asks the listener to leave IDLE and log out; returns without waiting."""
+        self._stop_event.set()
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Returns every email delivered since the last call, without blocking."""
+        emails: List[Dict[str, Any]] = []
+        while True:
+            try:
+                emails.extend(self.results.get_nowait())
+            except queue.Empty:
+                return emails
+
+    def run(self) -> None:
+        attempt = 0
+        while not self._stop_event.is_set():
+            try:
+                with self._open_connection() as server:
+                    attempt = 0
+                    if not server.has_capability('IDLE'):
+                        logging.warning("Server does not support IDLE. Push updates disabled.")
+                        return
+                    self._listen(server)
+            except Exception as e:
+                delay = RECONNECT_BACKOFF_SECONDS[min(attempt, len(RECONNECT_BACKOFF_SECONDS) - 1)]
+                logging.error(f"IDLE listener error on {self.folder}: {e}. Retrying in {delay}s.", exc_info=True)
+                attempt += 1
+                self._stop_event.wait(delay)
+        logging.info(f"IDLE listener for {self.folder} stopped.")
+
+    @contextmanager
+    def _open_connection(self) -> Iterator[IMAPClient]:
+        """Borrows a connection from the pool, or opens (and later logs out) a dedicated one."""
+        if self.pool is not None:
+            with self.pool.connection() as server:
+                yield server
+            return
+        server, status = self.connect()
+        if not server:
+            raise ConnectionError(f"Could not open IDLE connection: {status}")
+        try:
+            yield server
+        finally:
+            self._logout(server)
+
+    def _listen(self, server: IMAPClient) -> None:
+        """Runs IDLE cycles on a connected server until stopped or the connection fails."""
+        status = server.select_folder(self.folder, readonly=True)
+        uidnext = status.get(b'UIDNEXT')
+        if self._next_uid is None:
+            self._next_uid = uidnext
+        elif uidnext is not None and uidnext > self._next_uid:
+            # Mail arrived while reconnecting
+            self._fetch_new(server)
+        logging.info(f"IDLE listener watching {self.folder} from UID {self._next_uid}.")
+
+        while not self._stop_event.is_set():
+            server.idle()
+            started = time.monotonic()
+            arrived = False
+            try:
+                while not self._stop_event.is_set() and time.monotonic() - started < IDLE_RESTART_SECONDS:
+                    responses = server.idle_check(timeout=IDLE_CHECK_SECONDS)
+                    if any(len(r) > 1 and r[1] == b'EXISTS' for r in responses):
+                        arrived = True
+                        break
+            finally:
+                server.idle_done()
+            if arrived:
+                self._fetch_new(server)
+
+    def _fetch_new(self, server: IMAPClient) -> None:
+        """Fetches, categorizes and publishes UIDs at or above the last seen UIDNEXT."""
+        if self._next_uid is None:
+            new_uids = server.search(['ALL'])[-1:]
+        else:
+            # 'n:*' also matches the highest UID when it is below n, so filter
+            new_uids = [uid for uid in server.search(['UID', f'{self._next_uid}:*']) if uid >= self._next_uid]
+        if not new_uids:
+            return
+        self._next_uid = max(new_uids) + 1
+
+        emails = fetch_envelopes(server, sorted(new_uids), self.profile)
+        for email_data in emails:
+            email_data['folder'] = self.folder
+            email_data['account'] = self.account
+        if self.categorize and emails:
+            try:
+                emails = self.categorize(emails) or emails
+            except Exception as e:
+                logging.error(f"Error categorizing pushed emails: {e}", exc_info=True)
+        logging.info(f"IDLE listener delivered {len(emails)} new email(s) from {self.folder}.")
+        self.results.put(emails)
+
+    @staticmethod
+    def _logout(server: IMAPClient) -> None:
+        try:
+            server.logout()
+        except Exception as e:
+            logging.debug(f"Error logging out IDLE connection: {e}")
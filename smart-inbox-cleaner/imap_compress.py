@@ -0,0 +1,237 @@
+"""
+IMAP COMPRESS=DEFLATE (RFC 4978) for IMAPClient connections, with wire byte counters
+"""
+import io
+import os
+import zlib
+import time
+import imaplib
+import logging
+import argparse
+from typing import Optional, Callable, Type, TypeVar
+
+import imapclient
+from imapclient import IMAPClient
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+COMPRESS_CAPABILITY = 'COMPRESS=DEFLATE'
+COMPRESS_LEVEL = 6
+# Compressed bytes requested from the underlying socket per read
+WIRE_READ_SIZE = 16384
+# imapclient major versions whose connection is an imaplib.IMAP4 reading through `file` and
+# writing through `sock` (IMAPClient.starttls swaps them the same way)
+TRANSPORT_SWAP_IMAPCLIENT_VERSIONS = (2, 3)
+
+W = TypeVar('W', bound='CountingSocket')
+
+# imaplib only sends commands it knows; register COMPRESS as imapclient does its extensions
+if "COMPRESS" not in imaplib.Commands:
+    imaplib.Commands["COMPRESS"] = ("AUTH", "SELECTED")
+
+def compression_enabled_by_env() -> bool:
+    """Reads the opt-in switch from the IMAP_COMPRESS environment variable."""
+    return os.environ.get('IMAP_COMPRESS', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+class CountingSocket:
+    """Wraps a socket and counts bytes on the wire and at the IMAP protocol level.
+
+    Without compression both counters are equal; DeflateSocket makes them differ.
+    Everything else (fileno, settimeout, shutdown, ...) is delegated, so imaplib and
+    IMAPClient.idle_check keep working on the wrapped socket.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.wire_bytes_sent = 0
+        self.wire_bytes_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def reset_counters(self) -> None:
+        self.wire_bytes_sent = self.wire_bytes_received = 0
+        self.bytes_sent = self.bytes_received = 0
+
+    def _encode(self, data: bytes) -> bytes:
+        return data
+
+    def _decode(self, data: bytes) -> bytes:
+        return data
+
+    def sendall(self, data: bytes) -> None:
+        wire = self._encode(data)
+        self._sock.sendall(wire)
+        self.bytes_sent += len(data)
+        self.wire_bytes_sent += len(wire)
+
+    def recv(self, bufsize: int) -> bytes:
+        while True:
+            # May return more than bufsize; _SocketReader keeps the excess
+            wire = self._sock.recv(max(bufsize, WIRE_READ_SIZE))
+            if not wire:
+                return b''
+            self.wire_bytes_received += len(wire)
+            data = self._decode(wire)
+            if data:
+                self.bytes_received += len(data)
+                return data
+            # A compressed block can decode to nothing yet; keep reading
+
+    def makefile(self, mode: str = 'rb', *args, **kwargs):
+        if mode != 'rb':
+            return self._sock.makefile(mode, *args, **kwargs)
+        return io.BufferedReader(_SocketReader(self))
+
+class DeflateSocket(CountingSocket):
+    """CountingSocket that deflates outgoing and inflates incoming data (raw DEFLATE, no header)."""
+
+    def __init__(self, sock, level: int = COMPRESS_LEVEL):
+        super().__init__(sock)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def _encode(self, data: bytes) -> bytes:
+        # A sync flush per command keeps the stream interactive
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def _decode(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+class _SocketReader(io.RawIOBase):
+    """Raw stream over CountingSocket.recv, for imaplib's readline()/read() file object."""
+
+    def __init__(self, sock: CountingSocket):
+        self._sock = sock
+        self._pending = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            self._pending = self._sock.recv(len(buffer))
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def _transport_swap_supported(server: IMAPClient) -> bool:
+    """True if this imapclient/imaplib carries the connection over `sock` and `file` as expected."""
+    imap = getattr(server, '_imap', None)
+    return (imapclient.version.version_info[0] in TRANSPORT_SWAP_IMAPCLIENT_VERSIONS
+            and isinstance(imap, imaplib.IMAP4)
+            and hasattr(imap, 'sock') and hasattr(imap, 'file'))
+
+def _swap_transport(server: IMAPClient, wrapper: Type[W],
+                    negotiate: Optional[Callable[[IMAPClient], bool]] = None) -> Optional[W]:
+    """Puts a `wrapper` around the connection's socket, returning the wrapper now in place.
+
+    The only code that touches IMAPClient internals (`server._imap.sock` and `.file`). A
+    connection already carried by a `wrapper` is returned unchanged; any other
+    CountingSocket is replaced rather than stacked on. `negotiate` runs right before the
+    swap (e.g. the COMPRESS command) and a False result leaves the connection as it was.
+
+    Returns:
+        The wrapper, or None if negotiation failed or the installed imapclient is not one
+        whose transport this knows how to swap.
+    """
+    if not _transport_swap_supported(server):
+        logging.warning(f"Cannot wrap the IMAP socket with imapclient {imapclient.__version__}. "
+                        "Continuing without it.")
+        return None
+    imap = server._imap
+    sock = imap.sock
+    if isinstance(sock, wrapper):
+        return sock
+    if negotiate is not None and not negotiate(server):
+        return None
+    wrapped = wrapper(sock._sock if isinstance(sock, CountingSocket) else sock)
+    imap.sock = wrapped
+    imap.file = wrapped.makefile('rb')
+    return wrapped
+
+def count_traffic(server: IMAPClient) -> Optional[CountingSocket]:
+    """Installs byte counters on a connection (baseline for benchmarks).
+
+    Returns:
+        The CountingSocket carrying the connection (its DeflateSocket if compressed), or
+        None if the socket cannot be wrapped (see _swap_transport).
+    """
+    return _swap_transport(server, CountingSocket)
+
+def _negotiate_compress(server: IMAPClient) -> bool:
+    try:
+        typ, data = server._imap._simple_command('COMPRESS', 'DEFLATE')
+    except Exception as e:
+        logging.warning(f"COMPRESS DEFLATE failed: {e}")
+        return False
+    if typ != 'OK':
+        logging.warning(f"Server refused COMPRESS DEFLATE: {data}")
+        return False
+    logging.info("IMAP COMPRESS=DEFLATE enabled.")
+    return True
+
+def enable_compression(server: IMAPClient) -> Optional[DeflateSocket]:
+    """Negotiates COMPRESS=DEFLATE on an authenticated connection.
+
+    Returns:
+        The DeflateSocket now carrying the connection (exposing byte counters), or None if
+        the server does not offer the extension, refused it, or the socket cannot be
+        wrapped. Failures leave the connection uncompressed and usable.
+    """
+    if not server.has_capability(COMPRESS_CAPABILITY):
+        logging.info("Server does not offer COMPRESS=DEFLATE. Continuing uncompressed.")
+        return None
+    return _swap_transport(server, DeflateSocket, _negotiate_compress)
+
+def _benchmark_run(compress: bool, batch_size: int) -> Optional[CountingSocket]:
+    # Imported here because email_client imports this module. Run as a script, this file
+    # is __main__, so the socket classes email_client installs come from imap_compress.
+    from email_client import connect_oauth
+    from imap_compress import count_traffic, DeflateSocket
+    from email_fetcher import fetch_inbox_emails, FETCH_PROFILE_HEADERS
+
+    server, status = connect_oauth(compress=compress)
+    if not server:
+        raise SystemExit(f"Connection failed: {status}")
+    try:
+        sock = count_traffic(server)
+        if sock is None:
+            raise SystemExit("Cannot count traffic with this imapclient version.")
+        sock.reset_counters()
+        started = time.perf_counter()
+        emails = fetch_inbox_emails(server, batch_size=batch_size, profile=FETCH_PROFILE_HEADERS)
+        elapsed = time.perf_counter() - started
+        label = "deflate" if isinstance(sock, DeflateSocket) else "plain"
+        print(f"{label:8} {len(emails):6} emails  {elapsed:7.2f}s  "
+              f"wire in {sock.wire_bytes_received:>11,} B  data in {sock.bytes_received:>11,} B  "
+              f"wire out {sock.wire_bytes_sent:>9,} B")
+        return sock
+    finally:
+        server.logout()
+
+def _benchmark(batch_size: int) -> None:
+    from imap_compress import DeflateSocket
+    plain = _benchmark_run(False, batch_size)
+    deflate = _benchmark_run(True, batch_size)
+    if plain.wire_bytes_received and isinstance(deflate, DeflateSocket):
+        print(f"wire bytes in with deflate: {deflate.wire_bytes_received / plain.wire_bytes_received:.1%} of plain")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare wire bytes and wall time of an envelope+header fetch with and without COMPRESS=DEFLATE.")
+    parser.add_argument('--batch-size', type=int, default=2000, help="Number of latest INBOX messages to fetch")
+    parser.add_argument('--standin', type=int, default=0, metavar='MESSAGES',
+                        help="Fetch from a local stand-in server with this many messages instead of Gmail")
+    parser.add_argument('--latency', type=float, default=0.0, help="Stand-in delay per command in seconds")
+    args = parser.parse_args()
+    if args.standin:
+        from imap_standin import StandinIMAPServer, stub_oauth
+        from synthetic_mailbox import SyntheticMailbox
+        with StandinIMAPServer(SyntheticMailbox(args.standin), default_latency=args.latency) as standin, \
+                stub_oauth(standin):
+            _benchmark(args.batch_size)
+    else:
+        _benchmark(args.batch_size)
@@ -0,0 +1,919 @@
+"""
+Local IMAP stand-in server over a synthetic mailbox, for benchmarks without a Gmail account
+"""
+import io
+import re
+import zlib
+import time
+import base64
+import select
+import logging
+import argparse
+import threading
+import socketserver
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime, date, timezone
+from email.utils import format_datetime
+from typing import List, Dict, Optional, Tuple, Iterator, Callable, Set, Union
+
+from email_mover import compress_uid_set
+from synthetic_mailbox import SyntheticMailbox, encode_header_text
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CAPABILITIES = "IMAP4rev1 AUTH=XOAUTH2 AUTH=PLAIN IDLE MOVE UIDPLUS LITERAL+ COMPRESS=DEFLATE ENABLE CONDSTORE QRESYNC"
+GMAIL_CAPABILITY = "X-GM-EXT-1"
+SYSTEM_FLAGS = "\\Answered \\Flagged \\Deleted \\Seen \\Draft"
+HIERARCHY_DELIMITER = "/"
+# How often an IDLE session checks for new mail in its folder
+IDLE_POLL_SECONDS = 0.05
+
+Token = Union[str, list]
+
+class _DeflateStream(io.RawIOBase):
+    """Both directions of a connection after COMPRESS DEFLATE (RFC 4978, raw DEFLATE).
+
+    Replaces the handler's rfile and wfile: reads inflate what arrives on the socket and
+    every write is deflated and sync-flushed, so each response goes out whole.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.pending = b'' # Inflated bytes not read yet
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            data = self._sock.recv(16384)
+            if not data:
+                return 0
+            self.pending = self._decompressor.decompress(data)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def write(self, data) -> int:
+        self._sock.sendall(self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        return len(data)
+
+class StandinFolder:
+    """UIDs of one folder (ascending) and the synthetic message id behind each."""
+
+    def __init__(self, name: str, uidvalidity: int, special_use: Optional[str] = None):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.special_use = special_use
+        self.uids = array('L')
+        self.msg_ids = array('L')
+        self.uidnext = 1
+        self.vanished: List[Tuple[int, int]] = [] # (UID, MODSEQ of its expunge), for QRESYNC
+        # True while message dates are non-decreasing in UID order, enabling bisected SINCE/BEFORE
+        self.date_sorted = True
+
+    def append(self, msg_id: int, mailbox: SyntheticMailbox) -> int:
+        if self.msg_ids and mailbox.date_of(msg_id) < mailbox.date_of(self.msg_ids[-1]):
+            self.date_sorted = False
+        uid = self.uidnext
+        self.uids.append(uid)
+        self.msg_ids.append(msg_id)
+        self.uidnext += 1
+        return uid
+
+    def remove(self, uid: int) -> Optional[Tuple[int, int]]:
+        """Removes `uid`. Returns (sequence number it had, message id), or None if absent."""
+        index = bisect_left(self.uids, uid)
+        if index == len(self.uids) or self.uids[index] != uid:
+            return None
+        msg_id = self.msg_ids[index]
+        del self.uids[index]
+        del self.msg_ids[index]
+        return index + 1, msg_id
+
+    def uid_of(self, msg_id: int) -> Optional[int]:
+        try:
+            return self.uids[self.msg_ids.index(msg_id)]
+        except ValueError:
+            return None
+
+class StandinStore:
+    """Folders and flags shared by all connections of one StandinIMAPServer."""
+
+    def __init__(self, mailbox: SyntheticMailbox):
+        self.mailbox = mailbox
+        self.lock = threading.RLock()
+        self.folders: Dict[str, StandinFolder] = {}
+        self._flags: Dict[int, Set[str]] = {} # Flag changes by message id; otherwise the generated flags apply
+        # CONDSTORE: one MODSEQ counter for every folder; messages never changed have MODSEQ 1
+        self.highestmodseq = 1
+        self._modseq: Dict[int, int] = {}
+        inbox = self.create('INBOX')
+        inbox.uids = array('L', range(1, mailbox.count + 1))
+        inbox.msg_ids = array('L', range(1, mailbox.count + 1))
+        inbox.uidnext = mailbox.count + 1
+
+    def create(self, name: str, special_use: Optional[str] = None) -> StandinFolder:
+        folder = StandinFolder(name, uidvalidity=len(self.folders) + 1, special_use=special_use)
+        self.folders[name] = folder
+        return folder
+
+    def flags(self, msg_id: int) -> Set[str]:
+        if msg_id not in self._flags:
+            return set(self.mailbox.message(msg_id).flags)
+        return self._flags[msg_id]
+
+    def set_flags(self, msg_id: int, flags: Set[str]) -> None:
+        self._flags[msg_id] = flags
+        self.touch(msg_id)
+
+    def modseq(self, msg_id: int) -> int:
+        return self._modseq.get(msg_id, 1)
+
+    def touch(self, msg_id: Optional[int] = None) -> int:
+        """Advances HIGHESTMODSEQ for a change; a given message gets the new MODSEQ."""
+        self.highestmodseq += 1
+        if msg_id is not None:
+            self._modseq[msg_id] = self.highestmodseq
+        return self.highestmodseq
+
+    def add(self, folder: StandinFolder, msg_id: int) -> int:
+        """Appends a message to `folder`. Returns its UID there."""
+        self.touch(msg_id)
+        return folder.append(msg_id, self.mailbox)
+
+    def remove(self, folder: StandinFolder, uid: int) -> Optional[Tuple[int, int]]:
+        """Expunges `uid` from `folder`, as StandinFolder.remove, logging it for VANISHED."""
+        removed = folder.remove(uid)
+        if removed:
+            folder.vanished.append((uid, self.touch()))
+        return removed
+
+    def labels(self, msg_id: int) -> List[str]:
+        """Gmail view of a message: \\Inbox plus one label per other folder holding it."""
+        return [('\\Inbox' if name == 'INBOX' else name) for name, folder in self.folders.items()
+                if msg_id in folder.msg_ids]
+
+    def deliver(self, count: int = 1, folder: str = 'INBOX') -> List[int]:
+        """Adds `count` new messages to `folder`. Returns their UIDs."""
+        with self.lock:
+            target = self.folders[folder]
+            return [self.add(target, self.mailbox.deliver()) for _ in range(count)]
+
+def _quote(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"NIL"
+    data = value.encode('utf-8')
+    if b"\r" in data or b"\n" in data or any(byte > 0x7e for byte in data):
+        return b"{%d}\r\n%s" % (len(data), data)
+    return b'"' + data.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+def _literal(data: bytes) -> bytes:
+    return b"{%d}\r\n%s" % (len(data), data)
+
+def _address(name: Optional[str], address: str) -> bytes:
+    mailbox, _, host = address.partition('@')
+    encoded_name = encode_header_text(name) if name else None
+    return b"((" + b" ".join([_quote(encoded_name), b"NIL", _quote(mailbox), _quote(host)]) + b"))"
+
+def _imap_date(value: str) -> date:
+    return datetime.strptime(value, "%d-%b-%Y").date()
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    """One client connection: reads tagged commands and writes IMAP responses."""
+
+    # Unbuffered reads, so select() during IDLE sees every byte the client has sent
+    rbufsize = 0
+
+    def setup(self) -> None:
+        super().setup()
+        self.store: StandinStore = self.server.store
+        self.selected: Optional[StandinFolder] = None
+        self.readonly = True
+        self.known_exists = 0
+        self.enabled: Set[str] = set() # Extensions turned on with ENABLE (CONDSTORE, QRESYNC)
+
+    # --- wire helpers -------------------------------------------------------------------
+
+    def send(self, data: bytes) -> None:
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def untagged(self, text: str) -> None:
+        self.send(f"* {text}\r\n".encode('utf-8'))
+
+    def read_command(self) -> Optional[str]:
+        """Reads one command line, inlining any {n} literals as quoted strings."""
+        parts: List[str] = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return None
+            text = line.decode('utf-8', errors='replace').rstrip("\r\n")
+            match = re.search(r"\{(\d+)(\+?)\}$", text)
+            if not match:
+                parts.append(text)
+                return "".join(parts)
+            parts.append(text[:match.start()])
+            if not match.group(2):
+                self.send(b"+ Ready for literal data\r\n")
+            literal = self.rfile.read(int(match.group(1))).decode('utf-8', errors='replace')
+            parts.append('"' + literal.replace('\\', '\\\\').replace('"', '\\"') + '"')
+
+    @staticmethod
+    def tokenize(text: str) -> List[Token]:
+        """Splits command arguments into atoms, quoted strings and nested lists.
+
+        Atoms keep bracketed sections intact, e.g. BODY.PEEK[HEADER.FIELDS (LIST-ID)]<0.100>.
+        """
+        stack: List[List[Token]] = [[]]
+        i, n = 0, len(text)
+        while i < n:
+            char = text[i]
+            if char == ' ':
+                i += 1
+            elif char == '(':
+                stack.append([])
+                i += 1
+            elif char == ')':
+                inner = stack.pop()
+                stack[-1].append(inner)
+                i += 1
+            elif char == '"':
+                i += 1
+                value = []
+                while i < n and text[i] != '"':
+                    if text[i] == '\\' and i + 1 < n:
+                        i += 1
+                    value.append(text[i])
+                    i += 1
+                stack[-1].append("".join(value))
+                i += 1
+            else:
+                start, depth = i, 0
+                while i < n and (depth or text[i] not in ' ()'):
+                    if text[i] == '[':
+                        depth += 1
+                    elif text[i] == ']':
+                        depth -= 1
+                    i += 1
+                stack[-1].append(text[start:i])
+        return stack[0]
+
+    # --- command loop -------------------------------------------------------------------
+
+    def handle(self) -> None:
+        self.untagged(f"OK [CAPABILITY {self.server.capabilities}] IMAP stand-in ready")
+        try:
+            while True:
+                line = self.read_command()
+                if line is None:
+                    return
+                tag, _, rest = line.partition(' ')
+                command, _, args = rest.partition(' ')
+                command = command.upper()
+                uid = command == 'UID'
+                if uid:
+                    command, _, args = args.partition(' ')
+                    command = command.upper()
+                delay = self.server.latency.get(command, self.server.default_latency)
+                if delay:
+                    time.sleep(delay)
+                handler = getattr(self, f"cmd_{command.lower()}", None)
+                if not tag or handler is None:
+                    self.send(f"{tag or '*'} BAD Unknown command {command}\r\n".encode('utf-8'))
+                    continue
+                try:
+                    if command in ('AUTHENTICATE', 'IDLE'):
+                        # Interactive commands handle their own locking
+                        result = handler(tag, self.tokenize(args), uid)
+                    else:
+                        with self.store.lock:
+                            result = handler(tag, self.tokenize(args), uid)
+                except Exception as e:
+                    logging.error(f"Stand-in failed on '{command}': {e}", exc_info=True)
+                    result = f"BAD {e}"
+                self.send(f"{tag} {result}\r\n".encode('utf-8'))
+                if command == 'LOGOUT':
+                    return
+                if command == 'COMPRESS' and result.startswith('OK'):
+                    # Everything after the tagged OK is compressed, in both directions
+                    self.rfile = self.wfile = _DeflateStream(self.connection)
+        except (ConnectionError, OSError):
+            return
+
+    # --- commands -----------------------------------------------------------------------
+
+    def cmd_capability(self, tag, args, uid) -> str:
+        self.untagged(f"CAPABILITY {self.server.capabilities}")
+        return "OK CAPABILITY completed"
+
+    def cmd_noop(self, tag, args, uid) -> str:
+        self._report_new_messages()
+        return "OK NOOP completed"
+
+    def cmd_logout(self, tag, args, uid) -> str:
+        self.untagged("BYE Logging out")
+        return "OK LOGOUT completed"
+
+    def cmd_login(self, tag, args, uid) -> str:
+        return f"OK [CAPABILITY {self.server.capabilities}] Logged in"
+
+    def cmd_authenticate(self, tag, args, uid) -> str:
+        mechanism = str(args[0]).upper() if args else ''
+        if mechanism not in ('XOAUTH2', 'PLAIN'):
+            return "NO Unsupported authentication mechanism"
+        if len(args) > 1:
+            response = str(args[1]) # SASL-IR
+        else:
+            self.send(b"+ \r\n")
+            response = self.rfile.readline().decode('ascii', errors='replace').strip()
+        if mechanism == 'XOAUTH2':
+            fields = base64.b64decode(response).decode('utf-8', errors='replace').split('\x01')
+            token = next((f.split('Bearer ', 1)[1] for f in fields if f.startswith('auth=Bearer ')), '')
+            accepted = self.server.accept_token
+            if accepted is not None and not accepted(token):
+                return "NO [AUTHENTICATIONFAILED] Invalid credentials"
+        return f"OK [CAPABILITY {self.server.capabilities}] Authenticated"
+
+    def cmd_enable(self, tag, args, uid) -> str:
+        offered = self.server.capabilities.split()
+        enabled = [ext for ext in (str(arg).upper() for arg in args)
+                   if ext in ('CONDSTORE', 'QRESYNC') and ext in offered]
+        self.enabled.update(enabled)
+        if 'QRESYNC' in self.enabled:
+            self.enabled.add('CONDSTORE') # QRESYNC implies CONDSTORE
+        self.untagged("ENABLED" + "".join(f" {ext}" for ext in enabled))
+        return "OK ENABLE completed"
+
+    def cmd_compress(self, tag, args, uid) -> str:
+        if 'COMPRESS=DEFLATE' not in self.server.capabilities.split():
+            return "BAD COMPRESS not supported"
+        if isinstance(self.rfile, _DeflateStream):
+            return "NO [COMPRESSIONACTIVE] DEFLATE already active"
+        if not args or str(args[0]).upper() != 'DEFLATE':
+            return "NO Unsupported compression mechanism"
+        return "OK DEFLATE active"
+
+    def _select(self, args, readonly: bool) -> str:
+        folder = self.store.folders.get(str(args[0]) if args else '')
+        if folder is None:
+            self.selected = None
+            return "NO [NONEXISTENT] Unknown mailbox"
+        self.selected, self.readonly = folder, readonly
+        self.known_exists = len(folder.uids)
+        self.untagged(f"FLAGS ({SYSTEM_FLAGS})")
+        self.untagged(f"OK [PERMANENTFLAGS ({SYSTEM_FLAGS} \\*)] Flags permitted")
+        self.untagged(f"{self.known_exists} EXISTS")
+        self.untagged("0 RECENT")
+        self.untagged(f"OK [UIDVALIDITY {folder.uidvalidity}] UIDs valid")
+        self.untagged(f"OK [UIDNEXT {folder.uidnext}] Predicted next UID")
+        if 'CONDSTORE' in self.enabled:
+            self.untagged(f"OK [HIGHESTMODSEQ {self.store.highestmodseq}] Highest")
+        return f"OK [{'READ-ONLY' if readonly else 'READ-WRITE'}] Selected"
+
+    def cmd_select(self, tag, args, uid) -> str:
+        return self._select(args, readonly=False)
+
+    def cmd_examine(self, tag, args, uid) -> str:
+        return self._select(args, readonly=True)
+
+    def cmd_close(self, tag, args, uid) -> str:
+        self.selected = None
+        return "OK CLOSE completed"
+
+    def cmd_unselect(self, tag, args, uid) -> str:
+        self.selected = None
+        return "OK UNSELECT completed"
+
+    def cmd_create(self, tag, args, uid) -> str:
+        name = str(args[0]).rstrip(HIERARCHY_DELIMITER)
+        if name.upper() == 'INBOX' or name in self.store.folders:
+            return "NO [ALREADYEXISTS] Mailbox exists"
+        self.store.create(name)
+        return "OK CREATE completed"
+
+    def cmd_delete(self, tag, args, uid) -> str:
+        name = str(args[0])
+        if name.upper() == 'INBOX' or name not in self.store.folders:
+            return "NO [NONEXISTENT] Unknown mailbox"
+        del self.store.folders[name]
+        return "OK DELETE completed"
+
+    def cmd_list(self, tag, args, uid) -> str:
+        reference, pattern = str(args[0]), str(args[1])
+        regex = re.compile("^" + "".join(
+            ".*" if c == '*' else f"[^{re.escape(HIERARCHY_DELIMITER)}]*" if c == '%' else re.escape(c)
+            for c in reference + pattern) + "$")
+        names = list(self.store.folders)
+        for name, folder in self.store.folders.items():
+            if not regex.match(name):
+                continue
+            has_children = any(other.startswith(name + HIERARCHY_DELIMITER) for other in names)
+            flags = ["\\HasChildren" if has_children else "\\HasNoChildren"]
+            if folder.special_use:
+                flags.append(folder.special_use)
+            self.send(b'* LIST (%s) "%s" %s\r\n' % (" ".join(flags).encode('ascii'),
+                                                    HIERARCHY_DELIMITER.encode('ascii'), _quote(name)))
+        return "OK LIST completed"
+
+    def cmd_status(self, tag, args, uid) -> str:
+        folder = self.store.folders.get(str(args[0]))
+        if folder is None:
+            return "NO [NONEXISTENT] Unknown mailbox"
+        values = {'MESSAGES': len(folder.uids), 'UIDNEXT': folder.uidnext, 'UIDVALIDITY': folder.uidvalidity,
+                  'RECENT': 0, 'UNSEEN': sum(1 for m in folder.msg_ids if '\\Seen' not in self.store.flags(m)),
+                  'HIGHESTMODSEQ': self.store.highestmodseq}
+        items = " ".join(f"{item} {values[str(item).upper()]}" for item in args[1] if str(item).upper() in values)
+        self.send(b"* STATUS %s (%s)\r\n" % (_quote(folder.name), items.encode('ascii')))
+        return "OK STATUS completed"
+
+    # --- message sets -------------------------------------------------------------------
+
+    @staticmethod
+    def _ranges(message_set: str, largest: int) -> List[Tuple[int, int]]:
+        """(low, high) bounds of each part of a message set, with '*' standing for `largest`."""
+        ranges = []
+        for part in message_set.split(','):
+            low, _, high = part.partition(':')
+            low_value = largest if low == '*' else int(low)
+            high_value = low_value if not high else largest if high == '*' else int(high)
+            ranges.append((min(low_value, high_value), max(low_value, high_value)))
+        return ranges
+
+    def _indices(self, message_set: str, uid: bool) -> List[int]:
+        """Positions in the selected folder addressed by a UID or sequence set, ascending."""
+        folder = self.selected
+        total = len(folder.uids)
+        if not total:
+            return []
+        largest = folder.uids[-1] if uid else total
+        indices: Set[int] = set()
+        for low_value, high_value in self._ranges(message_set, largest):
+            if uid:
+                indices.update(range(bisect_left(folder.uids, low_value), bisect_right(folder.uids, high_value)))
+            else:
+                indices.update(range(max(low_value, 1) - 1, min(high_value, total)))
+        return sorted(indices)
+
+    # --- SEARCH -------------------------------------------------------------------------
+
+    def _date_bounds(self, day: date, after: bool) -> int:
+        """First position whose message date is >= day (after=False) or > day (after=True)."""
+        folder, mailbox = self.selected, self.store.mailbox
+        key = lambda msg_id: mailbox.date_of(msg_id).astimezone(timezone.utc).date()
+        return (bisect_right if after else bisect_left)(folder.msg_ids, day, key=key)
+
+    def _criterion(self, tokens: List[Token], candidates: range) -> Tuple[range, Optional[Callable[[int], bool]]]:
+        """Consumes one search key. Returns narrowed candidates and an optional extra predicate."""
+        folder, store = self.selected, self.store
+        token = tokens.pop(0)
+        if isinstance(token, list):
+            sub_tokens, predicates = list(token), []
+            while sub_tokens:
+                candidates, predicate = self._criterion(sub_tokens, candidates)
+                if predicate:
+                    predicates.append(predicate)
+            return candidates, (lambda i: all(p(i) for p in predicates)) if predicates else None
+        key = token.upper()
+
+        def matcher(sub_tokens: List[Token]) -> Callable[[int], bool]:
+            everything = range(len(folder.uids))
+            narrowed, predicate = self._criterion(sub_tokens, everything)
+            return lambda i: i in narrowed and (predicate is None or predicate(i))
+
+        def message_date(i: int) -> date:
+            return store.mailbox.date_of(folder.msg_ids[i]).astimezone(timezone.utc).date()
+
+        def intersect(low: int, high: int) -> range:
+            return range(max(candidates.start, low), min(candidates.stop, high))
+
+        if key == 'ALL':
+            return candidates, None
+        if key in ('SINCE', 'BEFORE', 'ON', 'SENTSINCE', 'SENTBEFORE', 'SENTON'):
+            day = _imap_date(str(tokens.pop(0)))
+            if folder.date_sorted:
+                if key in ('SINCE', 'SENTSINCE'):
+                    return intersect(self._date_bounds(day, False), len(folder.uids)), None
+                if key in ('BEFORE', 'SENTBEFORE'):
+                    return intersect(0, self._date_bounds(day, False)), None
+                return intersect(self._date_bounds(day, False), self._date_bounds(day, True)), None
+            if key in ('SINCE', 'SENTSINCE'):
+                return candidates, lambda i: message_date(i) >= day
+            if key in ('BEFORE', 'SENTBEFORE'):
+                return candidates, lambda i: message_date(i) < day
+            return candidates, lambda i: message_date(i) == day
+        if key == 'X-GM-RAW' and GMAIL_CAPABILITY in self.server.capabilities:
+            bounds = dict(term.split(':', 1) for term in str(tokens.pop(0)).split())
+            if set(bounds) - {'after', 'before'}:
+                raise ValueError(f"Unsupported X-GM-RAW terms {sorted(bounds)}")
+            after, before = float(bounds.get('after', '-inf')), float(bounds.get('before', 'inf'))
+
+            def in_window(i: int) -> bool:
+                stamp = store.mailbox.date_of(folder.msg_ids[i]).timestamp()
+                return after <= stamp < before
+            return candidates, in_window
+        if key == 'UID' or re.fullmatch(r"[\d*:,]+", key):
+            wanted = set(self._indices(str(tokens.pop(0)) if key == 'UID' else key, uid=key == 'UID'))
+            return candidates, lambda i: i in wanted
+        if key == 'NOT':
+            inner = matcher(tokens)
+            return candidates, lambda i: not inner(i)
+        if key == 'OR':
+            left, right = matcher(tokens), matcher(tokens)
+            return candidates, lambda i: left(i) or right(i)
+        flag_keys = {'SEEN': '\\Seen', 'ANSWERED': '\\Answered', 'FLAGGED': '\\Flagged',
+                     'DELETED': '\\Deleted', 'DRAFT': '\\Draft'}
+        if key in flag_keys:
+            flag = flag_keys[key]
+            return candidates, lambda i: flag in store.flags(folder.msg_ids[i])
+        if key.startswith('UN') and key[2:] in flag_keys:
+            flag = flag_keys[key[2:]]
+            return candidates, lambda i: flag not in store.flags(folder.msg_ids[i])
+        if key in ('HEADER', 'SUBJECT', 'FROM', 'TO', 'TEXT', 'BODY'):
+            field = str(tokens.pop(0)).lower() if key == 'HEADER' else key.lower()
+            needle = str(tokens.pop(0)).lower()
+
+            def contains(i: int) -> bool:
+                message = store.mailbox.message(folder.msg_ids[i])
+                if field in ('text', 'body'):
+                    haystack = store.mailbox.rfc822(message) if field == 'text' else message.body.encode('utf-8')
+                    return needle in haystack.decode('utf-8').lower()
+                values = store.mailbox.header_fields(message, [field]).decode('utf-8').lower()
+                return needle in values
+            return candidates, contains
+        raise ValueError(f"Unsupported search key {key}")
+
+    def cmd_search(self, tag, args, uid) -> str:
+        if self.selected is None:
+            return "BAD No mailbox selected"
+        tokens = list(args)
+        if tokens and str(tokens[0]).upper() == 'CHARSET':
+            tokens = tokens[2:]
+        candidates: range = range(len(self.selected.uids))
+        predicates: List[Callable[[int], bool]] = []
+        while tokens:
+            candidates, predicate = self._criterion(tokens, candidates)
+            if predicate:
+                predicates.append(predicate)
+        matches = [i for i in candidates if all(p(i) for p in predicates)]
+        numbers = [self.selected.uids[i] for i in matches] if uid else [i + 1 for i in matches]
+        self.send(("* SEARCH" + "".join(f" {n}" for n in numbers) + "\r\n").encode('ascii'))
+        return "OK SEARCH completed"
+
+    # --- FETCH --------------------------------------------------------------------------
+
+    def _envelope(self, msg_id: int) -> bytes:
+        message = self.store.mailbox.message(msg_id)
+        sender = _address(message.from_name, message.from_addr)
+        return b"(" + b" ".join([
+            _quote(format_datetime(message.date)), _quote(message.subject),
+            sender, sender, sender, _address(None, message.to_addr),
+            b"NIL", b"NIL", b"NIL", _quote(message.message_id),
+        ]) + b")"
+
+    def _fetch_item(self, item: str, msg_id: int) -> bytes:
+        mailbox = self.store.mailbox
+        name = item.upper()
+        if name == 'ENVELOPE':
+            return b"ENVELOPE " + self._envelope(msg_id)
+        if name == 'X-GM-LABELS':
+            return b"X-GM-LABELS " + self._labels(msg_id)
+        if name == 'FLAGS':
+            return b"FLAGS (" + " ".join(sorted(self.store.flags(msg_id))).encode('ascii') + b")"
+        if name == 'MODSEQ':
+            return b"MODSEQ (%d)" % self.store.modseq(msg_id)
+        if name == 'INTERNALDATE':
+            stamp = mailbox.date_of(msg_id).strftime("%d-%b-%Y %H:%M:%S %z")
+            return b'INTERNALDATE "' + stamp.encode('ascii') + b'"'
+        if name == 'RFC822.SIZE':
+            return b"RFC822.SIZE %d" % len(mailbox.rfc822(mailbox.message(msg_id)))
+        if name in ('BODYSTRUCTURE', 'BODY'):
+            message = mailbox.message(msg_id)
+            body = message.body.encode('utf-8')
+            return (b'%s ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "8BIT" %d %d NIL NIL NIL NIL)'
+                    % (name.encode('ascii'), len(body), body.count(b"\r\n")))
+        if name in ('RFC822', 'RFC822.HEADER', 'RFC822.TEXT'):
+            item = {'RFC822': 'BODY[]', 'RFC822.HEADER': 'BODY[HEADER]', 'RFC822.TEXT': 'BODY[TEXT]'}[name]
+            data = self._section(item, msg_id)
+            return name.encode('ascii') + b" " + _literal(data)
+        match = re.fullmatch(r"BODY(?:\.PEEK)?\[(.*)\](?:<(\d+)(?:\.(\d+))?>)?", item, re.IGNORECASE)
+        if not match:
+            raise ValueError(f"Unsupported fetch item {item}")
+        section, offset, length = match.group(1), match.group(2), match.group(3)
+        data = self._section(f"BODY[{section}]", msg_id)
+        label = f"BODY[{section.upper() if section.upper().startswith('HEADER') else section}]"
+        if offset is not None:
+            start = int(offset)
+            data = data[start:start + int(length)] if length else data[start:]
+            label += f"<{start}>"
+        return label.encode('ascii') + b" " + _literal(data)
+
+    def _section(self, item: str, msg_id: int) -> bytes:
+        mailbox = self.store.mailbox
+        message = mailbox.message(msg_id)
+        section = item[len("BODY["):-1]
+        upper = section.upper()
+        if upper == '':
+            return mailbox.rfc822(message)
+        if upper == 'HEADER':
+            return mailbox.header_block(message)
+        if upper in ('TEXT', '1'):
+            return message.body.encode('utf-8')
+        if upper.startswith('HEADER.FIELDS'):
+            names = self.tokenize(section[len('HEADER.FIELDS'):].strip())[0]
+            return mailbox.header_fields(message, [str(n) for n in names])
+        raise ValueError(f"Unsupported body section {section}")
+
+    def cmd_fetch(self, tag, args, uid) -> str:
+        if self.selected is None:
+            return "BAD No mailbox selected"
+        message_set, items = str(args[0]), args[1]
+        items = [str(i) for i in items] if isinstance(items, list) else [str(items)]
+        macros = {'ALL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE'],
+                  'FAST': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE'],
+                  'FULL': ['FLAGS', 'INTERNALDATE', 'RFC822.SIZE', 'ENVELOPE', 'BODY']}
+        if len(items) == 1 and items[0].upper() in macros:
+            items = macros[items[0].upper()]
+        if uid:
+            items = ['UID'] + [i for i in items if i.upper() != 'UID']
+        # CONDSTORE/QRESYNC modifiers, e.g. (CHANGEDSINCE 1234 VANISHED)
+        modifiers = [str(m).upper() for m in args[2]] if len(args) > 2 and isinstance(args[2], list) else []
+        changed_since = int(modifiers[modifiers.index('CHANGEDSINCE') + 1]) if 'CHANGEDSINCE' in modifiers else None
+        if changed_since is not None and 'MODSEQ' not in (i.upper() for i in items):
+            items.append('MODSEQ')
+        if 'VANISHED' in modifiers:
+            if not uid or changed_since is None or 'QRESYNC' not in self.enabled:
+                return "BAD VANISHED requires UID FETCH, CHANGEDSINCE and ENABLE QRESYNC"
+            self._report_vanished(message_set, changed_since)
+        for index in self._indices(message_set, uid):
+            msg_id = self.selected.msg_ids[index]
+            if changed_since is not None and self.store.modseq(msg_id) <= changed_since:
+                continue
+            parts = [b"UID %d" % self.selected.uids[index] if item.upper() == 'UID'
+                     else self._fetch_item(item, msg_id) for item in items]
+            self.send(b"* %d FETCH (%s)\r\n" % (index + 1, b" ".join(parts)))
+        return "OK FETCH completed"
+
+    def _report_vanished(self, message_set: str, changed_since: int) -> None:
+        """VANISHED (EARLIER) for UIDs of the set expunged after MODSEQ `changed_since`."""
+        ranges = self._ranges(message_set, self.selected.uidnext - 1)
+        uids = sorted(expunged for expunged, modseq in self.selected.vanished
+                      if modseq > changed_since and any(low <= expunged <= high for low, high in ranges))
+        if uids:
+            self.untagged(f"VANISHED (EARLIER) {compress_uid_set(uids)}")
+
+    # --- changes --------------------------------------------------------------------------
+
+    def _labels(self, msg_id: int) -> bytes:
+        return b"(" + b" ".join(label.encode('ascii') if label.startswith('\\') else _quote(label)
+                                for label in self.store.labels(msg_id)) + b")"
+
+    def _store_labels(self, indices: List[int], action: str, labels: Set[str]) -> None:
+        """Gmail label STORE: a label is membership of the folder of that name (\\Inbox is INBOX)."""
+        pairs = [(self.selected.uids[i], self.selected.msg_ids[i]) for i in indices]
+        leaving: List[int] = [] # UIDs removed from the selected folder, reported as EXPUNGE
+        for message_uid, msg_id in pairs:
+            for label in labels:
+                name = 'INBOX' if label.upper() == '\\INBOX' else label
+                folder = self.store.folders.get(name)
+                if action.startswith('+'):
+                    folder = folder or self.store.create(name) # Gmail creates unknown labels
+                    if msg_id not in folder.msg_ids:
+                        self.store.add(folder, msg_id)
+                elif folder is self.selected:
+                    leaving.append(message_uid)
+                elif folder is not None and folder.uid_of(msg_id) is not None:
+                    self.store.remove(folder, folder.uid_of(msg_id))
+        if not action.endswith('.SILENT'):
+            for index, (message_uid, msg_id) in zip(indices, pairs):
+                self.send(b"* %d FETCH (UID %d X-GM-LABELS %s)\r\n" % (index + 1, message_uid, self._labels(msg_id)))
+        self._expunge(leaving)
+
+    def cmd_store(self, tag, args, uid) -> str:
+        if self.selected is None or self.readonly:
+            return "NO Mailbox is read-only"
+        message_set, action = str(args[0]), str(args[1]).upper()
+        flags = {str(f) for f in args[2]} if isinstance(args[2], list) else {str(args[2])}
+        if 'X-GM-LABELS' in action:
+            if GMAIL_CAPABILITY not in self.server.capabilities:
+                return "BAD X-GM-LABELS not supported"
+            self._store_labels(self._indices(message_set, uid), action, flags)
+            return "OK STORE completed"
+        for index in self._indices(message_set, uid):
+            msg_id = self.selected.msg_ids[index]
+            current = set(self.store.flags(msg_id))
+            if action.startswith('+'):
+                current |= flags
+            elif action.startswith('-'):
+                current -= flags
+            else:
+                current = set(flags)
+            self.store.set_flags(msg_id, current)
+            if not action.endswith('.SILENT'):
+                modseq = b" MODSEQ (%d)" % self.store.modseq(msg_id) if 'CONDSTORE' in self.enabled else b""
+                self.send(b"* %d FETCH (UID %d FLAGS (%s)%s)\r\n" % (
+                    index + 1, self.selected.uids[index], " ".join(sorted(current)).encode('ascii'), modseq))
+        return "OK STORE completed"
+
+    def _copy(self, args, uid) -> Tuple[Optional[str], List[int], List[int]]:
+        if self.selected is None:
+            return "BAD No mailbox selected", [], []
+        target = self.store.folders.get(str(args[1]))
+        if target is None:
+            return "NO [TRYCREATE] Mailbox doesn't exist", [], []
+        indices = self._indices(str(args[0]), uid)
+        source_uids = [self.selected.uids[i] for i in indices]
+        target_uids = [self.store.add(target, self.selected.msg_ids[i]) for i in indices]
+        return None, source_uids, target_uids
+
+    def cmd_copy(self, tag, args, uid) -> str:
+        error, source_uids, target_uids = self._copy(args, uid)
+        if error:
+            return error
+        if not source_uids:
+            return "OK COPY completed (no messages)"
+        target = self.store.folders[str(args[1])]
+        return f"OK [COPYUID {target.uidvalidity} {compress_uid_set(source_uids)} {compress_uid_set(target_uids)}] COPY completed"
+
+    def cmd_move(self, tag, args, uid) -> str:
+        if self.readonly:
+            return "NO Mailbox is read-only"
+        error, source_uids, target_uids = self._copy(args, uid)
+        if error:
+            return error
+        if source_uids:
+            target = self.store.folders[str(args[1])]
+            self.untagged(f"OK [COPYUID {target.uidvalidity} {compress_uid_set(source_uids)} {compress_uid_set(target_uids)}] Moved")
+            self._expunge(source_uids)
+        return "OK MOVE completed"
+
+    def _expunge(self, uids: List[int]) -> None:
+        vanished: List[int] = [] # With QRESYNC enabled, expunges are reported as VANISHED UIDs
+        for source_uid in uids:
+            removed = self.store.remove(self.selected, source_uid)
+            if removed and 'QRESYNC' in self.enabled:
+                vanished.append(source_uid)
+            elif removed:
+                self.untagged(f"{removed[0]} EXPUNGE")
+        if vanished:
+            self.untagged(f"VANISHED {compress_uid_set(vanished)}")
+        self.known_exists = len(self.selected.uids)
+
+    def cmd_expunge(self, tag, args, uid) -> str:
+        if self.selected is None or self.readonly:
+            return "NO Mailbox is read-only"
+        allowed = set(self._indices(str(args[0]), True)) if uid else None
+        deleted = [self.selected.uids[i] for i in range(len(self.selected.uids))
+                   if (allowed is None or i in allowed)
+                   and '\\Deleted' in self.store.flags(self.selected.msg_ids[i])]
+        self._expunge(deleted)
+        return "OK EXPUNGE completed"
+
+    # --- IDLE -----------------------------------------------------------------------------
+
+    def _report_new_messages(self) -> None:
+        if self.selected is not None and len(self.selected.uids) != self.known_exists:
+            self.known_exists = len(self.selected.uids)
+            self.untagged(f"{self.known_exists} EXISTS")
+
+    def cmd_idle(self, tag, args, uid) -> str:
+        self.send(b"+ idling\r\n")
+        while True:
+            with self.store.lock:
+                self._report_new_messages()
+            # Inflated input already read off the socket would not wake select()
+            readable = getattr(self.rfile, 'pending', b'') or \
+                select.select([self.connection], [], [], IDLE_POLL_SECONDS)[0]
+            if readable:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b'DONE':
+                    return "OK IDLE terminated"
+
+class StandinIMAPServer(socketserver.ThreadingTCPServer):
+    """Plain-TCP IMAP server on localhost over a SyntheticMailbox.
+
+    Supports what the app issues (CAPABILITY, AUTHENTICATE XOAUTH2, SELECT/EXAMINE, LIST,
+    CREATE, DELETE, STATUS, UID SEARCH/FETCH/MOVE/COPY/STORE/EXPUNGE, NOOP, IDLE,
+    COMPRESS DEFLATE, ENABLE CONDSTORE/QRESYNC with HIGHESTMODSEQ, CHANGEDSINCE and
+    VANISHED), so connect_oauth (with stub_oauth), fetch_inbox_emails, move_emails and
+    delta_sync_emails run unchanged against it. `latency` adds a per-command delay in
+    seconds (e.g. {'FETCH': 0.05}) to simulate a remote server; `default_latency` applies to the rest. Tokens are accepted unless `accept_token` rejects them.
+    `gmail` adds X-GM-EXT-1 (X-GM-LABELS as folder membership, X-GM-RAW after:/before:), and
+    `capabilities` replaces the advertised list, e.g. to drop MOVE or UIDPLUS.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mailbox: Optional[SyntheticMailbox] = None, host: str = '127.0.0.1', port: int = 0,
+                 latency: Optional[Dict[str, float]] = None, default_latency: float = 0.0,
+                 accept_token: Optional[Callable[[str], bool]] = None,
+                 gmail: bool = False, capabilities: Optional[str] = None):
+        self.store = StandinStore(mailbox or SyntheticMailbox())
+        self.capabilities = (capabilities or CAPABILITIES) + (f" {GMAIL_CAPABILITY}" if gmail else "")
+        self.latency = {command.upper(): delay for command, delay in (latency or {}).items()}
+        self.default_latency = default_latency
+        self.accept_token = accept_token
+        self._thread: Optional[threading.Thread] = None
+        super().__init__((host, port), _IMAPHandler)
+
+    @property
+    def host(self) -> str:
+        return self.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "StandinIMAPServer":
+        """Serves on a background daemon thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="imap-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StandinIMAPServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def deliver(self, count: int = 1, folder: str = 'INBOX') -> List[int]:
+        """Simulates incoming mail; IDLE sessions on `folder` are notified with EXISTS."""
+        return self.store.deliver(count, folder)
+
+    def environ(self) -> Dict[str, str]:
+        """Environment variables pointing email_client at this server."""
+        return {'IMAP_HOST': self.host, 'IMAP_PORT': str(self.port), 'IMAP_SSL': '0'}
+
+class _StubCredentials:
+    def __init__(self, token: str):
+        self.token = token
+        self.valid = True
+        self.expired = False
+
+@contextmanager
+def stub_oauth(server: StandinIMAPServer, user_email: Optional[str] = None,
+               token: str = "standin-token") -> Iterator[None]:
+    """Points email_client at `server` and replaces Google OAuth with fixed credentials.
+
+    Inside the block connect_oauth() (and everything built on it) logs in to the stand-in.
+    """
+    import email_client
+    saved = (email_client.IMAP_HOST, email_client.IMAP_PORT, email_client.IMAP_SSL, email_client.get_credentials)
+    user_email = user_email or server.store.mailbox.user
+    email_client.IMAP_HOST, email_client.IMAP_PORT, email_client.IMAP_SSL = server.host, server.port, False
+    email_client.get_credentials = lambda *args, **kwargs: (_StubCredentials(token), user_email)
+    try:
+        yield
+    finally:
+        email_client.IMAP_HOST, email_client.IMAP_PORT, email_client.IMAP_SSL, email_client.get_credentials = saved
+
+def parse_latency(values: List[str]) -> Tuple[float, Dict[str, float]]:
+    """Parses ['0.01', 'FETCH=0.05'] into (default latency, per-command latencies)."""
+    default, per_command = 0.0, {}
+    for value in values:
+        command, _, delay = value.rpartition('=')
+        if command:
+            per_command[command.upper()] = float(delay)
+        else:
+            default = float(delay)
+    return default, per_command
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a synthetic mailbox over IMAP on localhost. Point the app at it with IMAP_HOST/IMAP_PORT and IMAP_SSL=0.")
+    parser.add_argument('--messages', type=int, default=10000, help="Number of INBOX messages (1k to 1M)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic mailbox")
+    parser.add_argument('--days', type=int, default=365, help="Days of mail the messages are spread over")
+    parser.add_argument('--user', default="user@example.com", help="Mailbox owner address")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1143)
+    parser.add_argument('--latency', action='append', default=[],
+                        help="Seconds per command, e.g. 0.01 for all or FETCH=0.05 for one (repeatable)")
+    parser.add_argument('--gmail', action='store_true', help="Emulate Gmail's X-GM-EXT-1 labels and search")
+    parser.add_argument('--deliver-every', type=float, default=0.0, help="Deliver a new INBOX message every N seconds")
+    args = parser.parse_args()
+
+    default_latency, latency = parse_latency(args.latency)
+    mailbox = SyntheticMailbox(args.messages, seed=args.seed, days=args.days, user=args.user)
+    server = StandinIMAPServer(mailbox, args.host, args.port, latency, default_latency, gmail=args.gmail).start()
+    print(" ".join(f"{k}={v}" for k, v in server.environ().items()), f"# {args.messages} messages for {args.user}")
+    try:
+        while True:
+            time.sleep(args.deliver_every or 3600)
+            if args.deliver_every:
+                server.deliver()
+    except KeyboardInterrupt:
+        server.stop()
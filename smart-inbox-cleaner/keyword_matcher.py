@@ -0,0 +1,95 @@
+"""
+Multi-pattern substring matcher: finds which of several keyword sets occur in a text in one pass
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+# Distinct texts whose scan result is remembered per matcher. Senders and notification
+# subjects repeat a lot across an archive, so most scans are cache hits.
+SCAN_CACHE_SIZE = 8192
+
+class KeywordMatcher:
+    """Named keyword sets compiled into a single regex.
+
+    The pattern is one lookahead over a trie of every keyword (shared prefixes factored
+    out, longer continuations tried first), so findall() reports the longest keyword
+    starting at each position of the text in a single C-level scan.
+    Any other keyword starting at the same position is a prefix of that one, so each
+    keyword's bitmask also carries the sets of its prefixes; OR-ing the masks of the
+    matches gives exactly the sets an `any(keyword in text ...)` per set would find.
+
+    Matching is plain case-sensitive substring matching; callers lower-case both the
+    keywords and the text, as the rules always have.
+    """
+
+    def __init__(self, keyword_sets: Dict[str, Iterable[str]], cache_size: int = SCAN_CACHE_SIZE):
+        self.bits: Dict[str, int] = {}
+        self.keyword_sets: Dict[str, List[str]] = {}
+        own_mask: Dict[str, int] = {}
+        for number, (name, keywords) in enumerate(keyword_sets.items()):
+            self.bits[name] = 1 << number
+            self.keyword_sets[name] = [keyword for keyword in keywords if keyword]
+            for keyword in self.keyword_sets[name]:
+                own_mask[keyword] = own_mask.get(keyword, 0) | self.bits[name]
+        self._masks: Dict[str, int] = {
+            keyword: _prefix_mask(keyword, own_mask) for keyword in own_mask
+        }
+        if own_mask:
+            self._pattern = re.compile("(?=(" + _trie_pattern(_build_trie(own_mask)) + "))")
+        else:
+            self._pattern = re.compile(r"(?!)") # Never matches
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    def mask(self, *names: str) -> int:
+        """Bitmask of the named keyword sets, to test scan() results against."""
+        result = 0
+        for name in names:
+            result |= self.bits[name]
+        return result
+
+    def set_pattern(self, name: str) -> Optional[str]:
+        """Regex matching any keyword of one set, e.g. for pandas str.contains; None if the set is empty."""
+        keywords = self.keyword_sets[name]
+        return _trie_pattern(_build_trie(keywords)) if keywords else None
+
+    def _scan(self, text: str) -> int:
+        """Bitmask of every keyword set with at least one keyword in `text`."""
+        hits = 0
+        masks = self._masks
+        for keyword in self._pattern.findall(text):
+            hits |= masks[keyword]
+        return hits
+
+    def matches(self, text: str) -> List[str]:
+        """Names of the keyword sets found in `text` (for debugging and tests)."""
+        hits = self.scan(text)
+        return [name for name, bit in self.bits.items() if hits & bit]
+
+def _build_trie(keywords: Iterable[str]) -> Dict[str, Any]:
+    """Nested dicts keyed by character; the '' key marks the end of a keyword."""
+    trie: Dict[str, Any] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+def _trie_pattern(node: Dict[str, Any]) -> str:
+    """Regex for the keywords below a trie node, preferring the longest one."""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if '' in node:
+        # A keyword ends here; the greedy optional still tries the longer keywords first
+        return "(?:" + pattern + ")?"
+    return pattern
+
+def _prefix_mask(keyword: str, own_mask: Dict[str, int]) -> int:
+    """Mask of a keyword plus every shorter keyword that is a prefix of it."""
+    mask = 0
+    for length in range(1, len(keyword) + 1):
+        mask |= own_mask.get(keyword[:length], 0)
+    return mask
@@ -10,7 +10,7 @@ from datetime import datetime # Added
 # Using direct import as script is run directly via streamlit
 from categorizer import (
     CAT_ACTION, CAT_READ, CAT_EVENTS, CAT_UNCATEGORISED,
-    RULE_CATEGORIES
+    RULE_CATEGORIES, categorize_by_headers
 )
 
 # --- Load environment variables ---
@@ -54,6 +54,11 @@ def format_llm_prompt(email_data: Dict[str, Any]) -> str:
     """Formats the prompt for the LLM based on email data."""
     subject = email_data.get('subject', 'No Subject')
     sender = email_data.get('from', 'Unknown Sender')
+    # Bulk-mail headers are only present when fetched with the headers profile
+    header_lines = ''.join(f"\n{name.title()}: {value}" for name, value in (email_data.get('headers') or {}).items())
+    # Body snippet is only present when fetched via snippet_fetcher.fetch_snippets
+    snippet = email_data.get('snippet')
+    snippet_line = f"\nBody (beginning): {snippet}" if snippet else ''
     
     # Basic prompt structure - can be refined significantly
     prompt = f"""Analyze the following email metadata and classify it into ONE of the following categories based on GTD principles:
@@ -67,7 +72,7 @@ Category Meanings:
 
 Email Metadata:
 Subject: {subject}
-From: {sender}
+From: {sender}{header_lines}{snippet_line}
 
 Output ONLY the single category name from the list above that best fits this email.
 Category:"""
@@ -121,7 +126,8 @@ def categorize_emails_llm(
     emails: List[Dict[str, Any]], 
     model_name: str = DEFAULT_MODEL, 
     progress_callback: Optional[Callable[[int, int], None]] = None,
-    stop_checker: Optional[Callable[[], bool]] = None
+    stop_checker: Optional[Callable[[], bool]] = None,
+    llm_result_callback: Optional[Callable[[Dict[str, Any]], None]] = None
 ) -> Optional[List[Dict[str, Any]]]:
     """Adds a 'category' key to each email dictionary using an LLM.
     
@@ -135,6 +141,8 @@ def categorize_emails_llm(
         model_name: Name of the Ollama model to use.
         progress_callback: Optional function for progress updates.
         stop_checker: Optional function that returns True if processing should stop.
+        llm_result_callback: Optional function called with each email the LLM itself
+            categorized (not those classified by headers or left out by the limit).
     """
     if not emails:
         return []
@@ -184,6 +192,7 @@ def categorize_emails_llm(
          return emails # Return original list with defaults applied to target emails
 
     processed_count = 0
+    header_classified_count = 0
     # --- Iterate only through the emails selected for processing (sorted newest first if applicable) ---
     for email in emails_to_process: # These are references to dicts in the original 'emails' list
         # --- Check for stop signal --- 
@@ -194,7 +203,15 @@ def categorize_emails_llm(
              
         uid = email.get('uid', 'N/A')
         # --- Apply category TO THE ORIGINAL EMAIL DICT via the reference --- 
-        email['category'] = categorize_email_llm(email, model_name)
+        # Bulk mail with conclusive List-*/Precedence/Auto-Submitted headers never needs the LLM
+        header_category = categorize_by_headers(email)
+        if header_category:
+            email['category'] = header_category
+            header_classified_count += 1
+        else:
+            email['category'] = categorize_email_llm(email, model_name)
+            if llm_result_callback:
+                llm_result_callback(email)
         processed_count += 1
         
         if progress_callback:
@@ -204,7 +221,8 @@ def categorize_emails_llm(
             except Exception as cb_err:
                  logging.error(f"Error in progress callback: {cb_err}")
         
-    logging.info(f"Finished LLM categorization for {processed_count}/{total_to_process} emails.")
+    logging.info(f"Finished LLM categorization for {processed_count}/{total_to_process} emails "
+                 f"({header_classified_count} classified by headers without an LLM call).")
     # Return the original list reference. 
     # The category has been updated in the dictionaries referenced by emails_to_process.
     return emails 
@@ -0,0 +1,177 @@
+"""
+Local on-disk caches for Smart Inbox Cleaner
+"""
+import os
+import re
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache')
+
+def _safe_name(value: str) -> str:
+    """Turns an account address or folder name into something usable as a file name."""
+    return re.sub(r'[^A-Za-z0-9._@-]+', '_', value or 'default')
+
+def envelope_cache_path(account: str) -> str:
+    """Returns the envelope cache file used for the given account."""
+    return os.path.join(CACHE_DIR, f"envelopes-{_safe_name(account)}.json")
+
+def load_json(path: str) -> Dict[str, Any]:
+    """Loads a JSON cache file, returning an empty dict if it is missing or unreadable."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"Could not read cache file {path}: {e}. Starting with an empty cache.")
+        return {}
+
+def save_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    """Writes a JSON cache file via a temporary file so a crash never leaves it half-written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _serialize_email(email_data: Dict[str, Any]) -> Dict[str, Any]:
+    stored = dict(email_data)
+    if isinstance(stored.get('date'), datetime):
+        stored['date'] = stored['date'].isoformat()
+    # Categories are session state, not envelope data
+    stored.pop('category', None)
+    return stored
+
+def _deserialize_email(stored: Dict[str, Any]) -> Dict[str, Any]:
+    email_data = dict(stored)
+    if isinstance(email_data.get('date'), str):
+        try:
+            email_data['date'] = datetime.fromisoformat(email_data['date'])
+        except ValueError:
+            email_data['date'] = None
+    return email_data
+
+class EnvelopeCache:
+    """Persists fetched envelopes keyed by (folder, UIDVALIDITY, UID).
+
+    Each folder entry also remembers the UIDNEXT and EXISTS values seen at the
+    last sync so the next session only has to fetch the delta.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = load_json(path)
+        self._data.setdefault('folders', {})
+
+    def get_folder_state(self, folder: str) -> Optional[Dict[str, Any]]:
+        """Returns the cursor for a folder (uidvalidity, uidnext, exists, highestmodseq, fetch profile), or None if never synced."""
+        state = self._data['folders'].get(folder)
+        if not state:
+            return None
+        return {
+            'uidvalidity': state.get('uidvalidity'),
+            'uidnext': state.get('uidnext'),
+            'exists': state.get('exists'),
+            'highestmodseq': state.get('highestmodseq'),
+            'profile': state.get('profile', 'envelope'),
+        }
+
+    def get_uids(self, folder: str) -> List[int]:
+        """Returns the cached UIDs for a folder in ascending order."""
+        state = self._data['folders'].get(folder, {})
+        return sorted(int(uid) for uid in state.get('emails', {}))
+
+    def get_emails(self, folder: str) -> List[Dict[str, Any]]:
+        """Returns the cached email dicts for a folder in ascending UID order."""
+        emails = self._data['folders'].get(folder, {}).get('emails', {})
+        return [_deserialize_email(emails[uid]) for uid in sorted(emails, key=int)]
+
+    def replace_folder(self, folder: str, uidvalidity: int, uidnext: int, exists: int,
+                       emails: List[Dict[str, Any]], highestmodseq: Optional[int] = None,
+                       profile: str = 'envelope') -> None:
+        """Drops everything cached for a folder and stores a fresh set of envelopes."""
+        self._data['folders'][folder] = {
+            'uidvalidity': uidvalidity,
+            'uidnext': uidnext,
+            'exists': exists,
+            'highestmodseq': highestmodseq,
+            'profile': profile,
+            'emails': {str(e['uid']): _serialize_email(e) for e in emails},
+        }
+
+    def update_folder(self, folder: str, uidnext: int, exists: int,
+                      added: List[Dict[str, Any]], removed: Iterable[int],
+                      keep_latest: Optional[int] = None,
+                      changed_flags: Optional[Dict[int, List[str]]] = None,
+                      highestmodseq: Optional[int] = None) -> None:
+        """Applies a delta to a folder: adds new envelopes, drops expunged UIDs, updates flags and trims the window."""
+        state = self._data['folders'][folder]
+        emails = state.setdefault('emails', {})
+        for uid in removed:
+            emails.pop(str(uid), None)
+        for email_data in added:
+            emails[str(email_data['uid'])] = _serialize_email(email_data)
+        for uid, flags in (changed_flags or {}).items():
+            if str(uid) in emails:
+                emails[str(uid)]['flags'] = list(flags)
+        if keep_latest is not None and len(emails) > keep_latest:
+            for uid in sorted(emails, key=int)[:len(emails) - keep_latest]:
+                del emails[uid]
+        state['uidnext'] = uidnext
+        state['exists'] = exists
+        if highestmodseq is not None:
+            state['highestmodseq'] = highestmodseq
+
+    def save(self) -> None:
+        """Flushes the cache to disk."""
+        try:
+            save_json_atomic(self.path, self._data)
+        except Exception as e:
+            logging.error(f"Error saving envelope cache to {self.path}: {e}")
+
+def snippet_cache_path(account: str) -> str:
+    """Returns the body snippet cache file used for the given account."""
+    return os.path.join(CACHE_DIR, f"snippets-{_safe_name(account)}.json")
+
+def move_journal_path(account: str) -> str:
+    """Returns the move journal (move_journal.MoveJournal) file used for the given account."""
+    return os.path.join(CACHE_DIR, f"moves-{_safe_name(account)}.jsonl")
+
+def category_memory_path() -> str:
+    """Returns the learned category memory (category_memory.CategoryMemory) file, shared by all accounts."""
+    return os.path.join(CACHE_DIR, "category-memory.json")
+
+class SnippetCache:
+    """Persists decoded body snippets keyed by (folder, UIDVALIDITY, UID).
+
+    Snippets never change for a given key, so once stored they are never downloaded again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = load_json(path)
+        self._data.setdefault('snippets', {})
+
+    @staticmethod
+    def _key(folder: str, uidvalidity: int, uid: int) -> str:
+        return f"{folder}:{uidvalidity}:{uid}"
+
+    def get(self, folder: str, uidvalidity: int, uid: int) -> Optional[str]:
+        """Returns the cached snippet, or None if it was never fetched."""
+        return self._data['snippets'].get(self._key(folder, uidvalidity, uid))
+
+    def put(self, folder: str, uidvalidity: int, uid: int, snippet: str) -> None:
+        """Stores a snippet (an empty string records that the message has no text part)."""
+        self._data['snippets'][self._key(folder, uidvalidity, uid)] = snippet
+
+    def save(self) -> None:
+        """Flushes the cache to disk."""
+        try:
+            save_json_atomic(self.path, self._data)
+        except Exception as e:
+            logging.error(f"Error saving snippet cache to {self.path}: {e}")
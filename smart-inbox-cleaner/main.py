@@ -4,11 +4,26 @@ import os
 import email
 import pandas as pd
 import ollama
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Import from local modules
-from email_client import connect_oauth
-from email_mover import move_emails
-from email_fetcher import fetch_inbox_emails
+from auth import stop_token_refresher, add_account, list_saved_accounts
+from accounts import MailAccount, categorize_accounts
+from email_mover import resume_moves, undo_moves, TARGET_FOLDER_MAP
+from move_worker import MoveWorker, MoveJob
+from fetch_worker import FetchWorker
+from category_memory import CategoryMemory
+from mail_cache import category_memory_path
+from email_fetcher import (
+    delta_sync_emails,
+    ALL_MAIL_FOLDER,
+    SEARCH_MODE_DATE_WINDOW,
+    FETCH_PROFILE_HEADERS
+)
+from snippet_fetcher import fetch_snippets
+from idle_listener import IdleListener
 from llm_categorizer import categorize_emails_llm, DEFAULT_MODEL
 from email_modal import EmailModal
 from status_component import setup_status_component, is_electron
@@ -24,10 +39,13 @@ from constants import (
     CAT_INFO, 
     CAT_UNCATEGORISED,
     MOVE_CATEGORIES,
-    RULE_CATEGORIES
+    RULE_CATEGORIES,
+    EMAIL_TABLE_COLUMNS
+)
+from categorizer import categorize_emails as categorize_emails_rules, categorize_dataframe
+from helper_functions import (
+    get_ollama_models, apply_sync_delta, append_emails, remove_emails, email_key, parse_email_row_id
 )
-from categorizer import categorize_emails as categorize_emails_rules
-from helper_functions import decode_subject, get_ollama_models
 # Import the consolidated styles
 from styles import get_all_styles
 from html_generators import (
@@ -85,7 +103,7 @@ class ModalFactory:
             return "Are you sure you want to proceed?"
     
     @staticmethod
-    def show_modal_content(modal, confirmation_type, imap_client, df, emails):
+    def show_modal_content(modal, confirmation_type, accounts, df, emails):
         """Display the appropriate modal content based on confirmation type"""
         with modal.container():
             # Get the confirmation message from session state
@@ -108,7 +126,7 @@ class ModalFactory:
                                use_container_width=True,
                                type="primary", 
                                help="Move the emails to their category folders"):
-                        ModalFactory.handle_move_confirmation(imap_client, df, emails)
+                        ModalFactory.handle_move_confirmation(accounts, df, emails)
                         # Close the modal and rerun to refresh the UI
                         modal.close()
                         st.rerun()
@@ -120,7 +138,7 @@ class ModalFactory:
                                use_container_width=True,
                                type="primary", 
                                help="Archive all Information emails"):
-                        ModalFactory.handle_archive_confirmation(imap_client, df, emails)
+                        ModalFactory.handle_archive_confirmation(accounts, df, emails)
                         # Close the modal and rerun to refresh the UI
                         modal.close()
                         st.rerun()
@@ -133,55 +151,74 @@ class ModalFactory:
                     st.rerun()
     
     @staticmethod
-    def handle_move_confirmation(imap_client, df, emails):
+    def start_move(accounts, rows_df, make_category_map, action):
+        """Hands the rows to a background MoveWorker, one job per account and source folder
+        (UIDs are only unique per folder). watch_move_worker reports progress and drops rows
+        from the table as the server confirms each batch.
+        """
+        # Emails moved with the category the LLM gave them teach the category memory
+        llm_categories = st.session_state.llm_categories
+        addresses = {email_key(email): email.get('address') for email in st.session_state.emails}
+        accepted = [
+            {'address': addresses.get(key), 'from': sender, 'subject': subject, 'category': category}
+            for key, sender, subject, category in zip(
+                zip(rows_df['account'], rows_df['folder'], rows_df['uid']),
+                rows_df['from'], rows_df['subject'], rows_df['category'])
+            if llm_categories.get(key) == category
+        ]
+        if accepted:
+            st.session_state.category_memory.record_accepted(accepted)
+            st.session_state.category_memory.save()
+
+        jobs = [
+            MoveJob(account_email, folder, group_df['uid'].tolist(), make_category_map(group_df))
+            for (account_email, folder), group_df in rows_df.groupby(['account', 'folder'])
+        ]
+        worker = MoveWorker(accounts, jobs)
+        worker.start()
+        st.session_state.move_worker = worker
+        st.session_state.move_action = action
+
+    @staticmethod
+    def handle_move_confirmation(accounts, df, emails):
         """Handle the confirmation to move emails"""
-        if not imap_client:
+        if not accounts:
             st.error("IMAP client not available. Cannot move emails.")
             return
             
-        with st.spinner("Moving emails..."):
-            relevant_df = df[df['category'].isin(MOVE_CATEGORIES)].copy()
-            if not relevant_df.empty:
-                uids_to_move = relevant_df['uid'].tolist()
-                category_map = pd.Series(relevant_df.category.values, index=relevant_df.uid).to_dict()
-                moved_uids = move_emails(imap_client, uids_to_move, category_map)
-                if moved_uids is not None:
-                    st.toast(f"Moved {len(moved_uids)} email(s).")
-                    st.session_state.df = df[~df['uid'].isin(moved_uids)]
-                    st.session_state.emails = [email for email in emails if email['uid'] not in moved_uids]
-                else:
-                    st.error("Move operation failed. Check logs.")
-            else:
-                st.toast("No relevant emails found to move.")
+        relevant_df = df[df['category'].isin(MOVE_CATEGORIES)].copy()
+        if not relevant_df.empty:
+            ModalFactory.start_move(
+                accounts, relevant_df,
+                lambda group_df: pd.Series(group_df.category.values, index=group_df.uid).to_dict(),
+                "Moving"
+            )
+        else:
+            st.toast("No relevant emails found to move.")
     
     @staticmethod
-    def handle_archive_confirmation(imap_client, df, emails):
-        """Handle the confirmation to archive Information emails"""
-        if not imap_client:
+    def handle_archive_confirmation(accounts, df, emails):
+        """Handle the confirmation to archive Information emails.
+
+        Goes through move_emails like other moves, so on Gmail archiving is one bulk label
+        change per batch (+SmartInbox/Information, -\\Inbox).
+        """
+        if not accounts:
             st.error("IMAP client not available. Cannot move emails.")
             return
             
-        with st.spinner("Archiving Information emails..."):
-            # Filter to Information category only
-            info_df = df[df['category'] == CAT_INFO].copy()
-            
-            if not info_df.empty:
-                uids_to_move = info_df['uid'].tolist()
-                # Create a map where all are Information category
-                category_map = {uid: CAT_INFO for uid in uids_to_move}
-                
-                # Use the existing move_emails function
-                moved_uids = move_emails(imap_client, uids_to_move, category_map)
-                
-                if moved_uids is not None:
-                    st.success(f"Archived {len(moved_uids)} Information email(s) successfully!")
-                    # Remove moved emails from dataframe and email list
-                    st.session_state.df = df[~df['uid'].isin(moved_uids)]
-                    st.session_state.emails = [email for email in emails if email['uid'] not in moved_uids]
-                else:
-                    st.error("Archive operation failed. Check logs.")
-            else:
-                st.info("No Information emails found to archive.")
+        # Filter to Information category only
+        info_df = df[df['category'] == CAT_INFO].copy()
+        
+        if not info_df.empty:
+            # Create a map where all are Information category
+            ModalFactory.start_move(
+                accounts, info_df,
+                lambda group_df: {uid: CAT_INFO for uid in group_df['uid']},
+                "Archiving"
+            )
+        else:
+            st.info("No Information emails found to archive.")
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -199,8 +236,8 @@ st.markdown(get_all_styles(), unsafe_allow_html=True)
 # --- Initialize Session State ---
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
-if 'imap_client' not in st.session_state:
-    st.session_state.imap_client = None
+if 'accounts' not in st.session_state:
+    st.session_state.accounts = {} # Address -> MailAccount (pool and caches); primary login first
 if 'connection_status' not in st.session_state:
     st.session_state.connection_status = "Not connected"
 if 'emails' not in st.session_state:
@@ -227,6 +264,123 @@ if 'progress_text' not in st.session_state:
     st.session_state.progress_text = None # Stores current progress text
 if 'debug_mode' not in st.session_state:
     st.session_state.debug_mode = False
+if 'scan_folders' not in st.session_state:
+    st.session_state.scan_folders = ['INBOX'] # Folders fetched and triaged
+if 'live_updates' not in st.session_state:
+    st.session_state.live_updates = False # Push new mail via IMAP IDLE
+if 'idle_listeners' not in st.session_state:
+    st.session_state.idle_listeners = {} # Address -> background IdleListener thread
+if 'idle_listener_config' not in st.session_state:
+    st.session_state.idle_listener_config = None # (method, model) the listener categorizes with
+if 'include_snippets' not in st.session_state:
+    st.session_state.include_snippets = False # Send the start of each body to the LLM
+if 'category_memory' not in st.session_state:
+    st.session_state.category_memory = CategoryMemory(category_memory_path()) # Learned sender/thread categories
+if 'llm_categories' not in st.session_state:
+    st.session_state.llm_categories = {} # (account, folder, uid) -> category the LLM gave in the last run
+if 'move_worker' not in st.session_state:
+    st.session_state.move_worker = None # Background MoveWorker of the bulk move in progress
+if 'move_action' not in st.session_state:
+    st.session_state.move_action = "Moving" # Verb shown in the move progress text
+if 'move_result' not in st.session_state:
+    st.session_state.move_result = None # (succeeded, message) of the last finished move, resume or undo
+if 'fetch_worker' not in st.session_state:
+    st.session_state.fetch_worker = None # Background FetchWorker streaming the emails into the table
+if 'inbox_empty' not in st.session_state:
+    st.session_state.inbox_empty = False # The last fetch found nothing; not refetched until clear_emails
+
+def clear_emails():
+    """Drops the fetched emails (stopping a fetch in progress) so the next run fetches them again."""
+    if st.session_state.fetch_worker is not None:
+        # Wait for the batch in flight, so the old fetch is done with the envelope caches
+        st.session_state.fetch_worker.stop()
+        st.session_state.fetch_worker.join()
+        st.session_state.fetch_worker = None
+    st.session_state.emails = []
+    st.session_state.df = pd.DataFrame()
+    st.session_state.inbox_empty = False
+
+def categorize_fetched_batch(emails, method, memory):
+    """Labels a batch of freshly fetched emails before it joins the table.
+
+    Emails the category memory knows get its category; with rule-based categorization the
+    rules label the rest right away. The LLM still only runs on Categorise Inbox.
+    """
+    unknown = memory.apply(emails)
+    if method == CAT_METHOD_RULES and unknown:
+        categorize_emails_rules(unknown)
+    return emails
+
+# --- Background Moves ---
+@st.experimental_fragment(run_every=1)
+def watch_move_worker():
+    """Shows the background move's progress and a Cancel button.
+
+    Drops the rows of each committed batch from the table and reruns the app so it shows
+    them gone; once the worker has finished, records the outcome and reruns once more.
+    Only reads the worker's in-process queue; no IMAP traffic happens here.
+    """
+    worker = st.session_state.move_worker
+    if worker is None:
+        return
+    finished = not worker.is_alive()
+    updates = worker.drain()
+    moved_keys = [(update.account, update.folder, uid) for update in updates for uid in update.moved]
+    if moved_keys:
+        st.session_state.emails, st.session_state.df = remove_emails(
+            st.session_state.emails, st.session_state.df, moved_keys
+        )
+    if finished:
+        moved_count = worker.moved
+        done_text = "Archived" if st.session_state.move_action == "Archiving" else "Moved"
+        if worker.failed:
+            st.session_state.move_result = (False, f"Move operation failed after {moved_count} email(s). Check logs.")
+        elif worker.cancelled:
+            st.session_state.move_result = (True, f"Cancelled. {done_text} {moved_count} email(s).")
+        else:
+            st.session_state.move_result = (True, f"{done_text} {moved_count} email(s).")
+        st.session_state.move_worker = None
+        st.rerun()
+    if updates:
+        st.rerun()
+
+    percent = int(worker.done / worker.total * 100) if worker.total else 100
+    progress_text = f"{st.session_state.move_action} {worker.done} out of {worker.total} emails ({percent}%)"
+    if worker.cancelled:
+        progress_text += " - cancelling after the current batch"
+    st.markdown(generate_progress_html(progress_text), unsafe_allow_html=True)
+    if st.button("Cancel move", key="cancel_move_btn", type="secondary", disabled=worker.cancelled):
+        worker.stop()
+
+@st.experimental_fragment(run_every=1)
+def watch_fetch_worker():
+    """Shows the background fetch's progress and adds each delivered batch to the table.
+
+    Every batch is labelled (categorize_fetched_batch) and appended as it arrives, and the
+    app reruns so the table shows it; once the worker has finished, reruns once more.
+    Only reads the worker's in-process queue; no IMAP traffic happens here.
+    """
+    worker = st.session_state.fetch_worker
+    if worker is None:
+        return
+    finished = not worker.is_alive()
+    batches = worker.drain()
+    for batch in batches:
+        categorize_fetched_batch(batch, st.session_state.categorization_method, st.session_state.category_memory)
+        # Subjects are decoded once at ingest (email_fetcher.parse_envelope)
+        st.session_state.emails, st.session_state.df = append_emails(
+            st.session_state.emails, st.session_state.df, batch
+        )
+    if finished:
+        st.session_state.fetch_worker = None
+        st.session_state.inbox_empty = not st.session_state.emails
+        if worker.failed:
+            st.session_state.move_result = (False, "Fetching emails failed. Check logs.")
+        st.rerun()
+    if batches:
+        st.rerun()
+    st.markdown(generate_progress_html(f"Fetching emails... {len(st.session_state.emails)} so far"),
+                unsafe_allow_html=True)
 
 # --- App Header ---
 st.markdown('<div class="app-header"><h1>📥 Smart Inbox Cleaner</h1></div>', unsafe_allow_html=True)
@@ -239,7 +393,8 @@ if st.session_state.logged_in:
     # Categorise Inbox button in the left column
     with left_col:
         if not st.session_state.categorization_running:
-            if st.button("Categorise Inbox", key="process_inbox_button", type="primary", use_container_width=True):
+            if st.button("Categorise Inbox", key="process_inbox_button", type="primary", use_container_width=True,
+                         disabled=st.session_state.fetch_worker is not None):
                 if not st.session_state.emails:
                     st.warning("No emails fetched to categorize.")
                 else:
@@ -266,6 +421,17 @@ if st.session_state.logged_in:
     
     # Display progress text in the right column when processing
     with progress_col:
+        if st.session_state.fetch_worker is not None:
+            watch_fetch_worker()
+        if st.session_state.move_worker is not None:
+            watch_move_worker()
+        elif st.session_state.move_result:
+            move_succeeded, move_message = st.session_state.move_result
+            if move_succeeded:
+                st.markdown(generate_complete_html(move_message), unsafe_allow_html=True)
+            else:
+                st.error(move_message)
+            st.session_state.move_result = None
         if st.session_state.categorization_running:
             # Create a placeholder for progress updates
             progress_placeholder = st.empty()
@@ -284,21 +450,73 @@ if st.session_state.logged_in:
     # Add spacing after the button
     #st.markdown("<div style='margin-bottom: 20px; background-color: red;'></div>", unsafe_allow_html=True)
 
+# --- Live Updates ---
+def make_push_categorizer(method, model_name, memory):
+    """Builds the categorizer the IDLE listener applies to newly arrived emails.
+
+    Settings are captured up front because the listener thread cannot read session state.
+    Emails the category memory knows skip the rules and the LLM.
+    """
+    if method == CAT_METHOD_LLM:
+        categorize = lambda emails: categorize_emails_llm(emails, model_name=model_name)
+    else:
+        categorize = categorize_emails_rules
+
+    def categorize_pushed(emails):
+        unknown = memory.apply(emails)
+        if unknown and categorize(unknown) is None:
+            return None
+        return emails
+    return categorize_pushed
+
+def stop_idle_listeners():
+    """Stops the background IDLE listeners, if any are running."""
+    for listener in st.session_state.idle_listeners.values():
+        listener.stop()
+    st.session_state.idle_listeners = {}
+    st.session_state.idle_listener_config = None
+
+@st.experimental_fragment(run_every=1)
+def watch_idle_listeners():
+    """Reruns the app once an IDLE listener has delivered new mail.
+
+    Only checks in-process queues; no IMAP traffic happens here.
+    """
+    delivered = any(not listener.results.empty() for listener in st.session_state.idle_listeners.values())
+    if delivered and not st.session_state.categorization_running:
+        st.rerun()
+
+def connect_saved_accounts():
+    """Reconnects the additional accounts saved under auth.ACCOUNTS_DIR, concurrently."""
+    saved = {email: path for email, path in list_saved_accounts().items()
+             if email not in st.session_state.accounts}
+    if not saved:
+        return
+    with ThreadPoolExecutor(max_workers=len(saved), thread_name_prefix="account-login") as executor:
+        results = list(executor.map(MailAccount.connect, saved.values()))
+    for (email, _), (account, status) in zip(saved.items(), results):
+        if account:
+            st.session_state.accounts[account.email] = account
+        else:
+            logging.error(f"Could not reconnect account {email}: {status}")
+
 # --- Login Section ---
 if not st.session_state.logged_in:
     st.info("Please log in with your Google account to access your Gmail inbox.")
     if st.button("Login with Google"):
         with st.spinner("Attempting Google Login and IMAP Connection..."):
-            client, status = connect_oauth()
-            if client:
+            # The account pools the login connection; fetch, move and IDLE borrow from it
+            account, status = MailAccount.connect()
+            if account:
                 st.session_state.logged_in = True
-                st.session_state.imap_client = client
+                st.session_state.accounts = {account.email: account}
+                connect_saved_accounts()
                 st.session_state.connection_status = status
                 st.success("Login Successful! " + status)
                 st.rerun() # Rerun to hide login button and show main app
             else:
                 st.session_state.logged_in = False
-                st.session_state.imap_client = None
+                st.session_state.accounts = {}
                 st.session_state.connection_status = status
                 st.error(f"Login Failed: {status}")
     # Display status if login hasn't been attempted or failed
@@ -312,14 +530,29 @@ else:
     # --- Connection Status in Sidebar ---
     connection_status_container = st.sidebar.container()
     with connection_status_container:
-        # Get email address from connection status
-        email_address = ""
-        status_parts = st.session_state.connection_status.split(" as ")
-        if len(status_parts) > 1:
-            email_address = status_parts[1]
+        # The account signed in with "Login with Google" comes first
+        email_address = next(iter(st.session_state.accounts), "")
         
         # Display email address in a cleaner format
         st.sidebar.markdown(f"### {email_address}")
+        for account_email in st.session_state.accounts:
+            if account_email != email_address:
+                st.sidebar.caption(f"+ {account_email}")
+        if st.sidebar.button("➕ Add account", key="add_account_btn", use_container_width=True,
+                             disabled=st.session_state.categorization_running):
+            with st.spinner("Waiting for Google Login..."):
+                added_email, token_path = add_account()
+                account, status = MailAccount.connect(token_path) if token_path else (None, "Login cancelled or failed.")
+            if account:
+                if account.email in st.session_state.accounts:
+                    st.session_state.accounts[account.email].close()
+                st.session_state.accounts[account.email] = account
+                # Refetch so the new account's mail joins the table
+                clear_emails()
+                st.session_state.categorization_run = False
+                st.rerun()
+            else:
+                st.sidebar.error(f"Could not add account: {status}")
         
         # Logout button moved to bottom of sidebar
 
@@ -358,7 +591,131 @@ else:
             key="llm_model_selector",
             label_visibility="collapsed"
         )
+
+        st.session_state.include_snippets = st.sidebar.checkbox(
+            "Include body snippets",
+            value=st.session_state.include_snippets,
+            help="Give the LLM the first part of each email body. Snippets are cached locally and only downloaded once."
+        )
         
+    # --- Folder Scanning ---
+    st.sidebar.markdown("### Folders")
+    selected_folders = st.sidebar.multiselect(
+        "",
+        options=['INBOX'] + list(TARGET_FOLDER_MAP.values()) + [ALL_MAIL_FOLDER],
+        default=st.session_state.scan_folders,
+        key="scan_folders_selector",
+        label_visibility="collapsed",
+        help="Scan SmartInbox folders or All Mail to re-triage previously moved mail. All Mail also contains INBOX messages."
+    )
+    if selected_folders and selected_folders != st.session_state.scan_folders:
+        st.session_state.scan_folders = selected_folders
+        # Refetch with the new folder set; each folder keeps its own incremental cursor
+        clear_emails()
+        st.session_state.categorization_run = False
+
+    # --- Refresh Inbox (delta sync) ---
+    if st.sidebar.button("🔄 Refresh Inbox", key="refresh_inbox_btn", use_container_width=True,
+                         disabled=st.session_state.categorization_running or st.session_state.fetch_worker is not None):
+        deltas = {}
+        # Resolved folder names (e.g. a localized All Mail) as tagged on the fetched emails
+        for account_email, folder in sorted({email_key(email)[:2] for email in st.session_state.emails}):
+            account = st.session_state.accounts.get(account_email)
+            try:
+                with account.pool.connection() as imap_client:
+                    deltas[(account_email, folder)] = delta_sync_emails(imap_client, account.envelope_cache,
+                                                                        folder=folder)
+            except Exception as e:
+                logging.error(f"Error refreshing {folder} for {account_email}: {e}", exc_info=True)
+                deltas[(account_email, folder)] = None
+        if not deltas or any(delta is None for delta in deltas.values()):
+            # No usable MODSEQ cursor: clear the list so the incremental sync below runs again
+            clear_emails()
+        else:
+            for (account_email, folder), delta in deltas.items():
+                st.session_state.emails, st.session_state.df = apply_sync_delta(
+                    st.session_state.emails, st.session_state.df, delta, folder=folder, account=account_email
+                )
+            added = sum(len(delta.added) for delta in deltas.values())
+            changed = sum(len(delta.changed) for delta in deltas.values())
+            vanished = sum(len(delta.vanished) for delta in deltas.values())
+            st.toast(f"{added} new, {changed} changed, {vanished} removed.")
+        st.rerun()
+
+    # --- Live Updates (IMAP IDLE) ---
+    st.session_state.live_updates = st.sidebar.checkbox(
+        "Live updates",
+        value=st.session_state.live_updates,
+        key="live_updates_checkbox",
+        help="Keep an IDLE connection open per account and categorize new INBOX mail as it arrives."
+    )
+    if st.session_state.live_updates:
+        listener_config = (st.session_state.categorization_method, st.session_state.selected_llm_model,
+                           tuple(st.session_state.accounts))
+        listeners = st.session_state.idle_listeners
+        if (st.session_state.idle_listener_config != listener_config
+                or any(not listener.is_alive() for listener in listeners.values())):
+            stop_idle_listeners()
+            categorize_pushed = make_push_categorizer(*listener_config[:2], st.session_state.category_memory)
+            for account_email, account in st.session_state.accounts.items():
+                listener = IdleListener(categorize_pushed, pool=account.pool, account=account_email)
+                listener.start()
+                st.session_state.idle_listeners[account_email] = listener
+            st.session_state.idle_listener_config = listener_config
+        watch_idle_listeners()
+    else:
+        stop_idle_listeners()
+
+    # --- Interrupted / undoable moves (move journal) ---
+    accounts = st.session_state.accounts
+    pending_moves = sum(account.move_journal.pending_count() for account in accounts.values())
+    undoable = [account for account in accounts.values() if account.move_journal.last_undoable_run()]
+    if st.session_state.move_worker is not None:
+        # The running move's own batches are planned but not yet committed; not interrupted
+        pending_moves, undoable = 0, []
+    if pending_moves or undoable:
+        st.sidebar.markdown("### Moves")
+    if pending_moves and st.sidebar.button(f"▶️ Resume interrupted move ({pending_moves})", key="resume_moves_btn",
+                                           use_container_width=True):
+        with st.spinner("Resuming interrupted move..."):
+            resume_failed = False
+            for account in accounts.values():
+                if not account.move_journal.unfinished_runs():
+                    continue
+                try:
+                    with account.pool.connection() as imap_client:
+                        if resume_moves(imap_client, account.move_journal, account.folders) is None:
+                            resume_failed = True
+                except Exception as e:
+                    logging.error(f"Error borrowing IMAP connection for {account.email}: {e}", exc_info=True)
+                    resume_failed = True
+        # Shown next to the Categorise button after the rerun, like a finished bulk move
+        if resume_failed:
+            st.session_state.move_result = (False, "Resuming the move failed. Check logs.")
+        else:
+            st.session_state.move_result = (True, "Resumed the interrupted move.")
+        # Moved UIDs have left their folders; refetch rather than patching the table
+        clear_emails()
+        st.rerun()
+    if undoable and st.sidebar.button("↩️ Undo last move", key="undo_move_btn", use_container_width=True,
+                                      help="Move the emails of the most recent bulk move back to their folders"):
+        with st.spinner("Undoing last move..."):
+            restored = []
+            for account in undoable:
+                try:
+                    with account.pool.connection() as imap_client:
+                        restored.append(undo_moves(imap_client, account.move_journal, folders=account.folders))
+                except Exception as e:
+                    logging.error(f"Error borrowing IMAP connection for {account.email}: {e}", exc_info=True)
+                    restored.append(None)
+        if any(count is None for count in restored):
+            st.session_state.move_result = (False, "Undo failed. Check logs.")
+        else:
+            st.session_state.move_result = (True, f"Moved {sum(restored)} email(s) back.")
+        # Restored emails have new UIDs in their original folders
+        clear_emails()
+        st.rerun()
+
     # --- Debug Mode Toggle ---
     with st.sidebar.expander("Developer Options", expanded=False):
         st.session_state.debug_mode = st.checkbox(
@@ -381,19 +738,24 @@ else:
     # --- Add Logout Button at the very bottom of the sidebar ---
     logout_container = st.sidebar.container()
     if logout_container.button("⚪ Logout", key="sidebar_logout", type="secondary", use_container_width=True):
-        if st.session_state.imap_client:
+        stop_idle_listeners()
+        clear_emails()
+        if st.session_state.move_worker is not None:
+            st.session_state.move_worker.stop()
+            st.session_state.move_worker.join()
+            st.session_state.move_worker = None
+        for account in st.session_state.accounts.values():
             try:
-                st.session_state.imap_client.logout()
-                logging.info("IMAP client logged out.")
+                account.close()
+                logging.info(f"IMAP connections for {account.email} logged out.")
             except Exception as e:
                 logging.error(f"Error during IMAP logout: {e}")
-        
+        stop_token_refresher()
+
         # Clear session state related to login
         st.session_state.logged_in = False
-        st.session_state.imap_client = None
+        st.session_state.accounts = {}
         st.session_state.connection_status = "Logged out."
-        st.session_state.emails = []
-        st.session_state.df = pd.DataFrame()
         st.session_state.categorization_run = False
         st.session_state.show_move_confirmation = False
         st.session_state.manual_selection_mode = False
@@ -401,38 +763,30 @@ else:
         st.rerun()
 
     # --- Fetch Emails (Only if not already fetched) ---
-    if not st.session_state.emails:
-        with st.spinner("Fetching initial emails..."):
-            try:
-                if st.session_state.imap_client:
-                    st.session_state.emails = fetch_inbox_emails(st.session_state.imap_client)
-                    if st.session_state.emails:
-                        temp_df = pd.DataFrame(st.session_state.emails)
-                        temp_df['category'] = CAT_UNCATEGORISED # Use constant
-                        temp_df['Select'] = False
-                        temp_df['date'] = pd.to_datetime(temp_df['date']) # Ensure date is datetime type
-                        
-                        # Decode encoded email subjects - only if they contain encoding patterns
-                        temp_df['subject'] = temp_df['subject'].apply(lambda s: decode_subject(s) if isinstance(s, str) and "=?UTF-8?" in s else s)
-                        
-                        temp_df = temp_df.sort_values(by='date', ascending=False)
-                        # Define initial column order
-                        st.session_state.df = temp_df[['Select', 'date', 'from', 'subject', 'category', 'uid']]
-                    else:
-                        st.write("No emails fetched or inbox is empty.")
-                else:
-                    st.error("IMAP client not available. Cannot fetch emails.")
-            except Exception as e:
-                st.error(f"Error fetching emails: {e}")
-
-    # Update original email list to have decoded subjects
-    for email in st.session_state.emails:
-        if 'subject' in email and isinstance(email['subject'], str) and "=?UTF-8?" in email['subject']:
-            email['subject'] = decode_subject(email['subject'])
+    if not st.session_state.emails and st.session_state.fetch_worker is None and not st.session_state.inbox_empty:
+        if st.session_state.accounts:
+            # Each account syncs through its own envelope cache, so only the delta since last session is fetched.
+            # The fetch runs in the background; watch_fetch_worker adds the batches as they arrive
+            worker = FetchWorker(
+                list(st.session_state.accounts.values()),
+                st.session_state.scan_folders,
+                search_mode=SEARCH_MODE_DATE_WINDOW,
+                profile=FETCH_PROFILE_HEADERS
+            )
+            worker.start()
+            st.session_state.fetch_worker = worker
+            st.rerun()
+        else:
+            st.error("IMAP client not available. Cannot fetch emails.")
 
-    # Any time we update the dataframe, ensure subjects are decoded
-    if not st.session_state.df.empty and 'subject' in st.session_state.df.columns:
-        st.session_state.df['subject'] = st.session_state.df['subject'].apply(lambda s: decode_subject(s) if isinstance(s, str) and "=?UTF-8?" in s else s)
+    # --- Append mail pushed by the IDLE listeners ---
+    if st.session_state.idle_listeners and not st.session_state.categorization_running:
+        pushed_emails = [email for listener in st.session_state.idle_listeners.values() for email in listener.drain()]
+        if pushed_emails:
+            st.session_state.emails, st.session_state.df = append_emails(
+                st.session_state.emails, st.session_state.df, pushed_emails
+            )
+            st.toast(f"{len(pushed_emails)} new email(s) arrived.")
 
     # --- Processing Logic (Only runs when Process Inbox button is clicked) ---
     if st.session_state.categorization_running:
@@ -455,23 +809,58 @@ else:
         
         # --- Run Categorization --- 
         categorized_email_list = None
+        categorized_frame = None # Rule-based results, already a DataFrame
         process_completed = False
         try:
             # Only use spinner for the fast rule-based method
             if st.session_state.categorization_method == CAT_METHOD_LLM:
-                categorized_email_list = categorize_emails_llm(
-                    st.session_state.emails.copy(), 
-                    model_name=st.session_state.selected_llm_model,
+                if st.session_state.include_snippets:
+                    for account_email, folder in sorted({email_key(email)[:2] for email in st.session_state.emails}):
+                        account = st.session_state.accounts[account_email]
+                        folder_emails = [email for email in st.session_state.emails if email_key(email)[:2] == (account_email, folder)]
+                        with account.pool.connection() as imap_client:
+                            fetch_snippets(imap_client, folder_emails, account.snippet_cache, folder=folder)
+                # Accounts are categorized concurrently; worker threads need the script context
+                # for the progress placeholder and stop checks
+                script_ctx = get_script_run_ctx()
+                model_name = st.session_state.selected_llm_model
+                # Senders and threads the category memory knows never reach the LLM
+                emails_to_categorize = st.session_state.emails.copy()
+                unknown_emails = st.session_state.category_memory.apply(emails_to_categorize)
+                # Only categories the LLM produced itself (not header rules) count as its results
+                llm_results = []
+                llm_email_list = categorize_accounts(
+                    unknown_emails,
+                    lambda group, progress: categorize_emails_llm(
+                        group,
+                        model_name=model_name,
+                        progress_callback=progress,
+                        stop_checker=check_if_stopped,
+                        llm_result_callback=llm_results.append
+                    ),
                     progress_callback=update_progress,
-                    stop_checker=check_if_stopped
+                    initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx)
                 )
+                if llm_email_list is not None:
+                    categorized_email_list = emails_to_categorize
+                    st.session_state.llm_categories = {email_key(email): email.get('category') for email in llm_results}
                 process_completed = categorized_email_list is not None
             else: # Rule-Based
                 spinner_text = f"Running {st.session_state.categorization_method}..."
                 with st.spinner(spinner_text): 
-                    categorized_email_list = categorize_emails_rules(
-                        st.session_state.emails.copy()
-                    )
+                    # Vectorized over the table itself, so no DataFrame is rebuilt from the email list
+                    rules_frame = st.session_state.df.copy()
+                    emails_by_key = {email_key(email): email for email in st.session_state.emails}
+                    frame_keys = list(zip(rules_frame['account'], rules_frame['folder'], rules_frame['uid']))
+                    # Bare sender address (for domain rules) and headers are not table columns
+                    rules_frame['address'] = [emails_by_key.get(key, {}).get('address') for key in frame_keys]
+                    if any(email.get('headers') for email in st.session_state.emails):
+                        rules_frame['headers'] = [emails_by_key.get(key, {}).get('headers') for key in frame_keys]
+                    categorized_frame = categorize_dataframe(rules_frame)
+                    # Learned categories take precedence over the rules
+                    remembered = st.session_state.category_memory.lookup_frame(categorized_frame)
+                    categorized_frame['category'] = remembered.combine_first(categorized_frame['category'])
+                    st.session_state.llm_categories = {}
                 process_completed = True
         except Exception as e:
             logging.error(f"Error during categorization: {e}", exc_info=True)
@@ -502,31 +891,46 @@ else:
                 if 'progress_placeholder' in st.session_state:
                     st.session_state.pop('progress_placeholder')
                 st.warning("Categorization stopped or failed unexpectedly.")
+            elif categorized_frame is not None and not categorized_frame.empty:
+                logging.info(f"Categorization successful. {len(categorized_frame)} emails categorized by rules.")
+                st.session_state.df = categorized_frame[EMAIL_TABLE_COLUMNS]
+                # Keep the email list in step with the table
+                category_by_key = dict(zip(
+                    zip(categorized_frame['account'], categorized_frame['folder'], categorized_frame['uid']),
+                    categorized_frame['category']
+                ))
+                for email in st.session_state.emails:
+                    email['category'] = category_by_key.get(email_key(email), email.get('category'))
+
+                st.session_state.categorization_run = True
+                st.session_state.show_move_confirmation = False
+                duration = pd.Timestamp.now() - start_time
+                st.session_state.progress_text = f"Categorisation complete in {duration.total_seconds():.2f}s"
+                # Clear the progress placeholder
+                if 'progress_placeholder' in st.session_state:
+                    st.session_state.pop('progress_placeholder')
+                st.toast(f"Complete in {duration.total_seconds():.2f}s")
+                st.rerun()  # Add rerun to refresh the UI state
             elif categorized_email_list:
                 logging.info(f"Categorization successful. Received {len(categorized_email_list)} emails back.")
                 
-                # Decode all subjects in the categorized list - only if they contain encoding patterns
-                for email in categorized_email_list:
-                    if 'subject' in email and isinstance(email['subject'], str) and "=?UTF-8?" in email['subject']:
-                        email['subject'] = decode_subject(email['subject'])
-                
-                # Create a mapping of UIDs to categories from the categorized results
-                categorized_uids = set()
+                # Create a mapping of (account, folder, uid) keys to categories from the categorized results
+                categorized_keys = set()
                 category_map = {}
                 for email in categorized_email_list:
                     if 'uid' in email and 'category' in email and email['category'] is not None:
-                        uid = email['uid']
-                        categorized_uids.add(uid)
-                        category_map[uid] = email['category']
+                        key = email_key(email)
+                        categorized_keys.add(key)
+                        category_map[key] = email['category']
                 
                 # Preserve original categories for emails not in the categorized batch
                 if not st.session_state.df.empty:
                     for idx, row in st.session_state.df.iterrows():
-                        uid = row['uid']
-                        if uid not in categorized_uids and row['category'] != CAT_UNCATEGORISED:
+                        key = (row['account'], row['folder'], row['uid'])
+                        if key not in categorized_keys and row['category'] != CAT_UNCATEGORISED:
                             # Find the corresponding email in the list and preserve its category
                             for email in categorized_email_list:
-                                if email['uid'] == uid and ('category' not in email or email['category'] is None):
+                                if email_key(email) == key and ('category' not in email or email['category'] is None):
                                     email['category'] = row['category']
                 
                 # Create DataFrame with the updated data
@@ -544,7 +948,7 @@ else:
                     temp_df['category'].fillna(CAT_UNCATEGORISED, inplace=True)
                     
                 # Create the dataframe with selected columns
-                st.session_state.df = temp_df[['Select', 'date', 'from', 'subject', 'category', 'uid']]
+                st.session_state.df = temp_df[EMAIL_TABLE_COLUMNS]
                 
                 st.session_state.categorization_run = True
                 st.session_state.show_move_confirmation = False
@@ -643,13 +1047,12 @@ else:
 
         # Display email table logic (unchanged)
         display_df = st.session_state.df.copy()
-        if not display_df.empty and 'subject' in display_df.columns:
-            display_df['subject'] = display_df['subject'].apply(lambda s: decode_subject(s) if isinstance(s, str) and "=?UTF-8?" in s else s)
         
-        display_cols = ['date', 'from', 'subject', 'category']
+        display_cols = ['date', 'from', 'subject', 'category', 'account', 'folder', 'uid']
         html_display_df = display_df[display_cols].copy() if not display_df.empty else pd.DataFrame(columns=display_cols)
         
-        email_table_html = generate_email_table_html(html_display_df)
+        # Unified multi-account table shows the account as an extra column
+        email_table_html = generate_email_table_html(html_display_df, show_account=len(st.session_state.accounts) > 1)
         st.components.v1.html(email_table_html, height=600, scrolling=True)
         
         # Close the disabled-table div if it was opened
@@ -663,13 +1066,26 @@ else:
         params = st.query_params
         if 'email_id' in params and 'category' in params:
             try:
-                # Extract the email_id index and category from the parameters
-                email_idx = int(params['email_id'].replace('email_', ''))
+                # Extract the email key and category from the parameters
+                key = parse_email_row_id(params['email_id'])
                 new_category = params['category']
                 
                 # Find and update the appropriate email in the dataframe
-                if email_idx < len(st.session_state.df):
-                    st.session_state.df.iloc[email_idx, st.session_state.df.columns.get_loc('category')] = new_category
+                df = st.session_state.df
+                matches = df.index[(df['account'] == key[0]) & (df['folder'] == key[1]) & (df['uid'] == key[2])]
+                if len(matches):
+                    df.loc[matches, 'category'] = new_category
+                    address = None
+                    for email in st.session_state.emails:
+                        if email_key(email) == key:
+                            email['category'] = new_category
+                            address = email.get('address')
+                    # Remember the correction for this sender address/thread in later fetches
+                    row = df.loc[matches[0]]
+                    st.session_state.category_memory.record_override(
+                        {'address': address, 'from': row['from'], 'subject': row['subject']}, new_category
+                    )
+                    st.session_state.category_memory.save()
                     
                     # Clear the parameters to avoid repeated updates
                     params.clear()
@@ -693,8 +1109,8 @@ else:
                 )
             
             # Only enable action buttons after categorization has run
-            confirm_disabled = not st.session_state.categorization_run
-            archive_disabled = not st.session_state.categorization_run
+            confirm_disabled = not st.session_state.categorization_run or st.session_state.move_worker is not None
+            archive_disabled = not st.session_state.categorization_run or st.session_state.move_worker is not None
             
             # Create a custom bottom toolbar with right-aligned buttons
             st.markdown("""
@@ -789,11 +1205,11 @@ else:
                 ModalFactory.show_modal_content(
                     st.session_state.confirm_modal,
                     confirmation_type,
-                    st.session_state.imap_client,
+                    st.session_state.accounts,
                     st.session_state.df,
                     st.session_state.emails
                 )
 
-    elif st.session_state.logged_in:
+    elif st.session_state.logged_in and st.session_state.fetch_worker is None:
         # Show only if logged in but no emails were found/loaded
         st.write("No emails to display.")
@@ -0,0 +1,163 @@
+"""
+Write-ahead journal of bulk moves, so interrupted moves can be resumed and finished moves undone
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class MoveBatch(NamedTuple):
+    """One planned UID set of a move run and what became of it."""
+    run: str
+    batch: int
+    strategy: str
+    source: str
+    uidvalidity: Optional[int]        # Source UIDVALIDITY when planned; UIDs are meaningless if it changes
+    target: str
+    uids: List[int]
+    message_ids: Dict[int, str]       # Source UID -> Message-ID, recorded when COPYUID is not expected
+    target_uidvalidity: Optional[int]
+    target_uidnext: Optional[int]     # Moved messages get target UIDs from here on
+    committed: bool
+    moved: Dict[int, Optional[int]]   # Source UID -> target UID (None when the server did not say)
+    undone: bool
+
+class MoveJournal:
+    """Append-only JSONL log of move runs.
+
+    A run writes one 'plan' record per batch before touching the server, then a 'commit'
+    record as the server confirms each batch, and a 'finish' record at the end. Each record
+    is flushed and fsynced, so after a crash or dropped connection the journal tells which
+    batches are done (commit), which may need redoing (plan only), and which target UIDs
+    an undo has to move back. A torn last line from a crash mid-write is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._batches: Dict[Tuple[str, int], MoveBatch] = {}
+        self._runs: List[str] = []
+        self._finished: set = set()
+        self.last_run: Optional[str] = None
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Skipping unreadable move journal line in {self.path}.")
+                        continue
+                    self._apply(record)
+        except Exception as e:
+            logging.error(f"Could not read move journal {self.path}: {e}")
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        run, kind = record.get('run'), record.get('type')
+        key = (run, record.get('batch'))
+        if kind == 'plan':
+            if run not in self._runs:
+                self._runs.append(run)
+            self._batches[key] = MoveBatch(
+                run=run, batch=record['batch'], strategy=record.get('strategy', ''),
+                source=record['source'], uidvalidity=record.get('uidvalidity'), target=record['target'],
+                uids=list(record['uids']),
+                message_ids={int(uid): mid for uid, mid in (record.get('message_ids') or {}).items()},
+                target_uidvalidity=record.get('target_uidvalidity'), target_uidnext=record.get('target_uidnext'),
+                committed=False, moved={}, undone=False,
+            )
+        elif kind == 'commit' and key in self._batches:
+            moved = {int(uid): target_uid for uid, target_uid in (record.get('moved') or {}).items()}
+            self._batches[key] = self._batches[key]._replace(committed=True, moved=moved)
+        elif kind == 'undo' and key in self._batches:
+            self._batches[key] = self._batches[key]._replace(undone=True)
+        elif kind == 'finish':
+            self._finished.add(run)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        record['ts'] = time.time()
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def begin_run(self, source: str, uidvalidity: Optional[int], strategy: str,
+                  batches: List[Tuple[str, List[int]]],
+                  message_ids: Optional[Dict[int, str]] = None,
+                  target_status: Optional[Dict[str, Tuple[Optional[int], Optional[int]]]] = None) -> str:
+        """Records the plan of a run before any of it is sent to the server.
+
+        Args:
+            source: Folder the UIDs are moved out of.
+            uidvalidity: The source folder's UIDVALIDITY.
+            strategy: The email_mover strategy used (see select_move_strategy).
+            batches: (target folder, UIDs) per batch, in execution order.
+            message_ids: Optional source UID -> Message-ID, for undo without COPYUID.
+            target_status: Optional target folder -> (UIDVALIDITY, UIDNEXT) before the run.
+
+        Returns:
+            The new run id.
+        """
+        run = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        message_ids = message_ids or {}
+        target_status = target_status or {}
+        for number, (target, uids) in enumerate(batches):
+            target_uidvalidity, target_uidnext = target_status.get(target, (None, None))
+            self._append({
+                'type': 'plan', 'run': run, 'batch': number, 'strategy': strategy,
+                'source': source, 'uidvalidity': uidvalidity, 'target': target, 'uids': list(uids),
+                'message_ids': {str(uid): message_ids[uid] for uid in uids if uid in message_ids},
+                'target_uidvalidity': target_uidvalidity, 'target_uidnext': target_uidnext,
+            })
+        self.last_run = run
+        return run
+
+    def commit(self, run: str, batch: int, moved: Dict[int, Optional[int]]) -> None:
+        """Marks a batch as confirmed by the server, with the source -> target UIDs it moved."""
+        self._append({'type': 'commit', 'run': run, 'batch': batch,
+                      'moved': {str(uid): target_uid for uid, target_uid in moved.items()}})
+
+    def finish(self, run: str) -> None:
+        """Marks a run as complete; it will no longer be offered for resuming."""
+        self._append({'type': 'finish', 'run': run})
+
+    def mark_undone(self, run: str, batch: int) -> None:
+        self._append({'type': 'undo', 'run': run, 'batch': batch})
+
+    def batches(self, run: str) -> List[MoveBatch]:
+        """The batches of a run in execution order."""
+        return sorted((b for (r, _), b in self._batches.items() if r == run), key=lambda b: b.batch)
+
+    def moved_uids(self, run: Optional[str]) -> List[int]:
+        """Source UIDs the server confirmed as moved in a run."""
+        if run is None:
+            return []
+        return [uid for batch in self.batches(run) if batch.committed for uid in batch.moved]
+
+    def unfinished_runs(self) -> List[str]:
+        """Runs that were interrupted before finishing, oldest first."""
+        return [run for run in self._runs if run not in self._finished]
+
+    def pending_count(self) -> int:
+        """Number of UIDs in planned but uncommitted batches of unfinished runs."""
+        return sum(len(batch.uids) for run in self.unfinished_runs()
+                   for batch in self.batches(run) if not batch.committed)
+
+    def last_undoable_run(self) -> Optional[str]:
+        """The most recent run with committed batches that have not been undone."""
+        for run in reversed(self._runs):
+            if any(batch.committed and batch.moved and not batch.undone for batch in self.batches(run)):
+                return run
+        return None
@@ -0,0 +1,98 @@
+"""
+Background thread that runs bulk moves batch by batch, with progress updates and cancel
+"""
+import queue
+import logging
+import threading
+from typing import List, Dict, NamedTuple
+
+from accounts import MailAccount
+from email_mover import move_emails
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class MoveJob(NamedTuple):
+    """UIDs of one account's folder and the category deciding where each goes."""
+    account: str
+    folder: str
+    uids: List[int]
+    category_map: Dict[int, str]
+
+class MoveUpdate(NamedTuple):
+    """Progress after one committed batch."""
+    account: str
+    folder: str
+    moved: List[int] # UIDs the server confirmed in this batch
+    done: int        # UIDs processed so far across all jobs
+    total: int       # UIDs in all jobs
+
+class MoveWorker(threading.Thread):
+    """Runs move jobs one after another on pooled connections.
+
+    Each batch confirmed by the server is put on `results` as a MoveUpdate, so the UI can
+    drop those rows right away. stop() cancels between batches; batches already sent are
+    kept (and journaled, so they can still be undone). Like IdleListener, the worker never
+    touches Streamlit session state.
+    """
+
+    def __init__(self, accounts: Dict[str, MailAccount], jobs: List[MoveJob]):
+        super().__init__(name="move-worker", daemon=True)
+        self.accounts = accounts
+        self.jobs = jobs
+        self.total = sum(len(job.uids) for job in jobs)
+        self.done = 0
+        self.moved = 0 # UIDs the server confirmed as moved
+        self.failed = False
+        self.results: "queue.Queue[MoveUpdate]" = queue.Queue()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """Cancels the move after the batch in flight; returns without waiting."""
+        self._stop_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._stop_event.is_set()
+
+    def drain(self) -> List[MoveUpdate]:
+        """Returns every update since the last call, without blocking."""
+        updates: List[MoveUpdate] = []
+        while True:
+            try:
+                updates.append(self.results.get_nowait())
+            except queue.Empty:
+                return updates
+
+    def run(self) -> None:
+        for job in self.jobs:
+            if self._stop_event.is_set():
+                break
+            account = self.accounts.get(job.account)
+            if account is None:
+                logging.error(f"No connection for account {job.account}. Skipping {len(job.uids)} email(s).")
+                self.failed = True
+                self.done += len(job.uids)
+                continue
+            job_done = 0
+
+            def report(moved: List[int], processed: int, _total: int, job: MoveJob = job) -> None:
+                nonlocal job_done
+                self.done += processed - job_done
+                job_done = processed
+                self.moved += len(moved)
+                self.results.put(MoveUpdate(job.account, job.folder, list(moved), self.done, self.total))
+
+            try:
+                with account.pool.connection() as server:
+                    moved_uids = move_emails(server, job.uids, job.category_map, source_folder=job.folder,
+                                             folders=account.folders, journal=account.move_journal,
+                                             progress_callback=report, stop_checker=self._stop_event.is_set)
+            except Exception as e:
+                logging.error(f"Error borrowing IMAP connection for {job.account}: {e}", exc_info=True)
+                moved_uids = None
+            if moved_uids is None:
+                self.failed = True
+            # UIDs skipped (no category, already there) count as processed too
+            self.done += len(job.uids) - job_done if not self._stop_event.is_set() else 0
+        logging.info(f"Move worker finished: {self.done}/{self.total} processed, "
+                     f"{'cancelled' if self.cancelled else 'failed' if self.failed else 'ok'}.")
@@ -0,0 +1,99 @@
+"""
+Opt-in parallel envelope fetching over several read-only connections borrowed from the account pool
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from imapclient import IMAPClient
+
+from connection_pool import IMAPConnectionPool
+from email_fetcher import fetch_envelopes, FETCH_PROFILE_ENVELOPE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Gmail allows at most 15 simultaneous IMAP connections per account, shared with
+# every other client the user runs, so stay well below it.
+GMAIL_CONNECTION_LIMIT = 15
+DEFAULT_MAX_CONNECTIONS = 4
+# Ranges smaller than this are not worth an extra connection
+MIN_UIDS_PER_CONNECTION = 200
+
+def parallel_fetch_enabled_by_env() -> bool:
+    """True when IMAP_PARALLEL_FETCH is set to 1/true/yes/on."""
+    return os.environ.get('IMAP_PARALLEL_FETCH', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_max_connections() -> int:
+    """Reads the connection cap from the IMAP_MAX_CONNECTIONS environment variable."""
+    value = os.environ.get('IMAP_MAX_CONNECTIONS', str(DEFAULT_MAX_CONNECTIONS))
+    try:
+        max_connections = int(value)
+    except ValueError:
+        logging.warning(f"Invalid IMAP_MAX_CONNECTIONS ('{value}'). Using {DEFAULT_MAX_CONNECTIONS}.")
+        return DEFAULT_MAX_CONNECTIONS
+    if max_connections < 1:
+        logging.warning(f"IMAP_MAX_CONNECTIONS must be at least 1 ('{value}'). Using 1.")
+        return 1
+    if max_connections > GMAIL_CONNECTION_LIMIT:
+        logging.warning(f"IMAP_MAX_CONNECTIONS ({max_connections}) exceeds Gmail's limit. Using {GMAIL_CONNECTION_LIMIT}.")
+        return GMAIL_CONNECTION_LIMIT
+    return max_connections
+
+def split_uid_ranges(uids: List[int], parts: int) -> List[List[int]]:
+    """Splits a sorted UID list into at most `parts` contiguous, similarly sized ranges."""
+    if not uids or parts < 1:
+        return []
+    size = -(-len(uids) // parts) # Ceiling division
+    return [uids[i:i + size] for i in range(0, len(uids), size)]
+
+def _fetch_range(pool: IMAPConnectionPool, folder: str, uid_range: List[int],
+                 profile: str) -> List[Dict[str, Any]]:
+    """Borrows a pooled connection and fetches one UID range with `folder` selected read-only."""
+    with pool.connection() as server:
+        server.select_folder(folder, readonly=True)
+        return fetch_envelopes(server, uid_range, profile)
+
+def fetch_envelope_ranges(pool: IMAPConnectionPool, uids: List[int], folder: str = 'INBOX',
+                          max_connections: Optional[int] = None,
+                          profile: str = FETCH_PROFILE_ENVELOPE,
+                          server: Optional[IMAPClient] = None) -> List[Dict[str, Any]]:
+    """Fetches envelopes for `uids`, split into UID ranges fetched concurrently.
+
+    Ranges run on connections borrowed from `pool`, so they reuse its logged-in
+    connections and credentials, and never exceed its size. A borrower already holding
+    a connection with `folder` selected passes it as `server` and it fetches the first
+    range itself. Ranges wait for a free pool slot when the pool is busy (e.g. with IDLE).
+
+    Raises:
+        The first error of any range; no partial result is returned.
+
+    Returns:
+        Parsed email dicts merged in ascending UID order.
+    """
+    if not uids:
+        return []
+    if max_connections is None:
+        max_connections = get_max_connections()
+
+    uids = sorted(uids)
+    # Never more ranges than the pool has slots, or ranges would wait on each other
+    parts = max(1, min(max_connections, pool.max_size, len(uids) // MIN_UIDS_PER_CONNECTION))
+    ranges = split_uid_ranges(uids, parts)
+    if len(ranges) == 1 and server is not None:
+        return fetch_envelopes(server, uids, profile)
+    logging.info(f"Fetching {len(uids)} envelopes from {folder} over {len(ranges)} connection(s).")
+
+    def fetch(index: int) -> List[Dict[str, Any]]:
+        if index == 0 and server is not None:
+            return fetch_envelopes(server, ranges[0], profile)
+        return _fetch_range(pool, folder, ranges[index], profile)
+
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="imap-fetch") as executor:
+        results = list(executor.map(fetch, range(len(ranges))))
+
+    # Ranges are contiguous and ordered, but sort anyway in case a server returns out of order
+    emails = [email for batch in results for email in batch]
+    emails.sort(key=lambda e: e['uid'])
+    logging.info(f"Parallel fetch complete: {len(emails)} envelopes.")
+    return emails
@@ -0,0 +1,385 @@
+"""
+Declarative categorization rules (rules.json) compiled into a decision table, reloaded when the file changes
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Iterable, Tuple, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from keyword_matcher import KeywordMatcher
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# How often the watcher checks the rule file's modification time
+RULES_POLL_SECONDS = 2.0
+
+# Condition operators a rule may use in "when" and "unless"
+CONDITION_OPS = ('subject_contains', 'sender_contains', 'sender_domain',
+                 'header_present', 'header_in', 'header_prefix')
+
+# Distinct hit signatures whose decision is remembered; the table is rebuilt past this
+DECISION_CACHE_SIZE = 4096
+
+class _Conditions(NamedTuple):
+    """One compiled "when" or "unless" block, as masks over the per-email hit bits."""
+    match_all: bool
+    subject_mask: int  # Bit in the subject matcher, 0 if no subject_contains
+    sender_mask: int   # Bit in the sender matcher, 0 if no sender_contains
+    domain_mask: int   # Bit in the domain table, 0 if no sender_domain
+    header_mask: int   # One bit per header operator of the block
+
+    def holds(self, subject_hits: int, sender_hits: int, domain_hits: int, header_hits: int) -> bool:
+        if self.match_all:
+            return ((not self.subject_mask or bool(subject_hits & self.subject_mask))
+                    and (not self.sender_mask or bool(sender_hits & self.sender_mask))
+                    and (not self.domain_mask or bool(domain_hits & self.domain_mask))
+                    and header_hits & self.header_mask == self.header_mask)
+        return bool(subject_hits & self.subject_mask or sender_hits & self.sender_mask
+                    or domain_hits & self.domain_mask or header_hits & self.header_mask)
+
+class _HeaderTest(NamedTuple):
+    bit: int
+    kind: str          # header_present, header_in or header_prefix
+    values: Tuple[Tuple[str, Any], ...] # (header, values) pairs; holds if any pair does
+
+class CompiledRule(NamedTuple):
+    name: str
+    category: str
+    priority: int
+    when: _Conditions
+    unless: Optional[_Conditions]
+
+def _sender_text(name: str, address: str) -> str:
+    """What sender_contains is matched against: the display name and the bare address."""
+    return name if name == address else f"{name} <{address}>"
+
+class RuleSet:
+    """Rules compiled into a decision table.
+
+    Every subject_contains / sender_contains list of every rule goes into one
+    KeywordMatcher per field, sender_domain lists into one dict keyed by domain, and
+    each header operator gets a bit tested once per email. An email thus reduces to four
+    hit bitmasks, however many rules there are. The category for a combination of hits
+    is worked out once, by trying the rules in (priority, file order) until one's "when"
+    holds and its "unless" does not, and then looked up from the table.
+
+    Rule file format (JSON; YAML too when PyYAML is installed):
+
+        {"default_category": "Uncategorised",
+         "rules": [{"name": "...", "category": "Read", "priority": 50,
+                    "match": "any",   # or "all": how the "when" operators combine
+                    "when": {"subject_contains": ["digest"], "sender_domain": ["substack.com"]},
+                    "unless": {"subject_contains": ["reminder:"]}}]}
+
+    Operators: subject_contains / sender_contains (lower-case substrings of the subject /
+    sender name or address), sender_domain (the domain of the sender address or a parent
+    domain; the 'address' field, see email_fetcher.parse_envelope), header_present
+    (header names with a non-empty value), header_in ({name: [lower-case values]}) and
+    header_prefix ({name: [lower-case prefixes]}). Header operators only hold for emails
+    fetched with headers. "unless" holds if any of its operators does.
+    """
+
+    def __init__(self, definition: Dict[str, Any], categories: Optional[Iterable[str]] = None):
+        if not isinstance(definition, dict) or not isinstance(definition.get('rules'), list):
+            raise ValueError("Rule definition must be an object with a 'rules' list.")
+        self.default_category = definition.get('default_category', 'Uncategorised')
+        known_categories = set(categories) if categories is not None else None
+
+        subject_sets: Dict[str, List[str]] = {}
+        sender_sets: Dict[str, List[str]] = {}
+        self._domains: Dict[str, int] = {}
+        self._header_tests: List[_HeaderTest] = []
+        domain_bits = 0
+        rules: List[Tuple[int, int, CompiledRule]] = []
+        for order, rule in enumerate(definition['rules']):
+            if not isinstance(rule, dict):
+                raise ValueError(f"Rule #{order + 1} is not an object.")
+            name = str(rule.get('name') or f"rule-{order + 1}")
+            category = rule.get('category')
+            if not category or (known_categories is not None and category not in known_categories):
+                raise ValueError(f"Rule '{name}' has unknown category '{category}'.")
+            match = rule.get('match', 'any')
+            if match not in ('any', 'all'):
+                raise ValueError(f"Rule '{name}': 'match' must be 'any' or 'all', not '{match}'.")
+
+            blocks: Dict[str, Optional[_Conditions]] = {}
+            for block in ('when', 'unless'):
+                spec = rule.get(block)
+                if spec is None:
+                    blocks[block] = None
+                    continue
+                if not isinstance(spec, dict) or not spec:
+                    raise ValueError(f"Rule '{name}': '{block}' must be a non-empty object.")
+                unknown = set(spec) - set(CONDITION_OPS)
+                if unknown:
+                    raise ValueError(f"Rule '{name}': unknown operator(s) {sorted(unknown)} in '{block}'.")
+                key = f"{order}.{block}"
+                if 'subject_contains' in spec:
+                    subject_sets[key] = _lower_list(spec['subject_contains'], name)
+                if 'sender_contains' in spec:
+                    sender_sets[key] = _lower_list(spec['sender_contains'], name)
+                domain_mask = 0
+                if 'sender_domain' in spec:
+                    domain_mask = 1 << domain_bits
+                    domain_bits += 1
+                    for domain in _lower_list(spec['sender_domain'], name):
+                        domain = domain.lstrip('@')
+                        self._domains[domain] = self._domains.get(domain, 0) | domain_mask
+                header_mask = 0
+                for kind in ('header_present', 'header_in', 'header_prefix'):
+                    if kind not in spec:
+                        continue
+                    if kind == 'header_present':
+                        values = tuple((header, None) for header in _lower_list(spec[kind], name))
+                    else:
+                        values = tuple((header.lower(), tuple(_lower_list(listed, name)))
+                                       for header, listed in _header_map(spec[kind], name))
+                    bit = 1 << len(self._header_tests)
+                    self._header_tests.append(_HeaderTest(bit, kind, values))
+                    header_mask |= bit
+                blocks[block] = _Conditions(
+                    match_all=(block == 'when' and match == 'all'),
+                    subject_mask=0, # Set by _bind once the matchers are built
+                    sender_mask=0,
+                    domain_mask=domain_mask,
+                    header_mask=header_mask,
+                )
+            if blocks['when'] is None:
+                raise ValueError(f"Rule '{name}' has no 'when' conditions.")
+            priority = int(rule.get('priority', 100))
+            rules.append((priority, order, CompiledRule(name, category, priority, blocks['when'], blocks['unless'])))
+
+        self.subject_matcher = KeywordMatcher(subject_sets)
+        self.sender_matcher = KeywordMatcher(sender_sets)
+        # Keyword masks are known only once the matchers are built
+        self.rules: List[CompiledRule] = []
+        for _priority, order, rule in sorted(rules, key=lambda item: item[:2]):
+            self.rules.append(rule._replace(
+                when=self._bind(rule.when, f"{order}.when"),
+                unless=self._bind(rule.unless, f"{order}.unless") if rule.unless else None,
+            ))
+        self._decisions: Dict[Tuple[int, int, int, int], str] = {}
+
+    def _bind(self, conditions: _Conditions, key: str) -> _Conditions:
+        return conditions._replace(
+            subject_mask=self.subject_matcher.bits.get(key, 0),
+            sender_mask=self.sender_matcher.bits.get(key, 0),
+        )
+
+    def _domain_hits(self, address: str) -> int:
+        """Domain bits for the sender address' domain and each of its parent domains."""
+        if not self._domains or '@' not in address:
+            return 0
+        domain = address.rsplit('@', 1)[1].strip().rstrip('>').strip()
+        hits = 0
+        while domain:
+            hits |= self._domains.get(domain, 0)
+            domain = domain.partition('.')[2]
+        return hits
+
+    def _header_hits(self, headers: Dict[str, str]) -> int:
+        hits = 0
+        for test in self._header_tests:
+            for header, values in test.values:
+                value = headers.get(header)
+                if not value:
+                    continue
+                if (test.kind == 'header_present'
+                        or (test.kind == 'header_in' and value.lower() in values)
+                        or (test.kind == 'header_prefix' and value.lower().startswith(values))):
+                    hits |= test.bit
+                    break
+        return hits
+
+    def _first_rule(self, hits: Tuple[int, int, int, int]) -> Optional[CompiledRule]:
+        for rule in self.rules:
+            if rule.when.holds(*hits) and not (rule.unless and rule.unless.holds(*hits)):
+                return rule
+        return None
+
+    def _decide(self, hits: Tuple[int, int, int, int]) -> str:
+        rule = self._first_rule(hits)
+        return rule.category if rule else self.default_category
+
+    def _hits(self, email_data: Dict[str, Any]) -> Tuple[int, int, int, int]:
+        name = email_data.get('from', '').lower()
+        # Envelopes cached before 'address' existed only have 'from'
+        address = (email_data.get('address') or name).lower()
+        headers = email_data.get('headers')
+        return (
+            self.subject_matcher.scan(email_data.get('subject', '').lower()),
+            self.sender_matcher.scan(_sender_text(name, address)),
+            self._domain_hits(address),
+            self._header_hits(headers) if headers and self._header_tests else 0,
+        )
+
+    def categorize(self, email_data: Dict[str, Any]) -> str:
+        """Category of the first matching rule, or the default category."""
+        hits = self._hits(email_data)
+        category = self._decisions.get(hits)
+        if category is None:
+            if len(self._decisions) >= DECISION_CACHE_SIZE:
+                self._decisions = {}
+            category = self._decisions[hits] = self._decide(hits)
+        return category
+
+    def header_category(self, email_data: Dict[str, Any]) -> Optional[str]:
+        """Category of the first matching rule if that rule tests headers, else None.
+
+        None means the headers are missing or do not decide the email (e.g. a rule ahead
+        of the header rules, such as new invitations, matched first).
+        """
+        if not email_data.get('headers') or not self._header_tests:
+            return None
+        rule = self._first_rule(self._hits(email_data))
+        return rule.category if rule and rule.when.header_mask else None
+
+    def categorize_frame(self, df: pd.DataFrame) -> pd.Series:
+        """Vectorized categorize() over the 'subject', 'from' and 'address' columns of a DataFrame.
+
+        Keyword sets become one str.contains per set over the distinct subjects/senders,
+        and rule precedence is an np.select over the rules' boolean columns, so labels are
+        identical to categorize() row by row. The 'address' column may be missing or empty
+        (envelopes cached before it existed); 'from' stands in for it then. A 'headers'
+        column of dicts, if present, is tested per row (only emails fetched with headers
+        have one).
+
+        Returns:
+            A Series of categories aligned with df.index.
+        """
+        if df.empty or not self.rules:
+            return pd.Series(self.default_category, index=df.index, dtype=object)
+        subject_codes, subjects = pd.factorize(df['subject'].fillna('').astype(str).str.lower())
+        # Senders repeat, so name/address text work is done once per distinct pair
+        name_codes, names = pd.factorize(df['from'].fillna('').astype(str))
+        addresses: Any = ['']
+        address_codes = np.zeros(len(df), dtype=np.int64)
+        if 'address' in df:
+            address_codes, addresses = pd.factorize(df['address'].fillna('').astype(str))
+        sender_codes, pairs = pd.factorize(name_codes.astype(np.int64) * len(addresses) + address_codes)
+        pair_names = [names[pair // len(addresses)].lower() for pair in pairs]
+        pair_addresses = [(addresses[pair % len(addresses)] or name).lower()
+                          for pair, name in zip(pairs, pair_names)]
+        senders = [_sender_text(name, address) for name, address in zip(pair_names, pair_addresses)]
+
+        keyword_hits: Dict[Tuple[str, int], np.ndarray] = {}
+        for field, codes, distinct, matcher in (('subject', subject_codes, subjects, self.subject_matcher),
+                                                ('from', sender_codes, senders, self.sender_matcher)):
+            distinct = pd.Series(distinct, dtype=object)
+            for name, bit in matcher.bits.items():
+                pattern = matcher.set_pattern(name)
+                if pattern is None:
+                    keyword_hits[(field, bit)] = np.zeros(len(df), dtype=bool)
+                else:
+                    keyword_hits[(field, bit)] = distinct.str.contains(pattern, regex=True).to_numpy(dtype=bool)[codes]
+
+        domain_hits = np.zeros(len(df), dtype=np.int64)
+        if self._domains:
+            domain_hits = np.array([self._domain_hits(address) for address in pair_addresses],
+                                   dtype=np.int64)[sender_codes]
+        header_hits = np.zeros(len(df), dtype=np.int64)
+        if 'headers' in df and self._header_tests:
+            header_hits = df['headers'].map(
+                lambda headers: self._header_hits(headers) if isinstance(headers, dict) and headers else 0
+            ).to_numpy(dtype=np.int64)
+
+        def holds(conditions: _Conditions) -> np.ndarray:
+            parts = []
+            if conditions.subject_mask:
+                parts.append(keyword_hits[('subject', conditions.subject_mask)])
+            if conditions.sender_mask:
+                parts.append(keyword_hits[('from', conditions.sender_mask)])
+            if conditions.domain_mask:
+                parts.append(domain_hits & conditions.domain_mask != 0)
+            if conditions.header_mask:
+                if conditions.match_all:
+                    parts.append(header_hits & conditions.header_mask == conditions.header_mask)
+                else:
+                    parts.append(header_hits & conditions.header_mask != 0)
+            if conditions.match_all:
+                return np.logical_and.reduce(parts)
+            return np.logical_or.reduce(parts)
+
+        matched = []
+        for rule in self.rules:
+            rule_holds = holds(rule.when)
+            if rule.unless:
+                rule_holds = rule_holds & ~holds(rule.unless)
+            matched.append(rule_holds)
+        categories = np.select(matched, [np.array(rule.category, dtype=object) for rule in self.rules],
+                               default=np.array(self.default_category, dtype=object))
+        return pd.Series(categories, index=df.index, dtype=object)
+
+def _lower_list(values: Any, rule_name: str) -> List[str]:
+    if isinstance(values, str) or not isinstance(values, list):
+        raise ValueError(f"Rule '{rule_name}': expected a list of strings, got {values!r}.")
+    return [str(value).lower() for value in values]
+
+def _header_map(spec: Any, rule_name: str) -> List[Tuple[str, Any]]:
+    if not isinstance(spec, dict):
+        raise ValueError(f"Rule '{rule_name}': header conditions must map header names to lists.")
+    return list(spec.items())
+
+def load_rule_file(path: str) -> Dict[str, Any]:
+    """Reads a JSON rule file (or YAML, when PyYAML is installed)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"Install PyYAML to use the YAML rule file {path}, or convert it to JSON.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+class RulesWatcher(threading.Thread):
+    """Keeps a RuleSet compiled from a rule file and recompiles it when the file changes.
+
+    The file's modification time is polled every `interval` seconds on this thread; a
+    changed file is loaded and compiled here, then swapped in as `rules` in one assignment,
+    so categorizing threads never see a half-built table. A missing or invalid file keeps
+    the previous rules (the `fallback` definition at startup) and logs why.
+    """
+
+    def __init__(self, path: str, fallback: Dict[str, Any], categories: Optional[Iterable[str]] = None,
+                 interval: float = RULES_POLL_SECONDS):
+        super().__init__(name="rules-watcher", daemon=True)
+        self.path = path
+        self.categories = list(categories) if categories is not None else None
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._stamp: Optional[Tuple[int, int]] = None # (mtime_ns, size) of the loaded file
+        self.rules = RuleSet(fallback, self.categories)
+        self.reload()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def reload(self) -> bool:
+        """Recompiles the rule file if it changed since the last load. Returns True if it did."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            if self._stamp is not None:
+                logging.warning(f"Rule file {self.path} is gone. Keeping the current rules.")
+                self._stamp = None
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            rules = RuleSet(load_rule_file(self.path), self.categories)
+        except Exception as e:
+            logging.error(f"Invalid rule file {self.path}: {e} Keeping the current rules.")
+            return False
+        self.rules = rules
+        logging.info(f"Loaded {len(rules.rules)} categorization rules from {self.path}.")
+        return True
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.reload()
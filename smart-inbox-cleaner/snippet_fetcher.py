@@ -0,0 +1,177 @@
+"""
+Partial body snippet fetching for LLM context, backed by a persistent snippet cache
+"""
+import os
+import re
+import html
+import base64
+import quopri
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+from imapclient import IMAPClient
+
+from mail_cache import SnippetCache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Bytes of the text part downloaded per message (BODY.PEEK[n]<0.N>)
+DEFAULT_SNIPPET_BYTES = 1024
+# Number of UIDs per BODYSTRUCTURE/partial FETCH command
+SNIPPET_CHUNK_SIZE = 200
+
+_HTML_DROP_RE = re.compile(r'<(style|script|head)[^>]*>.*?(</\1>|$)', re.IGNORECASE | re.DOTALL)
+_HTML_TAG_RE = re.compile(r'<[^>]*>?')
+_QP_PARTIAL_ESCAPE_RE = re.compile(rb'=[0-9A-Fa-f]?$')
+
+def get_snippet_bytes() -> int:
+    """Reads the per-message byte cap from the SNIPPET_MAX_BYTES environment variable."""
+    value = os.environ.get('SNIPPET_MAX_BYTES', str(DEFAULT_SNIPPET_BYTES))
+    try:
+        max_bytes = int(value)
+        if max_bytes > 0:
+            return max_bytes
+    except ValueError:
+        pass
+    logging.warning(f"Invalid SNIPPET_MAX_BYTES ('{value}'). Using {DEFAULT_SNIPPET_BYTES}.")
+    return DEFAULT_SNIPPET_BYTES
+
+def _to_str(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode('ascii', errors='replace')
+    return str(value) if value is not None else ''
+
+def _part_info(part) -> Tuple[str, str, str, str]:
+    """Returns (type, subtype, encoding, charset) for a single-part BODYSTRUCTURE entry."""
+    main_type, sub_type = _to_str(part[0]).lower(), _to_str(part[1]).lower()
+    charset = 'utf-8'
+    params = part[2] or ()
+    for i in range(0, len(params) - 1, 2):
+        if _to_str(params[i]).lower() == 'charset':
+            charset = _to_str(params[i + 1]) or 'utf-8'
+    encoding = _to_str(part[5]).lower() if len(part) > 5 else '7bit'
+    return main_type, sub_type, encoding, charset
+
+def find_text_part(bodystructure, prefix: str = '') -> Optional[Tuple[str, str, str, str]]:
+    """Locates the first text/plain part (falling back to text/html) in a BODYSTRUCTURE.
+
+    Returns:
+        (section, subtype, encoding, charset), e.g. ('1.1', 'plain', 'quoted-printable', 'utf-8'),
+        or None if the message has no text part.
+    """
+    if bodystructure.is_multipart:
+        html_match = None
+        for index, part in enumerate(bodystructure[0], start=1):
+            section = f"{prefix}{index}"
+            if part.is_multipart:
+                found = find_text_part(part, f"{section}.")
+            else:
+                main_type, sub_type, encoding, charset = _part_info(part)
+                found = (section, sub_type, encoding, charset) if main_type == 'text' else None
+            if found and found[1] == 'plain':
+                return found
+            if found and html_match is None:
+                html_match = found
+        return html_match
+
+    main_type, sub_type, encoding, charset = _part_info(bodystructure)
+    if main_type != 'text':
+        return None
+    # A single-part message body is addressed as section 1
+    return '1', sub_type, encoding, charset
+
+def decode_snippet(raw: bytes, subtype: str, encoding: str, charset: str) -> str:
+    """Decodes a possibly truncated body prefix into normalized plain text."""
+    if not raw:
+        return ''
+    if encoding == 'base64':
+        compact = re.sub(rb'\s+', b'', raw)
+        compact = compact[:len(compact) - len(compact) % 4] # Drop the cut-off quantum
+        try:
+            raw = base64.b64decode(compact)
+        except Exception:
+            return ''
+    elif encoding == 'quoted-printable':
+        raw = quopri.decodestring(_QP_PARTIAL_ESCAPE_RE.sub(b'', raw))
+    try:
+        text = raw.decode(charset, errors='replace')
+    except LookupError:
+        text = raw.decode('utf-8', errors='replace')
+    text = text.rstrip('\ufffd') # A multi-byte character cut off by the byte cap
+    if subtype == 'html':
+        text = html.unescape(_HTML_TAG_RE.sub(' ', _HTML_DROP_RE.sub(' ', text)))
+    return ' '.join(text.split())
+
+def _find_section_data(data: Dict[bytes, Any], section: str) -> Optional[bytes]:
+    """Returns the BODY[section]<0> payload from a FETCH response."""
+    prefix = f"BODY[{section}]".encode('ascii')
+    for key, value in data.items():
+        if isinstance(key, bytes) and key.upper().startswith(prefix):
+            return value
+    return None
+
+def fetch_snippets(server: IMAPClient, emails: List[Dict[str, Any]], cache: SnippetCache,
+                   folder: str = 'INBOX', max_bytes: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Adds a 'snippet' key to each email with the start of its text body.
+
+    Cached snippets are reused; for the rest, one BODYSTRUCTURE fetch locates the text part and
+    one partial fetch per distinct section downloads at most max_bytes of it. Errors are logged
+    and leave the affected emails without a snippet.
+
+    Args:
+        server: Connected IMAPClient instance.
+        emails: Email dicts from the fetcher (modified in place).
+        cache: Snippet cache keyed by folder, UIDVALIDITY and UID.
+        folder: Folder the UIDs belong to.
+        max_bytes: Per-message byte cap; defaults to SNIPPET_MAX_BYTES from the environment.
+    """
+    if not emails:
+        return emails
+    if max_bytes is None:
+        max_bytes = get_snippet_bytes()
+
+    try:
+        status = server.select_folder(folder, readonly=True)
+        uidvalidity = status.get(b'UIDVALIDITY')
+
+        missing: List[int] = []
+        for email in emails:
+            snippet = cache.get(folder, uidvalidity, email['uid'])
+            if snippet is None:
+                missing.append(email['uid'])
+            else:
+                email['snippet'] = snippet
+        if not missing:
+            return emails
+        logging.info(f"Fetching body snippets for {len(missing)} emails ({len(emails) - len(missing)} cached).")
+
+        fetched: Dict[int, str] = {}
+        for start in range(0, len(missing), SNIPPET_CHUNK_SIZE):
+            chunk = missing[start:start + SNIPPET_CHUNK_SIZE]
+            # Group UIDs by the section holding their text so each group is one partial FETCH
+            by_section: Dict[str, List[int]] = {}
+            parts: Dict[int, Tuple[str, str, str, str]] = {}
+            for uid, data in server.fetch(chunk, ['BODYSTRUCTURE']).items():
+                part = find_text_part(data[b'BODYSTRUCTURE']) if b'BODYSTRUCTURE' in data else None
+                if part:
+                    parts[uid] = part
+                    by_section.setdefault(part[0], []).append(uid)
+                else:
+                    fetched[uid] = ''
+            for section, uids in by_section.items():
+                response = server.fetch(uids, [f"BODY.PEEK[{section}]<0.{max_bytes}>"])
+                for uid, data in response.items():
+                    if uid not in parts:
+                        continue
+                    _, subtype, encoding, charset = parts[uid]
+                    fetched[uid] = decode_snippet(_find_section_data(data, section) or b'',
+                                                  subtype, encoding, charset)
+
+        for email in emails:
+            if email['uid'] in fetched:
+                email['snippet'] = fetched[email['uid']]
+                cache.put(folder, uidvalidity, email['uid'], fetched[email['uid']])
+        cache.save()
+    except Exception as e:
+        logging.error(f"Error fetching body snippets: {e}", exc_info=True)
+    return emails
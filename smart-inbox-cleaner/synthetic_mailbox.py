@@ -0,0 +1,181 @@
+"""
+Deterministic synthetic mailboxes (1k to 1M+ messages) for benchmarking against the IMAP stand-in server
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from email.utils import format_datetime, formataddr
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Messages are generated on demand from (seed, message id); only this many are kept built
+MESSAGE_CACHE_SIZE = 50000
+
+# (display name, address, kind)
+SENDERS: List[Tuple[str, str, str]] = [
+    ("Alice Martin", "alice.martin@example.com", "person"),
+    ("Bob Nguyen", "bob@contoso.example", "person"),
+    ("Chloé Dubois", "chloe.dubois@example.fr", "person"),
+    ("Jürgen Müller", "juergen@example.de", "person"),
+    ("田中 太郎", "tanaka@example.jp", "person"),
+    ("Priya Sharma", "priya@example.in", "person"),
+    ("The Weekly Digest", "digest@news.example.com", "newsletter"),
+    ("Product Updates", "updates@saas.example.io", "newsletter"),
+    ("Medium Daily", "noreply@medium.com", "newsletter"),
+    ("Tech Newsletter", "hello@technews.example", "newsletter"),
+    ("GitHub", "notifications@github.com", "notification"),
+    ("Jira", "jira@company.atlassian.net", "notification"),
+    ("Bank Alerts", "alerts@bank.example", "notification"),
+    ("Google Calendar", "calendar-notification@google.com", "calendar"),
+    ("Zoom", "no-reply@zoom.us", "calendar"),
+]
+
+SUBJECTS: Dict[str, List[str]] = {
+    "person": [
+        "Can you review the {topic} doc?",
+        "Re: {topic} follow-up",
+        "Quick question about {topic}",
+        "Action required: {topic} sign-off by Friday",
+        "Fwd: {topic} numbers",
+        "Café catch-up about {topic}? ☕",
+        "Überblick: {topic}",
+    ],
+    "newsletter": [
+        "This week in {topic}",
+        "{topic}: 10 things you missed",
+        "Your {topic} digest 📰",
+        "New features in {topic}",
+    ],
+    "notification": [
+        "[{topic}] New comment on issue #{number}",
+        "Your statement for {topic} is ready",
+        "[{topic}] Build #{number} failed",
+        "Password reset requested",
+    ],
+    "calendar": [
+        "Invitation: {topic} sync @ Tue 10am",
+        "Updated invitation: {topic} review",
+        "Accepted: {topic} planning",
+        "Meeting reminder: {topic}",
+    ],
+}
+
+TOPICS = ["Q3 roadmap", "budget", "onboarding", "release 2.4", "hiring plan", "design system",
+          "infra costs", "customer feedback", "security audit", "offsite", "日本 launch", "data migration"]
+
+BODY_LINES = [
+    "Hi there,",
+    "Please take a look when you get a chance.",
+    "Let me know if you have any questions.",
+    "Here is a summary of the latest changes.",
+    "You are receiving this email because you subscribed.",
+    "Thanks,",
+]
+
+class SyntheticMessage(NamedTuple):
+    msg_id: int
+    date: datetime
+    subject: str       # Raw header value, RFC 2047 encoded when non-ASCII
+    from_name: str
+    from_addr: str
+    to_addr: str
+    message_id: str
+    headers: Dict[str, str] # Extra headers (List-Id, Precedence, Auto-Submitted, ...)
+    body: str
+    flags: Tuple[str, ...]
+
+def encode_header_text(text: str) -> str:
+    """Returns `text` unchanged if ASCII, otherwise as RFC 2047 encoded words."""
+    try:
+        text.encode('ascii')
+        return text
+    except UnicodeEncodeError:
+        return Header(text, 'utf-8').encode()
+
+class SyntheticMailbox:
+    """A reproducible mailbox of `count` messages, built lazily.
+
+    Message ids run from 1 to `count` in date order, spread evenly over the `days`
+    ending at `end`. The same seed always produces the same mailbox, so benchmarks are
+    comparable across runs. deliver() adds new messages dated "now".
+    """
+
+    def __init__(self, count: int = 1000, seed: int = 0, days: int = 365,
+                 user: str = "user@example.com", end: Optional[datetime] = None):
+        self.count = count
+        self.seed = seed
+        self.days = days
+        self.user = user
+        self.end = end or datetime.now(timezone.utc).replace(microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        # Spacing of the generated messages, fixed here so deliver() never moves their dates
+        self._step = (self.end - self.start) / max(count, 1)
+        self._delivered: Dict[int, datetime] = {} # Dates of messages added after construction
+        self.message = lru_cache(maxsize=MESSAGE_CACHE_SIZE)(self._build_message)
+
+    def date_of(self, msg_id: int) -> datetime:
+        """Date of a message; non-decreasing in msg_id."""
+        if msg_id in self._delivered:
+            return self._delivered[msg_id]
+        return self.start + self._step * msg_id
+
+    def deliver(self) -> int:
+        """Adds a new message dated now and returns its id."""
+        self.count += 1
+        self._delivered[self.count] = max(datetime.now(timezone.utc).replace(microsecond=0),
+                                          self.date_of(self.count - 1))
+        return self.count
+
+    def _build_message(self, msg_id: int) -> SyntheticMessage:
+        rng = random.Random(self.seed * 1_000_003 + msg_id)
+        name, address, kind = rng.choice(SENDERS)
+        subject = rng.choice(SUBJECTS[kind]).format(topic=rng.choice(TOPICS), number=rng.randint(1, 9999))
+        headers: Dict[str, str] = {}
+        if kind == "newsletter":
+            list_name = address.split('@')[1]
+            headers['List-Id'] = f"<{list_name.replace('.', '-')}.list>"
+            headers['List-Unsubscribe'] = f"<mailto:unsubscribe@{list_name}>"
+            headers['Precedence'] = "bulk"
+        elif kind == "notification":
+            headers['Auto-Submitted'] = "auto-generated"
+        body = "\r\n".join(rng.sample(BODY_LINES, k=rng.randint(2, len(BODY_LINES))))
+        # Older mail is mostly read; recent mail mostly unread
+        read_probability = 0.95 if msg_id < self.count * 0.9 else 0.4
+        flags = ('\\Seen',) if rng.random() < read_probability else ()
+        return SyntheticMessage(
+            msg_id=msg_id,
+            date=self.date_of(msg_id),
+            subject=encode_header_text(subject),
+            from_name=name,
+            from_addr=address,
+            to_addr=self.user,
+            message_id=f"<synthetic.{self.seed}.{msg_id}@example.invalid>",
+            headers=headers,
+            body=body + "\r\n",
+            flags=flags,
+        )
+
+    def header_block(self, message: SyntheticMessage) -> bytes:
+        """Full RFC 5322 header block (ending with the blank line)."""
+        lines = [
+            f"Date: {format_datetime(message.date)}",
+            f"From: {formataddr((encode_header_text(message.from_name), message.from_addr))}",
+            f"To: {message.to_addr}",
+            f"Subject: {message.subject}",
+            f"Message-ID: {message.message_id}",
+            "MIME-Version: 1.0",
+            "Content-Type: text/plain; charset=utf-8",
+            "Content-Transfer-Encoding: 8bit",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in message.headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('utf-8')
+
+    def header_fields(self, message: SyntheticMessage, names: List[str]) -> bytes:
+        """HEADER.FIELDS subset of the header block, as an IMAP server returns it."""
+        wanted = {name.lower() for name in names}
+        lines = [line for line in self.header_block(message).decode('utf-8').split("\r\n")
+                 if line and line.split(':', 1)[0].lower() in wanted]
+        return ("".join(f"{line}\r\n" for line in lines) + "\r\n").encode('utf-8')
+
+    def rfc822(self, message: SyntheticMessage) -> bytes:
+        return self.header_block(message) + message.body.encode('utf-8')